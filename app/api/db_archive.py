@@ -0,0 +1,310 @@
+"""
+Visit Archive
+Moves exited visits older than the hot window out of data/smart_gate.db into one
+SQLite file per month (data/archive/visits_YYYY_MM.db), so the live visits table
+only holds recent traffic. History and report queries read the hot table plus the
+partitions the catalog (visit_archives / visit_archive_index) says are relevant.
+Each partition carries its own visits_fts index, so free-text search covers them too.
+
+Dashboard counters keep covering the whole history: archived rows are subtracted
+from visits by the delete triggers but put back from a snapshot in the same transaction.
+Likewise the tombstones the move leaves in visit_deletions are marked archived, so change
+feeds (since_version listings, other processes' occupancy sync) don't report deletions.
+"""
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .db_sqlite import (
+    DB_PATH,
+    VISIT_SEARCH_SCHEMA,
+    _to_ms,
+    _with_display_times,
+    db_cursor,
+    db_transaction,
+    get_thread_connection,
+    get_visits_between,
+    get_visits_by_vehicle,
+    search_match,
+    search_visit_rows,
+    search_visits,
+)
+
+ARCHIVE_DIR = os.getenv("SMART_GATE_ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "archive"))
+# Exited visits that entered more than this many days ago are archived
+HOT_WINDOW_DAYS = int(os.getenv("SMART_GATE_HOT_DAYS", "90"))
+
+ALIAS = "archive"
+
+
+def partition_path(partition: str) -> str:
+    """'2026_09' -> data/archive/visits_2026_09.db"""
+    return os.path.join(ARCHIVE_DIR, f"visits_{partition}.db")
+
+
+def _month_bounds(partition: str) -> Tuple[int, int]:
+    """Local-time month 'YYYY_MM' -> [start, end) in epoch ms."""
+    year, month = (int(part) for part in partition.split("_"))
+    start = datetime(year, month, 1)
+    end = datetime(year + (month == 12), month % 12 + 1, 1)
+    return _to_ms(start), _to_ms(end)
+
+
+@contextmanager
+def _attached(partition: str) -> Iterator[Any]:
+    """Attaches a partition file to this thread's connection as 'archive' for the duration."""
+    conn = get_thread_connection()
+    conn.execute(f"ATTACH DATABASE ? AS {ALIAS}", (partition_path(partition),))
+    try:
+        yield conn
+    finally:
+        conn.execute(f"DETACH DATABASE {ALIAS}")
+
+
+def _ensure_partition_schema(cursor) -> List[str]:
+    """Creates archive.visits like the live table (and adds columns added since). Returns the column list."""
+    cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'visits'")
+    create_sql = re.sub(r"^CREATE TABLE\s+\"?visits\"?", f"CREATE TABLE IF NOT EXISTS {ALIAS}.visits",
+                        cursor.fetchone()[0], count=1)
+    cursor.execute(create_sql)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {ALIAS}.idx_archive_vehicle ON visits(vehicle_no, in_time)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {ALIAS}.idx_archive_in_ts ON visits(in_ts)")
+
+    cursor.execute("PRAGMA main.table_info(visits)")
+    columns = [(row[1], row[2], row[4]) for row in cursor.fetchall()]
+    cursor.execute(f"PRAGMA {ALIAS}.table_info(visits)")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, col_type, default in columns:
+        if name not in existing:
+            default_sql = f" DEFAULT {default}" if default is not None else ""
+            cursor.execute(f"ALTER TABLE {ALIAS}.visits ADD COLUMN {name} {col_type}{default_sql}")
+    _ensure_partition_search(cursor)
+    return [name for name, _, _ in columns]
+
+
+def _ensure_partition_search(cursor) -> None:
+    """Gives archive.visits the live table's visits_fts index and sync triggers, filled from its rows."""
+    cursor.execute(f"SELECT 1 FROM {ALIAS}.sqlite_master WHERE name = 'visits_fts'")
+    if cursor.fetchone():
+        return
+    for statement in VISIT_SEARCH_SCHEMA:
+        cursor.execute(statement.replace("IF NOT EXISTS ", f"IF NOT EXISTS {ALIAS}.", 1))
+    cursor.execute(f"INSERT INTO {ALIAS}.visits_fts (visits_fts) VALUES ('rebuild')")
+
+
+def _archive_partition(partition: str, cutoff_ms: int) -> int:
+    """Moves one month of exited visits (entered before cutoff_ms) into its partition file."""
+    start_ms, end_ms = _month_bounds(partition)
+    end_ms = min(end_ms, cutoff_ms)
+
+    with _attached(partition):
+        # 1) Copy: writes only the archive file. Re-copying after an interrupted run is harmless;
+        #    stale copies are deleted first rather than REPLACEd, so the search triggers see it.
+        with db_transaction() as cursor:
+            columns = ", ".join(_ensure_partition_schema(cursor))
+            cursor.execute(f'''
+                DELETE FROM {ALIAS}.visits WHERE id IN (
+                    SELECT id FROM main.visits WHERE in_ts >= ? AND in_ts < ? AND status = 'exited'
+                )
+            ''', (start_ms, end_ms))
+            cursor.execute(f'''
+                INSERT INTO {ALIAS}.visits ({columns})
+                SELECT {columns} FROM main.visits
+                WHERE in_ts >= ? AND in_ts < ? AND status = 'exited'
+            ''', (start_ms, end_ms))
+
+        # 2) Remove from the hot table only rows whose archived copy is current (same
+        #    row_version), so an edit made between the two steps is never lost.
+        with db_transaction(immediate=True) as cursor:
+            cursor.execute(f'''
+                CREATE TEMP TABLE archive_batch AS
+                SELECT v.id, v.vehicle_no, v.in_time, v.in_ts, v.visitor_type FROM main.visits v
+                JOIN {ALIAS}.visits a ON a.id = v.id AND a.row_version IS v.row_version
+                WHERE v.in_ts >= ? AND v.in_ts < ? AND v.status = 'exited'
+            ''', (start_ms, end_ms))
+            cursor.execute("SELECT COUNT(*), MIN(in_ts), MAX(in_ts) FROM temp.archive_batch")
+            moved, min_ts, max_ts = cursor.fetchone()
+
+            if moved:
+                # Counters describe the whole history: snapshot them, delete, put them back
+                cursor.execute("CREATE TEMP TABLE archive_stats AS SELECT * FROM main.visit_stats")
+                cursor.execute('''
+                    CREATE TEMP TABLE archive_vehicles AS SELECT * FROM main.vehicles
+                    WHERE vehicle_no IN (SELECT vehicle_no FROM temp.archive_batch)
+                ''')
+                cursor.execute("DELETE FROM main.visits WHERE id IN (SELECT id FROM temp.archive_batch)")
+                # The delete left tombstones; mark them so change feeds don't report deletions
+                cursor.execute('''
+                    UPDATE main.visit_deletions SET archived = 1
+                    WHERE visit_id IN (SELECT id FROM temp.archive_batch)
+                ''')
+                cursor.execute("DELETE FROM main.visit_stats")
+                cursor.execute("INSERT INTO main.visit_stats SELECT * FROM temp.archive_stats")
+                cursor.execute("INSERT OR REPLACE INTO main.vehicles SELECT * FROM temp.archive_vehicles")
+
+                cursor.execute('''
+                    INSERT INTO visit_archive_index (vehicle_no, partition, visit_count, first_seen, last_seen)
+                    SELECT vehicle_no, ?, COUNT(*), MIN(in_time), MAX(in_time)
+                    FROM temp.archive_batch GROUP BY vehicle_no
+                    ON CONFLICT (vehicle_no, partition) DO UPDATE SET
+                        visit_count = visit_count + excluded.visit_count,
+                        first_seen = MIN(first_seen, excluded.first_seen),
+                        last_seen = MAX(last_seen, excluded.last_seen)
+                ''', (partition,))
+                cursor.execute('''
+                    INSERT INTO visit_archive_stats (key, value)
+                    SELECT 'total', COUNT(*) FROM temp.archive_batch
+                    UNION ALL
+                    SELECT 'type:' || COALESCE(visitor_type, ''), COUNT(*) FROM temp.archive_batch GROUP BY 1
+                    ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+                ''')
+                cursor.execute('''
+                    INSERT INTO visit_archives (partition, row_count, min_ts, max_ts, archived_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (partition) DO UPDATE SET
+                        row_count = row_count + excluded.row_count,
+                        min_ts = MIN(min_ts, excluded.min_ts),
+                        max_ts = MAX(max_ts, excluded.max_ts),
+                        archived_at = excluded.archived_at
+                ''', (partition, moved, min_ts, max_ts, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+                cursor.execute("DROP TABLE temp.archive_stats")
+                cursor.execute("DROP TABLE temp.archive_vehicles")
+            cursor.execute("DROP TABLE temp.archive_batch")
+    return moved
+
+
+def archive_old_visits(older_than_days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Moves exited visits that entered more than older_than_days (default HOT_WINDOW_DAYS)
+    ago into monthly partition files. Safe to re-run; open visits are never archived.
+    Returns {"archived": total rows moved, "partitions": {partition: rows}}.
+    """
+    days = HOT_WINDOW_DAYS if older_than_days is None else older_than_days
+    cutoff_ms = _to_ms(datetime.now() - timedelta(days=days))
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT DISTINCT strftime('%Y_%m', in_ts / 1000, 'unixepoch', 'localtime')
+            FROM visits WHERE in_ts < ? AND status = 'exited'
+        ''', (cutoff_ms,))
+        partitions = sorted(row[0] for row in cursor.fetchall())
+
+    moved = {}
+    for partition in partitions:
+        moved[partition] = _archive_partition(partition, cutoff_ms)
+        print(f"[ARCHIVE] {moved[partition]} visits -> {partition_path(partition)}")
+    return {"archived": sum(moved.values()), "partitions": moved}
+
+
+def get_archive_partitions() -> List[Dict[str, Any]]:
+    """Lists the archive partitions, newest first."""
+    with db_cursor() as cursor:
+        cursor.execute("SELECT * FROM visit_archives ORDER BY partition DESC")
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def _read_partition(partition: str, sql: str, params: Tuple[Any, ...]) -> List[Dict[str, Any]]:
+    if not os.path.exists(partition_path(partition)):
+        print(f"[WARN] Archive partition missing: {partition_path(partition)}")
+        return []
+    with _attached(partition) as conn:
+        return [dict(row) for row in conn.execute(sql.replace("{visits}", f"{ALIAS}.visits"), params).fetchall()]
+
+
+def _merge(hot: List[Dict[str, Any]], archived: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Hot rows win over archived copies of the same visit (left behind by an interrupted move)."""
+    hot_ids = {row["id"] for row in hot}
+    return hot + [_with_display_times(row) for row in archived if row["id"] not in hot_ids]
+
+
+def get_vehicle_history(vehicle_no: str) -> List[Dict[str, Any]]:
+    """Full visit history of a vehicle across the hot table and its archive partitions, newest first."""
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT partition FROM visit_archive_index WHERE vehicle_no = ? ORDER BY partition DESC
+        ''', (vehicle_no,))
+        partitions = [row[0] for row in cursor.fetchall()]
+
+    archived: List[Dict[str, Any]] = []
+    for partition in partitions:
+        archived += _read_partition(partition, "SELECT * FROM {visits} WHERE vehicle_no = ? ORDER BY in_time DESC",
+                                    (vehicle_no,))
+    rows = _merge(get_visits_by_vehicle(vehicle_no), archived)
+    return sorted(rows, key=lambda row: row.get("in_time") or "", reverse=True)
+
+
+def get_visit_report(
+        start: Union[datetime, int],
+        end: Union[datetime, int],
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+    """Visits that entered in [start, end) from the hot table and overlapping partitions, oldest first."""
+    start_ms, end_ms = _to_ms(start), _to_ms(end)
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT partition FROM visit_archives WHERE max_ts >= ? AND min_ts < ? ORDER BY partition
+        ''', (start_ms, end_ms))
+        partitions = [row[0] for row in cursor.fetchall()]
+
+    sql = "SELECT * FROM {visits} WHERE in_ts >= ? AND in_ts < ? ORDER BY in_ts"
+    params: Tuple[Any, ...] = (start_ms, end_ms)
+    if limit is not None:
+        sql += " LIMIT ?"
+        params += (limit,)
+
+    archived: List[Dict[str, Any]] = []
+    for partition in partitions:
+        archived += _read_partition(partition, sql, params)
+        if limit is not None and len(archived) >= limit:
+            break  # Partitions are month-ordered, later ones can't sort earlier
+    rows = sorted(_merge(get_visits_between(start_ms, end_ms, limit), archived), key=lambda row: row["in_ts"])
+    return rows[:limit] if limit is not None else rows
+
+
+def search_history(
+        query: str,
+        start: Optional[Union[datetime, int]] = None,
+        end: Optional[Union[datetime, int]] = None,
+        status: Optional[str] = None,
+        limit: int = 50,
+        before_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+    """
+    db_sqlite.search_visits() over the hot table and the archive partitions (those
+    overlapping [start, end) when given), newest first, same paging by before_id.
+    """
+    match = search_match(query)
+    hot = search_visits(query, start, end, status, limit, before_id)["visits"]
+
+    sql = "SELECT partition FROM visit_archives"
+    params: List[Any] = []
+    if start is not None:
+        sql += " WHERE max_ts >= ?"
+        params.append(_to_ms(start))
+    if end is not None:
+        sql += " AND min_ts < ?" if params else " WHERE min_ts < ?"
+        params.append(_to_ms(end))
+    with db_cursor() as cursor:
+        cursor.execute(sql + " ORDER BY partition DESC", params)
+        partitions = [row[0] for row in cursor.fetchall()]
+
+    archived: List[Dict[str, Any]] = []
+    for partition in partitions:
+        if not os.path.exists(partition_path(partition)):
+            print(f"[WARN] Archive partition missing: {partition_path(partition)}")
+            continue
+        with _attached(partition):
+            with db_transaction() as cursor:
+                # Partitions archived before search covered them get their index on first use
+                _ensure_partition_search(cursor)
+                archived += search_visit_rows(cursor, ALIAS, match, start, end, status, limit, before_id)
+
+    rows = sorted(_merge(hot, archived), key=lambda row: row["id"], reverse=True)[:limit]
+    return {
+        "visits": rows,
+        # A full page means there may be older matches
+        "next_before_id": rows[-1]["id"] if len(rows) == limit else None,
+    }
@@ -0,0 +1,210 @@
+"""
+Async Data Access
+Awaitable wrappers around db_sqlite so FastAPI handlers never block the event loop.
+Every call runs on a small dedicated thread pool; each worker thread keeps its own
+pooled SQLite connection (see db_sqlite.get_thread_connection). Writes go through
+run_write, which uses the group-commit queue (db_writer) when it is enabled.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from . import db_archive, db_idempotency, db_kiosk, db_maintenance, db_sqlite, db_writer
+
+# WAL allows many readers alongside one writer, so a few threads is plenty
+DB_WORKERS = int(os.getenv("SMART_GATE_DB_WORKERS", "4"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+def shutdown_db_executor() -> None:
+    """Stops the DB threads (application shutdown). Their thread-local connections close with them."""
+    global _executor
+    if _executor is None:
+        return
+    _executor.shutdown(wait=True)
+    _executor = None
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs any blocking db_sqlite callable on the DB executor and awaits the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_write(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs a db_sqlite write: batched through the group-commit queue when enabled, else like run_db."""
+    if db_writer.WRITE_QUEUE_ENABLED:
+        return await asyncio.wrap_future(db_writer.submit_write(fn, *args, **kwargs))
+    return await run_db(fn, *args, **kwargs)
+
+
+# --- Visits ---
+
+async def create_visit(vehicle_no: str, image_path: str = "", visitor_type: str = "unknown") -> Optional[int]:
+    return await run_write(db_sqlite.create_visit, vehicle_no, image_path, visitor_type)
+
+# once: (key, scope, request_hash) of an idempotent request, see db_idempotency.run_once
+IdempotencyKey = Optional[Tuple[str, str, str]]
+
+async def run_write_once(once: IdempotencyKey, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """run_write, with the result stored under the request's idempotency key in the same transaction."""
+    if once is None:
+        return await run_write(fn, *args, **kwargs)
+    return await run_write(db_idempotency.run_once, *once, fn, *args, **kwargs)
+
+async def close_visit(vehicle_no: str, gate: Optional[str] = None, once: IdempotencyKey = None) -> bool:
+    return await run_write_once(once, db_sqlite.close_visit, vehicle_no, gate)
+
+async def record_gate_event(vehicle_no: str, image_path: str = "", details: Optional[Dict[str, Any]] = None,
+                            toggle: bool = True, gate: Optional[str] = None,
+                            once: IdempotencyKey = None) -> Dict[str, Any]:
+    return await run_write_once(once, db_sqlite.record_gate_event, vehicle_no, image_path, details, toggle, gate)
+
+async def update_visit_details(visit_id: int, name: str, phone: str, purpose: str, id_card_path: str = "") -> bool:
+    return await run_write(db_sqlite.update_visit_details, visit_id, name, phone, purpose, id_card_path)
+
+async def update_latest_visit_details_by_vehicle(vehicle_no: str, name: str, phone: str, purpose: str) -> bool:
+    return await run_write(db_sqlite.update_latest_visit_details_by_vehicle, vehicle_no, name, phone, purpose)
+
+async def update_kiosk_visit_details(vehicle_no: str, details: Dict[str, Any]) -> bool:
+    return await run_write(db_sqlite.update_kiosk_visit_details, vehicle_no, details)
+
+async def delete_visit(visit_id: int) -> bool:
+    return await run_write(db_sqlite.delete_visit, visit_id)
+
+async def get_all_visits(limit: int = 100) -> List[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_all_visits, limit)
+
+async def list_visits(limit: int = 100, before_id: Optional[int] = None, since_version: Optional[int] = None,
+                      fields: Optional[List[str]] = None, as_rows: bool = False) -> Dict[str, Any]:
+    return await run_db(db_sqlite.list_visits, limit, before_id, since_version, fields, as_rows)
+
+async def get_visits_version() -> int:
+    return await run_db(db_sqlite.get_visits_version)
+
+# Served from the in-memory occupancy index, but a lookup may first catch up on other
+# processes' writes (a database read, or a full reload), so these hop to the DB threads too
+
+async def get_open_visits() -> List[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_open_visits)
+
+async def find_open_visit_by_vehicle(vehicle_no: str) -> Optional[Dict[str, Any]]:
+    return await run_db(db_sqlite.find_open_visit_by_vehicle, vehicle_no)
+
+async def get_occupancy() -> Dict[str, Any]:
+    return await run_db(db_sqlite.get_occupancy)
+
+async def get_visits_by_vehicle(vehicle_no: str) -> List[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_visits_by_vehicle, vehicle_no)
+
+async def get_visits_between(start: Union[datetime, int], end: Union[datetime, int],
+                             limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_visits_between, start, end, limit)
+
+async def search_visits(query: str, start: Optional[Union[datetime, int]] = None,
+                        end: Optional[Union[datetime, int]] = None, status: Optional[str] = None,
+                        limit: int = 50, before_id: Optional[int] = None) -> Dict[str, Any]:
+    return await run_db(db_archive.search_history, query, start, end, status, limit, before_id)
+
+async def get_stats() -> Dict[str, Any]:
+    return await run_db(db_sqlite.get_stats)
+
+
+# --- Archive (hot table + monthly partitions) ---
+
+async def archive_old_visits(older_than_days: Optional[int] = None) -> Dict[str, Any]:
+    return await run_db(db_archive.archive_old_visits, older_than_days)
+
+async def get_archive_partitions() -> List[Dict[str, Any]]:
+    return await run_db(db_archive.get_archive_partitions)
+
+async def get_vehicle_history(vehicle_no: str) -> List[Dict[str, Any]]:
+    return await run_db(db_archive.get_vehicle_history, vehicle_no)
+
+async def get_visit_report(start: Union[datetime, int], end: Union[datetime, int],
+                           limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    return await run_db(db_archive.get_visit_report, start, end, limit)
+
+
+# --- Maintenance ---
+
+async def get_maintenance_status() -> Dict[str, Any]:
+    return await run_db(db_maintenance.get_maintenance_status)
+
+async def run_maintenance_task(name: str) -> Dict[str, Any]:
+    # Its own thread, not the DB executor; raises db_maintenance.TaskBusy if one is running
+    return await asyncio.wrap_future(db_maintenance.start_task(name))
+
+
+# --- Regular Users (Whitelist) ---
+
+async def is_regular_user(vehicle_no: str) -> bool:
+    return await run_db(db_sqlite.is_regular_user, vehicle_no)
+
+async def get_regular_user(vehicle_no: str) -> Optional[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_regular_user, vehicle_no)
+
+async def mark_regular_user(vehicle_no: str, *args, **kwargs) -> bool:
+    return await run_write(db_sqlite.mark_regular_user, vehicle_no, *args, **kwargs)
+
+async def get_all_regular_users() -> List[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_all_regular_users)
+
+async def get_regular_user_rows() -> Tuple[List[str], List[tuple]]:
+    return await run_db(db_sqlite.get_regular_user_rows)
+
+async def delete_regular_user(vehicle_no: str) -> bool:
+    return await run_write(db_sqlite.delete_regular_user, vehicle_no)
+
+async def get_whitelist_cache_stats() -> Dict[str, Any]:
+    return db_sqlite.get_whitelist_cache_stats()
+
+
+
+# --- Kiosk ---
+
+async def get_kiosk_state(kiosk: str = db_kiosk.DEFAULT_KIOSK) -> Dict[str, Any]:
+    return await run_db(db_kiosk.get_kiosk_state, kiosk)
+
+async def get_kiosk_states() -> List[Dict[str, Any]]:
+    return await run_db(db_kiosk.get_kiosk_states)
+
+async def acquire_kiosk(vehicle_no: str, kiosk: str = db_kiosk.DEFAULT_KIOSK,
+                        visit_id: Optional[int] = None) -> Dict[str, Any]:
+    return await run_write(db_kiosk.acquire_kiosk, vehicle_no, kiosk, visit_id)
+
+async def release_kiosk(kiosk: Optional[str] = None, vehicle_no: Optional[str] = None,
+                        visit_id: Optional[int] = None) -> List[str]:
+    return await run_write(db_kiosk.release_kiosk, kiosk, vehicle_no, visit_id)
+
+
+# --- Idempotency Keys ---
+
+async def begin_idempotent_request(key: str, scope: str, request_hash: str) -> Optional[Dict[str, Any]]:
+    return await run_write(db_idempotency.begin_request, key, scope, request_hash)
+
+async def finish_idempotent_request(key: str, status_code: int, body: Any) -> None:
+    await run_write(db_idempotency.finish_request, key, status_code, body)
+
+async def abandon_idempotent_request(key: str) -> None:
+    await run_write(db_idempotency.abandon_request, key)
+
+
+# --- Staff ---
+
+async def search_staff(query: str) -> List[Dict[str, Any]]:
+    return await run_db(db_sqlite.search_staff, query)
+
+async def get_staff_by_id(staff_id: int) -> Optional[Dict[str, Any]]:
+    return await run_db(db_sqlite.get_staff_by_id, staff_id)
@@ -0,0 +1,97 @@
+"""
+Idempotency Keys
+Makes retried device calls safe: a client sends the same Idempotency-Key header with
+every attempt of one request (POST /api/new-entry, /api/update-exit, /api/gate-event).
+The first attempt runs and its response is stored for IDEMPOTENCY_TTL_S; later attempts
+get that stored response back instead of recording the plate read again.
+
+- Keys live in SQLite (idempotency_keys), so a retry that reaches another server
+  process is answered the same way.
+- The database write behind a key goes through run_once(), which stores its result
+  (the outcome) in the same transaction. A retry after a crash between that commit and
+  the stored response therefore gets the outcome back instead of writing again.
+- A key whose request is still running is 'pending'. Without an outcome the claim lapses
+  after IDEMPOTENCY_PENDING_S, in case that process died before writing anything.
+- A request that failed with a server error before its write gives up its key, so the
+  retry runs it again.
+- A key reused with a different endpoint or body is a 'conflict'.
+"""
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from .db_sqlite import db_transaction
+from .fast_json import dumps
+
+IDEMPOTENCY_TTL_S = float(os.getenv("SMART_GATE_IDEMPOTENCY_TTL_S", "86400"))
+# Longer than any request may take (see the worker timeout in gunicorn.conf.py)
+IDEMPOTENCY_PENDING_S = 60
+MAX_KEY_LENGTH = 255
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def begin_request(key: str, scope: str, request_hash: str) -> Optional[Dict[str, Any]]:
+    """
+    Claims key for a request. None means the caller runs it (then finish_request or
+    abandon_request), its write replaying a stored outcome if it got that far before;
+    otherwise {"status_code", "body"} of the stored response, {"pending": True} or
+    {"conflict": True}.
+    """
+    now = _now_ms()
+    with db_transaction(immediate=True) as cursor:
+        cursor.execute('DELETE FROM idempotency_keys WHERE expires_ts <= ?', (now,))
+        cursor.execute('''
+            SELECT scope, request_hash, status_code, response, outcome IS NOT NULL
+            FROM idempotency_keys WHERE key = ?
+        ''', (key,))
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute('''
+                INSERT INTO idempotency_keys (key, scope, request_hash, expires_ts) VALUES (?, ?, ?, ?)
+            ''', (key, scope, request_hash, now + int(IDEMPOTENCY_PENDING_S * 1000)))
+            return None
+    stored_scope, stored_hash, status_code, response, has_outcome = row
+    if stored_scope != scope or stored_hash != request_hash:
+        return {"conflict": True}
+    if status_code is None:
+        # Written but never answered (the process died in between): finish it from the outcome
+        return None if has_outcome else {"pending": True}
+    return {"status_code": status_code, "body": json.loads(response)}
+
+
+def run_once(key: str, scope: str, request_hash: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs the db_sqlite write fn for key and stores its JSON-able result as the key's
+    outcome in the same transaction. If the key already has an outcome, returns that
+    instead of running fn again.
+    """
+    with db_transaction(immediate=True) as cursor:
+        cursor.execute('SELECT outcome FROM idempotency_keys WHERE key = ?', (key,))
+        row = cursor.fetchone()
+        if row is not None and row[0] is not None:
+            return json.loads(row[0])
+        result = fn(*args, **kwargs)  # Its own transaction joins this one
+        cursor.execute('''
+            INSERT INTO idempotency_keys (key, scope, request_hash, outcome, expires_ts) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET outcome = excluded.outcome, expires_ts = excluded.expires_ts
+        ''', (key, scope, request_hash, dumps(result).decode(), _now_ms() + int(IDEMPOTENCY_TTL_S * 1000)))
+    return result
+
+
+def finish_request(key: str, status_code: int, body: Any) -> None:
+    """Stores the response of a claimed key for IDEMPOTENCY_TTL_S."""
+    with db_transaction() as cursor:
+        cursor.execute('''
+            UPDATE idempotency_keys SET status_code = ?, response = ?, expires_ts = ? WHERE key = ?
+        ''', (status_code, dumps(body).decode(), _now_ms() + int(IDEMPOTENCY_TTL_S * 1000), key))
+
+
+def abandon_request(key: str) -> None:
+    """Gives up a claimed key whose request failed before its write, so a retry runs again."""
+    with db_transaction() as cursor:
+        cursor.execute('DELETE FROM idempotency_keys WHERE key = ? AND status_code IS NULL AND outcome IS NULL',
+                       (key,))
@@ -0,0 +1,164 @@
+"""
+Kiosk Locks
+Which visitor each kiosk is serving, and who is waiting for it, kept in SQLite
+(kiosk_queue / kiosks) so every server process sees the same state.
+
+- A new visitor entry joins the queue of its kiosk; the oldest entry holds the kiosk.
+- The holder's lock lasts KIOSK_LOCK_TTL_S from the moment it reached the front, a
+  waiting visitor gives up after KIOSK_QUEUE_TTL_S. Expired entries are dropped (and the
+  next visitor promoted) by the first read or write that finds them.
+- Every change bumps kiosks.version, which long-polls and event streams compare against.
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from .db_sqlite import db_cursor, db_transaction
+
+DEFAULT_KIOSK = os.getenv("SMART_GATE_KIOSK", "main")
+# A visitor who walks away from the form frees the kiosk after this long
+KIOSK_LOCK_TTL_S = float(os.getenv("SMART_GATE_KIOSK_LOCK_TTL_S", "300"))
+# A visitor still waiting for the kiosk after this long is dropped from the queue
+KIOSK_QUEUE_TTL_S = float(os.getenv("SMART_GATE_KIOSK_QUEUE_TTL_S", "1800"))
+# How often waiters re-read the state (expiry, and changes made by other processes)
+KIOSK_CHECK_S = 1.0
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _read_state(cursor, kiosk: str, now: int) -> Optional[Dict[str, Any]]:
+    """The kiosk's state, or None if expired entries or an unpromoted head need settling first."""
+    cursor.execute('''
+        SELECT vehicle_no, locked_ts, expires_ts FROM kiosk_queue
+        WHERE kiosk = ? ORDER BY id
+    ''', (kiosk,))
+    entries = cursor.fetchall()
+    if any(expires_ts <= now for _, _, expires_ts in entries) or (entries and entries[0][1] is None):
+        return None
+    cursor.execute('SELECT version FROM kiosks WHERE kiosk = ?', (kiosk,))
+    row = cursor.fetchone()
+    version = row[0] if row else 0
+    if not entries:
+        return {"kiosk": kiosk, "status": "ready", "queue": [], "version": version}
+    vehicle_no, locked_ts, expires_ts = entries[0]
+    return {
+        "kiosk": kiosk,
+        "status": "busy",
+        "vehicle_no": vehicle_no,
+        # Lets screens ignore a lock they were not around for
+        "age_s": round((now - locked_ts) / 1000, 1),
+        "expires_in_s": round((expires_ts - now) / 1000, 1),
+        "queue": [entry[0] for entry in entries[1:]],
+        "version": version,
+    }
+
+
+def _bump(cursor, kiosk: str) -> None:
+    cursor.execute('''
+        INSERT INTO kiosks (kiosk, version) VALUES (?, 1)
+        ON CONFLICT(kiosk) DO UPDATE SET version = version + 1
+    ''', (kiosk,))
+
+
+def _settle(cursor, kiosk: str, now: int) -> bool:
+    """Drops expired entries and hands the kiosk to the next waiting visitor. True if anything changed."""
+    cursor.execute('DELETE FROM kiosk_queue WHERE kiosk = ? AND expires_ts <= ? RETURNING vehicle_no, locked_ts',
+                   (kiosk, now))
+    expired = cursor.fetchall()
+    for vehicle_no, locked_ts in expired:
+        print(f"[LOCK] Kiosk {kiosk}: {'lock' if locked_ts else 'queue entry'} of {vehicle_no} expired")
+    cursor.execute('SELECT id, vehicle_no, locked_ts FROM kiosk_queue WHERE kiosk = ? ORDER BY id LIMIT 1', (kiosk,))
+    head = cursor.fetchone()
+    promoted = head is not None and head[2] is None
+    if promoted:
+        cursor.execute('UPDATE kiosk_queue SET locked_ts = ?, expires_ts = ? WHERE id = ?',
+                       (now, now + int(KIOSK_LOCK_TTL_S * 1000), head[0]))
+        print(f"[LOCK] Kiosk {kiosk} locked for: {head[1]}")
+    if expired or promoted:
+        _bump(cursor, kiosk)
+    return bool(expired or promoted)
+
+
+def get_kiosk_state(kiosk: str = DEFAULT_KIOSK) -> Dict[str, Any]:
+    """
+    Current lock of a kiosk: {kiosk, status: 'ready'|'busy', vehicle_no, age_s,
+    expires_in_s, queue (plates waiting), version}. A plain read unless something expired.
+    """
+    now = _now_ms()
+    with db_cursor() as cursor:
+        state = _read_state(cursor, kiosk, now)
+    if state is None:
+        with db_transaction(immediate=True) as cursor:
+            _settle(cursor, kiosk, now)
+            state = _read_state(cursor, kiosk, now)
+    return state
+
+
+def get_kiosk_states() -> List[Dict[str, Any]]:
+    """State of every kiosk that has been used."""
+    with db_cursor() as cursor:
+        cursor.execute('SELECT kiosk FROM kiosks UNION SELECT kiosk FROM kiosk_queue ORDER BY 1')
+        kiosks = [row[0] for row in cursor.fetchall()]
+    return [get_kiosk_state(kiosk) for kiosk in kiosks or [DEFAULT_KIOSK]]
+
+
+def acquire_kiosk(vehicle_no: str, kiosk: str = DEFAULT_KIOSK, visit_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Queues a visitor for the kiosk (a repeat call keeps its place). Returns the kiosk
+    state plus 'position': 0 if the visitor holds the kiosk now, else the number ahead.
+    """
+    now = _now_ms()
+    with db_transaction(immediate=True) as cursor:
+        _settle(cursor, kiosk, now)
+        cursor.execute('SELECT 1 FROM kiosk_queue WHERE kiosk = ? AND vehicle_no = ?', (kiosk, vehicle_no))
+        if cursor.fetchone() is None:
+            cursor.execute('''
+                INSERT INTO kiosk_queue (kiosk, vehicle_no, visit_id, queued_ts, expires_ts)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (kiosk, vehicle_no, visit_id, now, now + int(KIOSK_QUEUE_TTL_S * 1000)))
+            _bump(cursor, kiosk)
+            _settle(cursor, kiosk, now)
+        state = _read_state(cursor, kiosk, now)
+    plates = [state.get("vehicle_no")] + state["queue"]
+    state["position"] = plates.index(vehicle_no)
+    if state["position"]:
+        print(f"[LOCK] Kiosk {kiosk} busy, {vehicle_no} queued at position {state['position']}")
+    return state
+
+
+def release_kiosk(kiosk: Optional[str] = None, vehicle_no: Optional[str] = None,
+                  visit_id: Optional[int] = None) -> List[str]:
+    """
+    Removes a visitor from the queues (by vehicle_no and/or visit_id, on one kiosk or all),
+    or with neither given frees the kiosk's current holder. The next visitor waiting takes
+    over. Returns the kiosks that changed.
+    """
+    if vehicle_no is None and visit_id is None and kiosk is None:
+        raise ValueError("release_kiosk needs a kiosk, vehicle_no or visit_id")
+    conditions, params = [], []
+    if kiosk is not None:
+        conditions.append('kiosk = ?')
+        params.append(kiosk)
+    if vehicle_no is not None:
+        conditions.append('vehicle_no = ?')
+        params.append(vehicle_no)
+    if visit_id is not None:
+        conditions.append('visit_id = ?')
+        params.append(visit_id)
+    if vehicle_no is None and visit_id is None:
+        conditions.append('locked_ts IS NOT NULL')
+
+    now = _now_ms()
+    with db_transaction(immediate=True) as cursor:
+        cursor.execute(f'DELETE FROM kiosk_queue WHERE {" AND ".join(conditions)} RETURNING kiosk, vehicle_no',
+                       params)
+        released = cursor.fetchall()
+        for name, plate in released:
+            print(f"[UNLOCK] Kiosk {name} released for: {plate}")
+        changed = sorted({row[0] for row in released})
+        for name in changed:
+            _bump(cursor, name)
+            _settle(cursor, name, now)
+    return changed
@@ -0,0 +1,343 @@
+"""
+Database Maintenance
+Background scheduler that keeps data/smart_gate.db healthy while the server runs:
+
+- backup:   online copy through the sqlite3 backup API into data/backups/, a few
+            hundred pages per step so writers are never held up for long
+- optimize: PRAGMA optimize over every table (ANALYZE where statistics are stale)
+- vacuum:   PRAGMA incremental_vacuum, handing pages freed by deletes back to the
+            filesystem in small write transactions
+- archive:  archive_old_visits() (off unless SMART_GATE_ARCHIVE_HOURS is set)
+- retention: purge_expired_visits(), deleting or anonymizing visits past
+            SMART_GATE_RETENTION_DAYS and their images (off while that is 0)
+
+Last run, duration and sizes of every task are kept for GET /api/maintenance.
+With several server processes (gunicorn workers) every one starts a scheduler, but only
+the holder of the 'maintenance' lease (process_leases table) runs the schedule; if it
+dies, another process takes over once the lease lapses. Tasks requested through the API
+run in whichever process serves the request, on a thread of their own; while another task
+runs in that process they are refused (TaskBusy) rather than queued.
+"""
+import glob
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from . import db_archive, db_retention
+from .db_sqlite import DB_PATH, close_thread_connection, db_transaction, get_thread_connection
+
+MAINTENANCE_ENABLED = os.getenv("SMART_GATE_MAINTENANCE", "1") == "1"
+
+BACKUP_DIR = os.getenv("SMART_GATE_BACKUP_DIR", os.path.join(os.path.dirname(DB_PATH), "backups"))
+BACKUP_KEEP = int(os.getenv("SMART_GATE_BACKUP_KEEP", "7"))
+# Pages copied per backup step; between steps (and vacuum steps) writers get their turn
+BACKUP_STEP_PAGES = int(os.getenv("SMART_GATE_BACKUP_STEP_PAGES", "256"))
+STEP_SLEEP_S = 0.01
+# In WAL mode a write from another connection restarts a paged backup; after this many
+# restarts the rest is copied in one step (a read snapshot, which doesn't block writers)
+BACKUP_MAX_RESTARTS = 5
+
+# Stop handing pages back once the free list is this small
+VACUUM_MIN_FREE_PAGES = 64
+VACUUM_STEP_PAGES = 512
+# Rows examined per index by the ANALYZE behind PRAGMA optimize (keeps it fast on big tables)
+ANALYSIS_LIMIT = 1000
+
+# Task intervals in seconds (0 disables a task)
+INTERVALS = {
+    "backup": float(os.getenv("SMART_GATE_BACKUP_HOURS", "24")) * 3600,
+    "optimize": float(os.getenv("SMART_GATE_OPTIMIZE_MINUTES", "60")) * 60,
+    "vacuum": float(os.getenv("SMART_GATE_VACUUM_HOURS", "6")) * 3600,
+    "archive": float(os.getenv("SMART_GATE_ARCHIVE_HOURS", "0")) * 3600,
+    "retention": float(os.getenv("SMART_GATE_RETENTION_HOURS", "24")) * 3600,
+}
+# How often the scheduler thread looks for due tasks
+TICK_S = 30
+# Renewed every tick and before each task; another process takes over this long after
+# the holder stopped renewing (long enough to outlast a slow backup)
+LEASE_NAME = "maintenance"
+LEASE_S = float(os.getenv("SMART_GATE_MAINTENANCE_LEASE_S", "600"))
+
+_status: Dict[str, Dict[str, Any]] = {name: {"runs": 0} for name in INTERVALS}
+_next_run: Dict[str, float] = {}
+_task_lock = threading.Lock()     # one task at a time, scheduled or on demand
+_running: Optional[str] = None    # name of the task holding _task_lock
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_owner = ""
+_leader = False
+
+
+def _db_sizes() -> Dict[str, int]:
+    conn = get_thread_connection()
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    pages = conn.execute('PRAGMA page_count').fetchone()[0]
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    wal_path = DB_PATH + "-wal"
+    return {
+        "db_bytes": pages * page_size,
+        "free_bytes": free * page_size,
+        "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+    }
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+class TaskBusy(Exception):
+    """Another maintenance task is running in this process."""
+
+
+def backup_database(target_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Copies the live database into target_dir (default BACKUP_DIR) as
+    smart_gate_YYYYmmdd_HHMMSS.db, checks the copy, and prunes all but the newest BACKUP_KEEP.
+    """
+    target_dir = target_dir or BACKUP_DIR
+    os.makedirs(target_dir, exist_ok=True)
+    path = os.path.join(target_dir, f"smart_gate_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+    partial = path + ".partial"
+
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts >= BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last_remaining = remaining
+
+    source = get_thread_connection()
+    target = sqlite3.connect(partial)
+    try:
+        try:
+            source.backup(target, pages=BACKUP_STEP_PAGES, progress=progress, sleep=STEP_SLEEP_S)
+        except _BackupRestarted:
+            source.backup(target)
+        integrity = target.execute('PRAGMA quick_check').fetchone()[0]
+        # The copy inherits WAL mode; a rollback journal keeps each backup a single file
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+    if integrity != "ok":
+        os.remove(partial)
+        raise RuntimeError(f"backup copy failed quick_check: {integrity}")
+    os.replace(partial, path)
+
+    backups = sorted(glob.glob(os.path.join(target_dir, "smart_gate_*.db")))
+    for old in backups[:-BACKUP_KEEP] if BACKUP_KEEP > 0 else []:
+        os.remove(old)
+    return {"path": path, "bytes": os.path.getsize(path), "restarts": restarts, "kept": min(len(backups), BACKUP_KEEP)}
+
+
+def optimize_database() -> Dict[str, Any]:
+    """Refreshes planner statistics of every table whose statistics are missing or stale."""
+    conn = get_thread_connection()
+    conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+    # 0x10002: consider all tables, not only those this connection has queried
+    conn.execute('PRAGMA optimize = 0x10002')
+    return {}
+
+
+def vacuum_database() -> Dict[str, Any]:
+    """Hands free pages back to the filesystem, VACUUM_STEP_PAGES per write transaction."""
+    conn = get_thread_connection()
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:  # 2 = INCREMENTAL
+        # incremental_vacuum is a no-op in the other modes, see scripts/enable_incremental_vacuum.py
+        return {"reclaimed_bytes": 0, "skipped": "auto_vacuum is not INCREMENTAL"}
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    free = before
+    while free > VACUUM_MIN_FREE_PAGES and not _stop.is_set():
+        # executescript steps the pragma to completion; execute() would stop after one page
+        conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})')
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        time.sleep(STEP_SLEEP_S)
+    return {"reclaimed_bytes": (before - free) * page_size}
+
+
+def archive_visits() -> Dict[str, Any]:
+    """Moves old exited visits into the monthly archive partitions."""
+    return db_archive.archive_old_visits()
+
+
+def purge_retention() -> Dict[str, Any]:
+    """Deletes or anonymizes visits past the retention period and reclaims their images."""
+    return db_retention.purge_expired_visits()
+
+
+TASKS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    "backup": backup_database,
+    "optimize": optimize_database,
+    "vacuum": vacuum_database,
+    "archive": archive_visits,
+    "retention": purge_retention,
+}
+
+
+def _run_task(name: str) -> Dict[str, Any]:
+    """Runs one task and records its outcome; the caller holds _task_lock."""
+    global _running
+    _running = name
+    status = _status[name]
+    start = time.perf_counter()
+    status["started_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        status["result"] = TASKS[name]()
+        status["ok"], status["error"] = True, None
+    except Exception as e:
+        print(f"[ERROR] Maintenance task {name} failed: {e}")
+        status["ok"], status["error"] = False, str(e)
+    finally:
+        _running = None
+    status["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    status["runs"] += 1
+    if name in _next_run:
+        _next_run[name] = time.time() + INTERVALS[name]
+    status.update(_db_sizes())
+    if status["ok"]:
+        print(f"[MAINT] {name} done in {status['duration_ms']} ms: {status['result']}")
+    return dict(status)
+
+
+def run_task(name: str) -> Dict[str, Any]:
+    """Runs one maintenance task now (after any task in progress) and records its outcome. Returns the task status."""
+    with _task_lock:
+        return _run_task(name)
+
+
+def start_task(name: str) -> "Future[Dict[str, Any]]":
+    """
+    Starts one maintenance task on a thread of its own (requests through the API, so a long
+    backup never occupies a DB executor thread). Raises TaskBusy if a task is already
+    running in this process. The future resolves to the task status.
+    """
+    if not _task_lock.acquire(blocking=False):
+        raise TaskBusy(f"Maintenance task {_running or 'another task'} is running")
+    future: "Future[Dict[str, Any]]" = Future()
+    # Runs to completion even if the waiting request goes away
+    future.set_running_or_notify_cancel()
+
+    def run() -> None:
+        try:
+            future.set_result(_run_task(name))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            _task_lock.release()
+            close_thread_connection()
+
+    try:
+        threading.Thread(target=run, name=f"db-maintenance-{name}", daemon=True).start()
+    except BaseException:
+        _task_lock.release()
+        raise
+    return future
+
+
+def get_maintenance_status() -> Dict[str, Any]:
+    """
+    Current database sizes plus last outcome and next due time of every task (as seen by
+    this process), and which process runs the schedule.
+    """
+    lease = get_thread_connection().execute(
+        'SELECT owner FROM process_leases WHERE name = ? AND expires_ts > ?',
+        (LEASE_NAME, int(time.time() * 1000))).fetchone()
+    tasks = {}
+    for name, interval in INTERVALS.items():
+        due = _next_run.get(name)
+        tasks[name] = {**_status[name], "interval_s": interval,
+                       "next_run": datetime.fromtimestamp(due).strftime("%Y-%m-%d %H:%M:%S") if due else None}
+    return {"enabled": MAINTENANCE_ENABLED, "running": _thread is not None and _thread.is_alive(),
+            "scheduler": lease[0] if lease else None, "process": f"{socket.gethostname()}:{os.getpid()}",
+            **_db_sizes(), "tasks": tasks}
+
+
+def _renew_lease() -> bool:
+    """Takes or renews the maintenance lease for this process. True while this process holds it."""
+    global _leader
+    now = int(time.time() * 1000)
+    with db_transaction(immediate=True) as cursor:
+        cursor.execute('''
+            INSERT INTO process_leases (name, owner, expires_ts) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_ts = excluded.expires_ts
+            WHERE owner = excluded.owner OR expires_ts <= ?
+        ''', (LEASE_NAME, _owner, now + int(LEASE_S * 1000), now))
+        held = cursor.rowcount == 1
+    if held != _leader:
+        print(f"[MAINT] {'Running' if held else 'Not running'} the maintenance schedule in process {_owner}")
+    _leader = held
+    return held
+
+
+def _release_lease() -> None:
+    global _leader
+    if _leader:
+        with db_transaction(immediate=True) as cursor:
+            cursor.execute('DELETE FROM process_leases WHERE name = ? AND owner = ?', (LEASE_NAME, _owner))
+        _leader = False
+
+
+def _first_run(name: str, now: float) -> float:
+    if name == "backup":
+        # Resume the cadence from the newest backup, so restarts don't trigger extra copies
+        backups = sorted(glob.glob(os.path.join(BACKUP_DIR, "smart_gate_*.db")))
+        if not backups:
+            return now
+        return os.path.getmtime(backups[-1]) + INTERVALS[name]
+    return now + INTERVALS[name]
+
+
+def _scheduler_loop() -> None:
+    now = time.time()
+    for name, interval in INTERVALS.items():
+        if interval > 0:
+            _next_run[name] = _first_run(name, now)
+    try:
+        while True:
+            try:
+                leader = _renew_lease()
+            except sqlite3.Error as e:
+                print(f"[ERROR] Maintenance lease check failed: {e}")
+                leader = False
+            if _stop.wait(TICK_S):
+                break
+            if not leader:
+                continue
+            for name, due in list(_next_run.items()):
+                if time.time() >= due and not _stop.is_set() and _renew_lease():
+                    run_task(name)
+    finally:
+        try:
+            _release_lease()
+        finally:
+            close_thread_connection()
+
+
+def start_maintenance() -> None:
+    """Starts the scheduler thread (application startup), unless SMART_GATE_MAINTENANCE=0."""
+    global _thread, _owner
+    if not MAINTENANCE_ENABLED or (_thread is not None and _thread.is_alive()):
+        return
+    _owner = f"{socket.gethostname()}:{os.getpid()}"
+    _stop.clear()
+    _thread = threading.Thread(target=_scheduler_loop, name="db-maintenance", daemon=True)
+    _thread.start()
+
+
+def stop_maintenance() -> None:
+    """Stops the scheduler thread after the task in progress, if any (application shutdown)."""
+    global _thread
+    if _thread is None:
+        return
+    _stop.set()
+    _thread.join()
+    _thread = None
@@ -0,0 +1,322 @@
+"""
+Visit Retention
+Enforces a retention period on visits and the images they reference. Exited visits
+that entered more than SMART_GATE_RETENTION_DAYS ago are either deleted or anonymized
+(personal fields and image paths cleared, plate and times kept for the counters),
+in the hot table and in the archive partitions alike. The vehicle, ID card front/back
+images they pointed at are removed from disk once the change has committed.
+
+Work is done in batches of RETENTION_BATCH rows, each its own short write transaction
+with a pause in between, so gate traffic never waits long for the write lock.
+A final sweep removes captures, photos and ID card scans older than the retention
+period that no remaining row refers to (failed detections, abandoned kiosk uploads).
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from . import db_archive
+from .db_sqlite import BASE_DIR, _to_ms, db_cursor, db_transaction
+
+# 0 keeps everything
+RETENTION_DAYS = int(os.getenv("SMART_GATE_RETENTION_DAYS", "0"))
+# 'delete' removes expired visits, 'anonymize' keeps them without personal data
+RETENTION_MODE = os.getenv("SMART_GATE_RETENTION_MODE", "delete")
+# Rows per write transaction
+RETENTION_BATCH = int(os.getenv("SMART_GATE_RETENTION_BATCH", "200"))
+BATCH_SLEEP_S = 0.01
+
+IMAGE_COLUMNS = ["vehicle_image_path", "id_card_image_path", "id_card_front_path", "id_card_back_path"]
+PERSONAL_COLUMNS = [
+    "visitor_name", "phone", "id_type", "id_number", "dob", "address",
+    "address_street", "address_city", "address_state", "remarks",
+    "company", "flat_no", "person_to_meet", "person_to_meet_email",
+] + IMAGE_COLUMNS
+
+# Only files under these directories are ever deleted, whatever a row says
+MEDIA_DIRS = [os.path.join(BASE_DIR, "data", name) for name in ("captures", "photos", "id_cards")]
+
+_ALIAS = db_archive.ALIAS
+
+
+def _resolve(path: str) -> Optional[str]:
+    """Stored image path (relative to the project root or absolute) -> real path inside MEDIA_DIRS, else None."""
+    if not path:
+        return None
+    full = os.path.realpath(path if os.path.isabs(path) else os.path.join(BASE_DIR, path))
+    for media_dir in MEDIA_DIRS:
+        if full.startswith(os.path.realpath(media_dir) + os.sep):
+            return full
+    return None
+
+
+def _remove_files(paths: Iterable[str], keep: Set[str]) -> Tuple[int, int]:
+    """Deletes the media files behind paths, except those in keep. Returns (files, bytes)."""
+    files = reclaimed = 0
+    for path in {_resolve(path) for path in paths} - {None} - keep:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            print(f"[WARN] Could not remove {path}: {e}")
+            continue
+        files += 1
+        reclaimed += size
+    return files, reclaimed
+
+
+def _referenced_files(paths: Iterable[str]) -> Set[str]:
+    """Real paths among paths still referenced by a visit (live or archived) or a whitelist entry."""
+    paths = [path for path in set(paths) if path]
+    if not paths:
+        return set()
+    placeholders = ", ".join("?" * len(paths))
+    visit_refs = " OR ".join(f"{column} IN ({placeholders})" for column in IMAGE_COLUMNS)
+    with db_cursor() as cursor:
+        cursor.execute(f'''
+            SELECT {", ".join(IMAGE_COLUMNS)} FROM visits WHERE {visit_refs}
+            UNION ALL
+            SELECT id_card_front_path, id_card_back_path, '', '' FROM regular_users
+            WHERE id_card_front_path IN ({placeholders}) OR id_card_back_path IN ({placeholders})
+        ''', tuple(paths) * (len(IMAGE_COLUMNS) + 2))
+        referenced = {value for row in cursor.fetchall() for value in row}
+        cursor.execute("SELECT partition FROM visit_archives")
+        partitions = [row[0] for row in cursor.fetchall()]
+
+    for partition in partitions:
+        if not os.path.exists(db_archive.partition_path(partition)):
+            continue
+        with db_archive._attached(partition) as conn:
+            rows = conn.execute(f"SELECT {', '.join(IMAGE_COLUMNS)} FROM {_ALIAS}.visits WHERE {visit_refs}",
+                                tuple(paths) * len(IMAGE_COLUMNS)).fetchall()
+        referenced |= {value for row in rows for value in row}
+    return {_resolve(path) for path in referenced} - {None}
+
+
+def _expired_filter(mode: str) -> str:
+    # Anonymized rows stay behind, skip those already stripped
+    if mode == "anonymize":
+        return " AND (" + " OR ".join(f"COALESCE({column}, '') != ''" for column in PERSONAL_COLUMNS) + ")"
+    return ""
+
+
+def _purge_hot(cutoff_ms: int, mode: str) -> Tuple[int, List[str]]:
+    """Deletes / anonymizes expired exited visits in the live table. Returns (rows, image paths)."""
+    rows, paths = 0, []
+    while True:
+        with db_transaction(immediate=True) as cursor:
+            cursor.execute(f'''
+                SELECT id, {", ".join(IMAGE_COLUMNS)} FROM visits
+                WHERE in_ts < ? AND status = 'exited'{_expired_filter(mode)}
+                ORDER BY in_ts LIMIT ?
+            ''', (cutoff_ms, RETENTION_BATCH))
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            ids = [row[0] for row in batch]
+            placeholders = ", ".join("?" * len(ids))
+            if mode == "anonymize":
+                cleared = ", ".join(f"{column} = ''" for column in PERSONAL_COLUMNS)
+                cursor.execute(f"UPDATE visits SET {cleared} WHERE id IN ({placeholders})", ids)
+            else:
+                cursor.execute(f"DELETE FROM visits WHERE id IN ({placeholders})", ids)
+        rows += len(batch)
+        paths += [path for row in batch for path in row[1:] if path]
+        time.sleep(BATCH_SLEEP_S)
+    return rows, paths
+
+
+def _delete_archived_batch(cursor, partition: str, cutoff_ms: int) -> Tuple[int, List[str]]:
+    """
+    Deletes one batch of expired rows from the attached partition and takes them out of the
+    catalog and the counters. Copies whose visit is still in the hot table (left behind by an
+    interrupted archive run) were never counted, so they are dropped without touching counters.
+    """
+    cursor.execute(f'''
+        CREATE TEMP TABLE retention_batch AS
+        SELECT a.id, a.vehicle_no, a.visitor_type, {", ".join(f"a.{column}" for column in IMAGE_COLUMNS)},
+               v.id IS NULL AS counted
+        FROM {_ALIAS}.visits a LEFT JOIN main.visits v ON v.id = a.id
+        WHERE a.in_ts < ? ORDER BY a.in_ts LIMIT ?
+    ''', (cutoff_ms, RETENTION_BATCH))
+    cursor.execute(f"SELECT {', '.join(IMAGE_COLUMNS)} FROM temp.retention_batch")
+    paths = [path for row in cursor.fetchall() for path in row if path]
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(counted), 0) FROM temp.retention_batch")
+    rows, counted = cursor.fetchone()
+
+    cursor.execute(f"DELETE FROM {_ALIAS}.visits WHERE id IN (SELECT id FROM temp.retention_batch)")
+    if counted:
+        cursor.execute('''
+            CREATE TEMP TABLE retention_counts AS
+            SELECT vehicle_no, visitor_type, COUNT(*) AS n FROM temp.retention_batch WHERE counted
+            GROUP BY vehicle_no, visitor_type
+        ''')
+        cursor.execute('''
+            UPDATE visit_archive_index SET visit_count = visit_count -
+                (SELECT SUM(n) FROM temp.retention_counts c WHERE c.vehicle_no = visit_archive_index.vehicle_no)
+            WHERE partition = ? AND vehicle_no IN (SELECT vehicle_no FROM temp.retention_counts)
+        ''', (partition,))
+        cursor.execute("DELETE FROM visit_archive_index WHERE partition = ? AND visit_count <= 0", (partition,))
+        cursor.execute("UPDATE visit_archives SET row_count = row_count - ? WHERE partition = ?", (counted, partition))
+        for table in ("visit_archive_stats", "visit_stats"):
+            cursor.execute(f'''
+                UPDATE {table} SET value = value - (
+                    SELECT SUM(n) FROM temp.retention_counts
+                    WHERE {table}.key = 'total' OR {table}.key = 'type:' || COALESCE(visitor_type, '')
+                )
+                WHERE key = 'total' OR key IN (
+                    SELECT 'type:' || COALESCE(visitor_type, '') FROM temp.retention_counts)
+            ''')
+        cursor.execute('''
+            UPDATE vehicles SET visit_count = visit_count -
+                (SELECT SUM(n) FROM temp.retention_counts c WHERE c.vehicle_no = vehicles.vehicle_no)
+            WHERE vehicle_no IN (SELECT vehicle_no FROM temp.retention_counts)
+        ''')
+        cursor.execute('''
+            UPDATE visit_stats SET value = value - (SELECT COUNT(*) FROM vehicles WHERE visit_count <= 0)
+            WHERE key = 'unique_vehicles'
+        ''')
+        cursor.execute("DELETE FROM vehicles WHERE visit_count <= 0")
+        cursor.execute("DROP TABLE temp.retention_counts")
+    cursor.execute("DROP TABLE temp.retention_batch")
+    return rows, paths
+
+
+def _anonymize_archived_batch(cursor, cutoff_ms: int) -> Tuple[int, List[str]]:
+    cursor.execute(f'''
+        SELECT id, {", ".join(IMAGE_COLUMNS)} FROM {_ALIAS}.visits
+        WHERE in_ts < ?{_expired_filter("anonymize")} ORDER BY in_ts LIMIT ?
+    ''', (cutoff_ms, RETENTION_BATCH))
+    batch = cursor.fetchall()
+    if batch:
+        ids = [row[0] for row in batch]
+        cleared = ", ".join(f"{column} = ''" for column in PERSONAL_COLUMNS)
+        cursor.execute(f"UPDATE {_ALIAS}.visits SET {cleared} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+    return len(batch), [path for row in batch for path in row[1:] if path]
+
+
+def _purge_partition(partition: str, cutoff_ms: int, mode: str) -> Tuple[int, List[str], int]:
+    """Expired rows of one archive partition. Returns (rows, image paths, partition bytes reclaimed)."""
+    path = db_archive.partition_path(partition)
+    if not os.path.exists(path):
+        print(f"[WARN] Archive partition missing: {path}")
+        return 0, [], 0
+    size_before = os.path.getsize(path)
+    rows, paths = 0, []
+    with db_archive._attached(partition):
+        while True:
+            with db_transaction(immediate=True) as cursor:
+                if mode == "anonymize":
+                    done, batch_paths = _anonymize_archived_batch(cursor, cutoff_ms)
+                else:
+                    done, batch_paths = _delete_archived_batch(cursor, partition, cutoff_ms)
+            if not done:
+                break
+            rows += done
+            paths += batch_paths
+            time.sleep(BATCH_SLEEP_S)
+
+        with db_cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {_ALIAS}.visits")
+            remaining = cursor.fetchone()[0]
+            if rows and remaining:
+                # Partition files see no other writers, compacting them holds up nobody
+                cursor.execute(f"VACUUM {_ALIAS}")
+
+    if not remaining and mode == "delete":
+        with db_transaction(immediate=True) as cursor:
+            cursor.execute("DELETE FROM visit_archives WHERE partition = ?", (partition,))
+            cursor.execute("DELETE FROM visit_archive_index WHERE partition = ?", (partition,))
+        os.remove(path)
+        return rows, paths, size_before
+    return rows, paths, size_before - os.path.getsize(path)
+
+
+def _sweep_media(cutoff: datetime) -> Tuple[int, int]:
+    """Removes unreferenced media files last modified before cutoff, plus emptied date folders."""
+    candidates = []
+    for media_dir in MEDIA_DIRS:
+        for root, _, names in os.walk(media_dir):
+            for name in names:
+                if name.startswith("."):
+                    continue  # .gitkeep and friends
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) < cutoff.timestamp():
+                    candidates.append(path)
+
+    files = reclaimed = 0
+    for start in range(0, len(candidates), RETENTION_BATCH):
+        chunk = candidates[start:start + RETENTION_BATCH]
+        # Rows can hold the path relative to the project root or absolute
+        stored = chunk + [os.path.relpath(path, BASE_DIR).replace("\\", "/") for path in chunk]
+        removed, size = _remove_files(chunk, _referenced_files(stored))
+        files += removed
+        reclaimed += size
+
+    for media_dir in MEDIA_DIRS:
+        for root, dirs, names in os.walk(media_dir, topdown=False):
+            if root != media_dir and not dirs and not names:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+    return files, reclaimed
+
+
+def purge_expired_visits(older_than_days: Optional[int] = None, mode: Optional[str] = None,
+                         sweep_media: bool = True) -> Dict[str, Any]:
+    """
+    Applies the retention period (default RETENTION_DAYS; 0 = keep everything) to visits in the
+    hot table and the archive, then deletes the images they referenced. Open visits are never touched.
+    Returns row counts, files removed and bytes reclaimed (images plus archive partitions).
+    """
+    days = RETENTION_DAYS if older_than_days is None else older_than_days
+    mode = mode or RETENTION_MODE
+    if mode not in ("delete", "anonymize"):
+        raise ValueError(f"Unknown retention mode: {mode}")
+    if days <= 0:
+        return {"enabled": False}
+
+    cutoff = datetime.now() - timedelta(days=days)
+    cutoff_ms = _to_ms(cutoff)
+    with db_cursor() as cursor:
+        cursor.execute("SELECT partition FROM visit_archives WHERE min_ts < ? ORDER BY partition", (cutoff_ms,))
+        partitions = [row[0] for row in cursor.fetchall()]
+
+    # Archive first: a partition copy whose visit is still hot is recognised by its hot twin
+    archived_rows, paths, partition_bytes = 0, [], 0
+    for partition in partitions:
+        rows, partition_paths, reclaimed = _purge_partition(partition, cutoff_ms, mode)
+        archived_rows += rows
+        paths += partition_paths
+        partition_bytes += reclaimed
+        if rows:
+            print(f"[RETENTION] {mode} {rows} archived visits in {partition}")
+
+    hot_rows, hot_paths = _purge_hot(cutoff_ms, mode)
+    paths += hot_paths
+    if hot_rows:
+        print(f"[RETENTION] {mode} {hot_rows} visits entered before {cutoff:%Y-%m-%d}")
+
+    files, image_bytes = 0, 0
+    for start in range(0, len(paths), RETENTION_BATCH):
+        chunk = paths[start:start + RETENTION_BATCH]
+        removed, size = _remove_files(chunk, _referenced_files(chunk))
+        files += removed
+        image_bytes += size
+    if sweep_media:
+        removed, size = _sweep_media(cutoff)
+        files += removed
+        image_bytes += size
+
+    return {
+        "mode": mode,
+        "cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S"),
+        "visits": hot_rows,
+        "archived_visits": archived_rows,
+        "files_removed": files,
+        "reclaimed_bytes": image_bytes + partition_bytes,
+    }
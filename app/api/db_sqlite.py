@@ -1,26 +1,183 @@
 import sqlite3
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Callable, Iterator, Set, Tuple, Union
+
+from .plate_match import PlateIndex, canonical_key, normalize_plate, plate_distance
 
 # Assuming the data directory is at the root of the project
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-DB_PATH = os.path.join(BASE_DIR, 'data', 'smart_gate.db')
+DB_PATH = os.getenv("SMART_GATE_DB_PATH", os.path.join(BASE_DIR, 'data', 'smart_gate.db'))
+
+# Connection tuning (applied to every connection we open)
+BUSY_TIMEOUT_MS = 30000
+MMAP_SIZE = 64 * 1024 * 1024      # 64 MB memory-mapped I/O
+CACHE_SIZE_KB = 16 * 1024          # 16 MB page cache per connection
+
+# One long-lived connection per thread (and per process, so forks never share a handle)
+_local = threading.local()
+
+def _configure_connection(conn: sqlite3.Connection) -> None:
+    """Applies WAL mode and performance pragmas to a freshly opened connection."""
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
 
 def get_db_connection() -> sqlite3.Connection:
-    """Gets a connection to the SQLite database, ensuring thread safety if needed."""
+    """Opens a new, tuned connection. The caller owns it and must close it (scripts, one-off jobs)."""
     # Ensure data directory exists
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    # Added timeout and check_same_thread for better Docker/FastAPI performance
-    conn = sqlite3.connect(DB_PATH, timeout=30.0, check_same_thread=False)
+    # isolation_level=None: transactions are opened explicitly by db_transaction()
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           isolation_level=None)
     conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+    _configure_connection(conn)
     return conn
 
-def init_db():
-    """Initializes the database schema if it doesn't exist."""
-    conn = get_db_connection()
+def get_thread_connection() -> sqlite3.Connection:
+    """Returns the pooled connection for the current thread, opening it on first use."""
+    pid = os.getpid()
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != pid:
+        conn = get_db_connection()
+        _local.conn = conn
+        _local.pid = pid
+    return conn
+
+def close_thread_connection() -> None:
+    """Closes the current thread's pooled connection (shutdown hooks, tests)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and getattr(_local, "pid", None) == os.getpid():
+        # Refresh planner stats for tables whose shape changed while we were connected
+        conn.execute('PRAGMA optimize')
+        conn.close()
+    _local.conn = None
+
+@contextmanager
+def db_cursor() -> Iterator[sqlite3.Cursor]:
+    """Yields a cursor on the pooled connection for read-only work."""
+    cursor = get_thread_connection().cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+@contextmanager
+def db_transaction(immediate: bool = False) -> Iterator[sqlite3.Cursor]:
+    """
+    Yields a cursor inside a transaction on the pooled connection.
+    Commits on success, rolls back on error. Nested calls join the outer transaction.
+    Use immediate=True to take the write lock up front (read-then-write sequences).
+    """
+    conn = get_thread_connection()
     cursor = conn.cursor()
+    if conn.in_transaction:
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+        return
+
+    cursor.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+    changes = conn.total_changes
+    try:
+        yield cursor
+        conn.commit()
+        if conn.total_changes != changes:
+            _note_write()
+    except BaseException:
+        conn.rollback()
+        pending_commit_hooks().clear()
+        raise
+    finally:
+        cursor.close()
+    _run_commit_hooks()
+
+def pending_commit_hooks() -> List[Callable[[], None]]:
+    """Callbacks registered by after_commit() in this thread's open transaction."""
+    hooks = getattr(_local, "commit_hooks", None)
+    if hooks is None:
+        hooks = _local.commit_hooks = []
+    return hooks
+
+def after_commit(callback: Callable[[], None]) -> None:
+    """
+    Runs callback once the current thread's transaction commits (dropped if it rolls back),
+    so in-process caches only ever reflect committed writes. Runs at once outside a transaction.
+    """
+    if get_thread_connection().in_transaction:
+        pending_commit_hooks().append(callback)
+    else:
+        callback()
+
+def _run_commit_hooks() -> None:
+    hooks = pending_commit_hooks()
+    while hooks:
+        callback = hooks.pop(0)
+        try:
+            callback()
+        except Exception as e:
+            print(f"[ERROR] Commit hook failed: {e}")
+
+# --- Change Version ---
+# One version string for everything the polled read endpoints serve, built from the
+# trigger-maintained db_meta counters (visits_version, whitelist_version), so it is the
+# same in every process. Answering from memory keeps conditional GETs off the database:
+# a commit in this process forces a re-read, other processes' writes are picked up
+# within CHANGE_CHECK_MS.
+CHANGE_CHECK_MS = float(os.getenv("SMART_GATE_CHANGE_CHECK_MS", "250"))
 
+_change_lock = threading.Lock()
+_change_version: Optional[str] = None
+_change_checked_at = 0.0
+_change_writes = 0   # Commits with changes made by this process
+_change_seen = 0     # _change_writes already reflected in _change_version
+
+def _note_write() -> None:
+    global _change_writes
+    with _change_lock:
+        _change_writes += 1
+
+def get_change_version() -> str:
+    """Current data version, e.g. '1532.7' (visits.whitelist); changes with every committed write."""
+    global _change_version, _change_checked_at, _change_seen
+    now = time.monotonic()
+    with _change_lock:
+        if (_change_version is not None and _change_seen == _change_writes
+                and (now - _change_checked_at) * 1000 < CHANGE_CHECK_MS):
+            return _change_version
+        writes = _change_writes
+    with db_cursor() as cursor:
+        cursor.execute("SELECT key, value FROM db_meta WHERE key IN ('visits_version', 'whitelist_version')")
+        counters = dict(cursor.fetchall())
+    version = f"{counters.get('visits_version', 0)}.{counters.get('whitelist_version', 0)}"
+    with _change_lock:
+        # A commit that landed during the read bumped _change_writes, so the next call re-reads
+        _change_version, _change_checked_at, _change_seen = version, now, writes
+    return version
+
+# --- Schema Migrations ---
+# Ordered, append-only list of schema steps keyed on PRAGMA user_version. Each step runs
+# once, inside one BEGIN IMMEDIATE transaction together with its user_version bump, so a
+# crash never leaves a half-applied step. Databases created before versioning report
+# user_version 0, so step 1 must be safe on a schema that already exists.
+
+def _add_missing_columns(cursor: sqlite3.Cursor, table: str, columns: List[Tuple[str, str]]) -> None:
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing = {row[1] for row in cursor.fetchall()}
+    for col_name, col_def in columns:
+        if col_name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {col_name} {col_def}')
+
+def _migrate_base_schema(cursor: sqlite3.Cursor) -> None:
     # Create visits table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS visits (
@@ -38,11 +195,6 @@ def init_db():
     )
     ''')
 
-    # Create indexes for fast querying
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_vehicle_no ON visits(vehicle_no)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_status ON visits(status)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_in_time ON visits(in_time)')
-
     # Create regular_users table (whitelist)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS regular_users (
@@ -62,12 +214,9 @@ def init_db():
         created_at TEXT NOT NULL
     )
     ''')
-    
-    conn.commit()
-    
-    # --- Phase 5: Kiosk fields migration ---
-    # Safely add new columns if they don't exist (ALTER TABLE won't fail on existing)
-    new_columns = [
+
+    # --- Phase 5: Kiosk fields ---
+    _add_missing_columns(cursor, 'visits', [
         ("id_type", "TEXT DEFAULT ''"),
         ("id_number", "TEXT DEFAULT ''"),
         ("id_card_front_path", "TEXT DEFAULT ''"),
@@ -86,16 +235,9 @@ def init_db():
         ("address", "TEXT DEFAULT ''"),
         ("person_to_meet_email", "TEXT DEFAULT ''"),
         ("person_to_meet_code", "TEXT DEFAULT ''"),
-    ]
-    
-    for col_name, col_def in new_columns:
-        try:
-            cursor.execute(f'ALTER TABLE visits ADD COLUMN {col_name} {col_def}')
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-            
-    # Safely add new columns to regular_users if they don't exist
-    regular_new_columns = [
+    ])
+    # Older whitelist tables predate the ID card fields
+    _add_missing_columns(cursor, 'regular_users', [
         ("id_type", "TEXT DEFAULT ''"),
         ("id_number", "TEXT DEFAULT ''"),
         ("id_card_front_path", "TEXT DEFAULT ''"),
@@ -103,15 +245,9 @@ def init_db():
         ("dob", "TEXT DEFAULT ''"),
         ("address_street", "TEXT DEFAULT ''"),
         ("address_city", "TEXT DEFAULT ''"),
-        ("address_state", "TEXT DEFAULT ''")
-    ]
-    
-    for col_name, col_def in regular_new_columns:
-        try:
-            cursor.execute(f'ALTER TABLE regular_users ADD COLUMN {col_name} {col_def}')
-        except sqlite3.OperationalError:
-            pass # Column already exists
-    
+        ("address_state", "TEXT DEFAULT ''"),
+    ])
+
     # Create staff table (Faculty/Employees)
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS staff (
@@ -125,20 +261,71 @@ def init_db():
         created_at TEXT NOT NULL
     )
     ''')
-    
-    # Add index for name search
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_staff_name ON staff(name)')
 
-    conn.commit()
-    conn.close()
-    
-    # Seed dummy staff if empty
-    seed_staff_data()
+def _migrate_visit_indexes(cursor: sqlite3.Cursor) -> None:
+    # Partial index holding only open visits: the "is this plate inside?" lookup
+    # is a covering seek on (vehicle_no, in_time) -> rowid and stays tiny as history grows.
+    # status is repeated as a key column so SQLite can treat the index as covering.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_visits_open
+        ON visits(vehicle_no, status, in_time) WHERE status = 'inside'
+    ''')
+    # Per-vehicle history, already in in_time order (/api/vehicle/{vehicle_no})
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_vehicle_in_time ON visits(vehicle_no, in_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_in_time ON visits(in_time)')
+    # Superseded by the indexes above
+    cursor.execute('DROP INDEX IF EXISTS idx_visits_vehicle_no')
+    cursor.execute('DROP INDEX IF EXISTS idx_visits_status')
 
-def seed_staff_data():
-    """Inserts dummy staff data if the table is empty."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _migrate_stats(cursor: sqlite3.Cursor) -> None:
+    # Dashboard counters maintained by triggers (see create_stats_schema),
+    # seeded from what is already in the table
+    create_stats_schema(cursor)
+    cursor.execute('DELETE FROM visit_stats')
+    cursor.execute('DELETE FROM vehicles')
+    cursor.execute('''
+        INSERT INTO vehicles (vehicle_no, visit_count, first_seen, last_seen)
+        SELECT vehicle_no, COUNT(*), MIN(in_time), MAX(in_time) FROM visits GROUP BY vehicle_no
+    ''')
+    cursor.execute('''
+        INSERT INTO visit_stats (key, value)
+        SELECT 'total', COUNT(*) FROM visits
+        UNION ALL SELECT 'inside', COUNT(*) FROM visits WHERE status = 'inside'
+        UNION ALL SELECT 'unique_vehicles', COUNT(*) FROM vehicles
+    ''')
+    cursor.execute('''
+        INSERT INTO visit_stats (key, value)
+        SELECT 'type:' || COALESCE(visitor_type, ''), COUNT(*) FROM visits GROUP BY 1
+    ''')
+
+def _migrate_epoch_timestamps(cursor: sqlite3.Cursor) -> None:
+    # epoch ms, source of truth for range queries
+    _add_missing_columns(cursor, 'visits', [("in_ts", "INTEGER"), ("out_ts", "INTEGER")])
+    # in_time/out_time hold local wall-clock time, hence the 'utc' conversion
+    cursor.execute('''
+        UPDATE visits SET in_ts = CAST(strftime('%s', in_time, 'utc') AS INTEGER) * 1000
+        WHERE in_ts IS NULL AND in_time != ''
+    ''')
+    cursor.execute('''
+        UPDATE visits SET out_ts = CAST(strftime('%s', out_time, 'utc') AS INTEGER) * 1000
+        WHERE out_ts IS NULL AND out_time != ''
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_visits_in_ts ON visits(in_ts)')
+
+def _migrate_change_versions(cursor: sqlite3.Cursor) -> None:
+    # Change versions for delta fetches (see create_change_schema)
+    _add_missing_columns(cursor, 'visits', [("row_version", "INTEGER DEFAULT 0")])
+    create_change_schema(cursor)
+    # Existing rows get versions in id order, the counter continues from there
+    cursor.execute('UPDATE visits SET row_version = id WHERE row_version = 0')
+    cursor.execute('''
+        UPDATE db_meta SET value = MAX(value, (SELECT COALESCE(MAX(id), 0) FROM visits))
+        WHERE key = 'visits_version'
+    ''')
+
+def _migrate_seed_staff(cursor: sqlite3.Cursor) -> None:
+    # Seed dummy staff if empty
     cursor.execute('SELECT COUNT(*) FROM staff')
     if cursor.fetchone()[0] == 0:
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -153,146 +340,1228 @@ def seed_staff_data():
             INSERT INTO staff (name, emp_code, department, phone, email, room_no, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         ''', [(s[0], s[1], s[2], s[3], s[4], s[5], now) for s in staff_list])
-        conn.commit()
-    conn.close()
+
+def _migrate_staff_search(cursor: sqlite3.Cursor) -> None:
+    # Full-text index over the staff directory (see STAFF_SEARCH_SCHEMA), filled from existing rows
+    create_staff_search_schema(cursor)
+    cursor.execute("INSERT INTO staff_fts (staff_fts) VALUES ('rebuild')")
+    # Case-insensitive "name starts with" seeks for the top ranking tier
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_staff_name_lower ON staff(lower(name))')
+
+def _migrate_visit_search(cursor: sqlite3.Cursor) -> None:
+    # Trigram index for free-text visit search (see VISIT_SEARCH_SCHEMA), filled from existing rows
+    create_visit_search_schema(cursor)
+    cursor.execute("INSERT INTO visits_fts (visits_fts) VALUES ('rebuild')")
+
+def _migrate_archive_catalog(cursor: sqlite3.Cursor) -> None:
+    # Bookkeeping for visits moved to monthly archive files (see app/api/db_archive.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS visit_archives (
+        partition TEXT PRIMARY KEY,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        min_ts INTEGER,
+        max_ts INTEGER,
+        archived_at TEXT DEFAULT ''
+    )
+    ''')
+    # Which partitions hold a plate's history, so lookups open only those files
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS visit_archive_index (
+        vehicle_no TEXT NOT NULL,
+        partition TEXT NOT NULL,
+        visit_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT DEFAULT '',
+        last_seen TEXT DEFAULT '',
+        PRIMARY KEY (vehicle_no, partition)
+    ) WITHOUT ROWID
+    ''')
+    # Archived share of the dashboard counters ('total', 'type:<visitor_type>')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS visit_archive_stats (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+
+def _migrate_whitelist_version(cursor: sqlite3.Cursor) -> None:
+    # Version counter behind the whitelist cache (see WHITELIST_SCHEMA)
+    create_change_schema(cursor)
+    for statement in WHITELIST_SCHEMA:
+        cursor.execute(statement)
+
+def _migrate_kiosk_locks(cursor: sqlite3.Cursor) -> None:
+    # Kiosk locks and waiting visitors, shared by every server process (see app/api/db_kiosk.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS kiosk_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kiosk TEXT NOT NULL,
+        vehicle_no TEXT NOT NULL,
+        visit_id INTEGER,
+        queued_ts INTEGER NOT NULL,
+        locked_ts INTEGER,
+        expires_ts INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kiosk_queue_kiosk ON kiosk_queue(kiosk, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_kiosk_queue_vehicle ON kiosk_queue(vehicle_no)')
+    # Bumped on every change to a kiosk's queue, for long-polls and event streams
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS kiosks (
+        kiosk TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''')
+
+def _migrate_process_leases(cursor: sqlite3.Cursor) -> None:
+    # Named leases, so a job runs in one server process only (see app/api/db_maintenance.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS process_leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_ts INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+
+def _migrate_gate_replay(cursor: sqlite3.Cursor) -> None:
+    # Last read of each plate per gate, for the debounce window (see record_gate_event)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS gate_reads (
+        gate TEXT NOT NULL,
+        vehicle_no TEXT NOT NULL,
+        read_ts INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        visit_id INTEGER NOT NULL,
+        PRIMARY KEY (gate, vehicle_no)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_gate_reads_ts ON gate_reads(read_ts)')
+    # Stored responses of requests sent with an Idempotency-Key (see app/api/db_idempotency.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key TEXT PRIMARY KEY,
+        scope TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        status_code INTEGER,
+        response TEXT,
+        expires_ts INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_ts)')
+
+def _migrate_idempotency_outcome(cursor: sqlite3.Cursor) -> None:
+    # Result of the write done under a key, committed together with that write
+    _add_missing_columns(cursor, 'idempotency_keys', [('outcome', 'TEXT')])
+
+def _migrate_archive_aware_stats(cursor: sqlite3.Cursor) -> None:
+    # Reseed the dashboard counters over the hot table plus the archive catalog (v9)
+    _rebuild_stats(cursor)
+
+def _migrate_archived_tombstones(cursor: sqlite3.Cursor) -> None:
+    # Marks tombstones of visits moved to an archive partition: gone from the hot table, not deleted
+    _add_missing_columns(cursor, 'visit_deletions', [('archived', 'INTEGER NOT NULL DEFAULT 0')])
+
+# (user_version, description, step) - append only, never renumber or edit an applied step
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "base schema (visits, regular_users, staff)", _migrate_base_schema),
+    (2, "open-visit and history indexes", _migrate_visit_indexes),
+    (3, "trigger-maintained dashboard counters", _migrate_stats),
+    (4, "epoch ms visit timestamps", _migrate_epoch_timestamps),
+    (5, "visit change versions", _migrate_change_versions),
+    (6, "demo staff directory", _migrate_seed_staff),
+    (7, "staff full-text search index", _migrate_staff_search),
+    (8, "visit free-text search index", _migrate_visit_search),
+    (9, "visit archive catalog", _migrate_archive_catalog),
+    (10, "whitelist version counter and plate key index", _migrate_whitelist_version),
+    (11, "kiosk locks and visitor queue", _migrate_kiosk_locks),
+    (12, "process leases", _migrate_process_leases),
+    (13, "gate read debounce and idempotency keys", _migrate_gate_replay),
+    (14, "idempotency key write outcomes", _migrate_idempotency_outcome),
+    (15, "dashboard counters include archived visits", _migrate_archive_aware_stats),
+    (16, "archived visit tombstones", _migrate_archived_tombstones),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version() -> int:
+    """Returns the schema version recorded in the database file."""
+    with db_cursor() as cursor:
+        cursor.execute('PRAGMA user_version')
+        return cursor.fetchone()[0]
+
+def enable_incremental_vacuum() -> bool:
+    """
+    Switches an existing database file to auto_vacuum=INCREMENTAL, so pages freed by deletes
+    can be handed back in small steps (db_maintenance). Takes effect through a full VACUUM
+    that holds the write lock for as long as it takes to rewrite the file, so it is a
+    deliberate step (scripts/enable_incremental_vacuum.py), never done at startup.
+    Returns False if the file already was incremental.
+    """
+    conn = get_db_connection()
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:  # 2 = INCREMENTAL
+            return False
+        size = os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0
+        print(f"[DB] Rewriting {DB_PATH} ({size / 1048576:.1f} MB) with a full VACUUM to enable "
+              "incremental auto-vacuum; writers wait until it finishes")
+        start = time.perf_counter()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        print(f"[DB] Switched to incremental auto-vacuum ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return True
+    finally:
+        conn.close()
+
+def init_db() -> int:
+    """
+    Brings the database schema up to SCHEMA_VERSION. Called once at application
+    startup (and by scripts); on an up-to-date database it is two pragma reads.
+    Returns the resulting schema version.
+    """
+    conn = get_db_connection()
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:  # 2 = INCREMENTAL
+            if conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0] == 0:
+                # A new, empty file: the VACUUM that applies the mode is instant
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+            else:
+                print("[DB] Incremental auto-vacuum is off, free pages are not handed back; "
+                      "run scripts/enable_incremental_vacuum.py in a quiet period to switch it on")
+
+        current = conn.execute('PRAGMA user_version').fetchone()[0]
+        if current >= SCHEMA_VERSION:
+            return current
+
+        cursor = conn.cursor()
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # Another process may have applied it while we waited for the write lock
+                cursor.execute('PRAGMA user_version')
+                if cursor.fetchone()[0] >= version:
+                    cursor.execute('ROLLBACK')
+                    continue
+                start = time.perf_counter()
+                step(cursor)
+                cursor.execute(f'PRAGMA user_version = {version}')
+                cursor.execute('COMMIT')
+            except Exception:
+                cursor.execute('ROLLBACK')
+                raise
+            print(f"[DB] Migrated schema to v{version}: {description} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+        # Collect planner statistics once; PRAGMA optimize keeps them fresh afterwards
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            cursor.execute('ANALYZE')
+        return SCHEMA_VERSION
+    finally:
+        conn.close()
+
+# --- Timestamps ---
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+def _now() -> Tuple[str, int]:
+    """Current local time as (display string, epoch ms)."""
+    now = datetime.now()
+    return now.strftime(TIME_FORMAT), int(now.timestamp() * 1000)
+
+def _to_ms(value: Union[datetime, int, float]) -> int:
+    return int(value.timestamp() * 1000) if isinstance(value, datetime) else int(value)
+
+def parse_time(text: str) -> Optional[int]:
+    """Legacy '%Y-%m-%d %H:%M:%S' local string -> epoch ms (None if blank or unparseable)."""
+    try:
+        return _to_ms(datetime.strptime(text.strip(), TIME_FORMAT))
+    except (AttributeError, ValueError):
+        return None
+
+def format_ts(ts: Optional[int]) -> str:
+    """Epoch ms -> local display string ('' for None)."""
+    return datetime.fromtimestamp(ts / 1000).strftime(TIME_FORMAT) if ts else ""
+
+def _with_display_times(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Derives in_time/out_time and a human duration from in_ts/out_ts."""
+    in_ts, out_ts = row.get("in_ts"), row.get("out_ts")
+    if in_ts:
+        row["in_time"] = format_ts(in_ts)
+    if out_ts:
+        row["out_time"] = format_ts(out_ts)
+        if in_ts:
+            minutes = max(0, out_ts - in_ts) // 60000
+            row["duration"] = f"{minutes // 60}h {minutes % 60}m" if minutes >= 60 else f"{minutes}m"
+    return row
+
+def _display_time_sql(ts_column: str, text_column: str) -> str:
+    # SQLite's 'localtime' and datetime.fromtimestamp both go through the C library's localtime
+    return (f"CASE WHEN {ts_column} THEN strftime('%Y-%m-%d %H:%M:%S', {ts_column} / 1000, 'unixepoch', 'localtime') "
+            f"ELSE {text_column} END")
+
+_MINUTES_SQL = "(MAX(0, out_ts - in_ts) / 60000)"
+DURATION_SQL = f'''
+    CASE WHEN out_ts AND in_ts THEN
+        CASE WHEN {_MINUTES_SQL} >= 60
+             THEN ({_MINUTES_SQL} / 60) || 'h ' || ({_MINUTES_SQL} % 60) || 'm'
+             ELSE {_MINUTES_SQL} || 'm' END
+    END'''
+
+def _display_select(selected: List[str]) -> Tuple[str, List[str]]:
+    """
+    SELECT list and column names for row-tuple listings: the _with_display_times()
+    columns computed by SQLite, so rows can go to JSON as they come out of the cursor.
+    """
+    expressions = []
+    names = list(selected)
+    for column in selected:
+        if column == "in_time" and "in_ts" in selected:
+            expressions.append(f"{_display_time_sql('in_ts', 'in_time')} AS in_time")
+        elif column == "out_time" and "out_ts" in selected:
+            expressions.append(f"{_display_time_sql('out_ts', 'out_time')} AS out_time")
+        else:
+            expressions.append(column)
+    if "in_ts" in selected and "out_ts" in selected:
+        expressions.append(f"{DURATION_SQL} AS duration")
+        names.append("duration")
+    return ", ".join(expressions), names
 
 # --- CRUD Operations for Visits ---
 
+# Latest open visit of a plate; a covering seek on idx_visits_open (bind: vehicle_no)
+OPEN_VISIT_ID_SQL = '''
+    SELECT id FROM visits
+    WHERE vehicle_no = ? AND status = 'inside'
+    ORDER BY in_time DESC LIMIT 1
+'''
+
 def create_visit(vehicle_no: str, image_path: str = "", visitor_type: str = "unknown") -> Optional[int]:
     """Creates a new visit record (entry). Returns the new visit ID."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    in_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    cursor.execute('''
-        INSERT INTO visits (vehicle_no, vehicle_image_path, in_time, visitor_type, status)
-        VALUES (?, ?, ?, ?, 'inside')
-    ''', (vehicle_no, image_path, in_time, visitor_type))
+    in_time, in_ts = _now()
     
-    visit_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return visit_id
+    with db_transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO visits (vehicle_no, vehicle_image_path, in_time, in_ts, visitor_type, status)
+            VALUES (?, ?, ?, ?, ?, 'inside')
+        ''', (vehicle_no, image_path, in_time, in_ts, visitor_type))
+        visit_id = cursor.lastrowid
+        _track_visit(cursor, visit_id, "created")
+        return visit_id
 
-def close_visit(vehicle_no: str) -> bool:
-    """Marks the latest open visit for a vehicle as 'exited'."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    out_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    # Update the most recent 'inside' visit for this vehicle
+# --- Gate Read Debounce ---
+# The same plate read again at the same gate within DEBOUNCE_S (a device retry, the guard
+# capturing twice) is the same event: it gets the first read's outcome instead of toggling
+# the visit again. Reads are kept in gate_reads, so every server process sees them.
+# Only calls that name a gate (the API routes) are debounced.
+DEFAULT_GATE = os.getenv("SMART_GATE_GATE", "main")
+DEBOUNCE_S = float(os.getenv("SMART_GATE_DEBOUNCE_S", "10"))
+
+def _recent_gate_read(cursor: sqlite3.Cursor, gate: Optional[str], vehicle_no: str,
+                      now_ts: int) -> Optional[Tuple[str, int]]:
+    """(action, visit_id) of the plate's read at this gate within the window, if any."""
+    if gate is None or DEBOUNCE_S <= 0:
+        return None
     cursor.execute('''
-        UPDATE visits 
-        SET out_time = ?, status = 'exited'
-        WHERE id = (
-            SELECT id FROM visits
-            WHERE vehicle_no = ? AND status = 'inside'
-            ORDER BY in_time DESC LIMIT 1
-        )
-    ''', (out_time, vehicle_no))
+        SELECT action, visit_id FROM gate_reads WHERE gate = ? AND vehicle_no = ? AND read_ts > ?
+    ''', (gate, vehicle_no, now_ts - int(DEBOUNCE_S * 1000)))
+    row = cursor.fetchone()
+    return tuple(row) if row else None
+
+def _note_gate_read(cursor: sqlite3.Cursor, gate: Optional[str], plates: List[str], action: str,
+                    visit_id: int, now_ts: int) -> None:
+    """Remembers a read that changed a visit (under the plate read and the plate it was matched to)."""
+    if gate is None or DEBOUNCE_S <= 0:
+        return
+    cursor.execute('DELETE FROM gate_reads WHERE read_ts <= ?', (now_ts - int(DEBOUNCE_S * 1000),))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO gate_reads (gate, vehicle_no, read_ts, action, visit_id) VALUES (?, ?, ?, ?, ?)
+    ''', [(gate, plate, now_ts, action, visit_id) for plate in set(plates)])
+
+def close_visit(vehicle_no: str, gate: Optional[str] = None) -> bool:
+    """
+    Marks the latest open visit for a vehicle (or, for a never-seen plate, the inside plate it was misread from) as 'exited'.
+    With a gate, a repeat of an exit read there within DEBOUNCE_S counts as done (True).
+    """
+    out_time, out_ts = _now()
     
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+    with db_transaction() as cursor:
+        recent = _recent_gate_read(cursor, gate, vehicle_no, out_ts)
+        if recent and recent[0] == "exit":
+            print(f"[DEBOUNCE] Exit of {vehicle_no} at gate {gate} already recorded")
+            return True
+        # Update the most recent 'inside' visit for this vehicle
+        cursor.execute(f'''
+            UPDATE visits 
+            SET out_time = ?, out_ts = ?, status = 'exited'
+            WHERE id = ({OPEN_VISIT_ID_SQL})
+            RETURNING id
+        ''', (out_time, out_ts, vehicle_no))
+        rows = cursor.fetchall()  # Drain RETURNING so the statement is finished before commit
+        if not rows:
+            cursor.execute('SELECT 1 FROM vehicles WHERE vehicle_no = ?', (vehicle_no,))
+        match = None if rows or cursor.fetchone() else match_open_plate(vehicle_no)
+        if match:
+            print(f"[FUZZY] Exit read {vehicle_no} matched inside vehicle {match[0]} (cost {match[1]})")
+            cursor.execute(f'''
+                UPDATE visits SET out_time = ?, out_ts = ?, status = 'exited'
+                WHERE id = ({OPEN_VISIT_ID_SQL})
+                RETURNING id
+            ''', (out_time, out_ts, match[0]))
+            rows = cursor.fetchall()
+        if not rows:
+            return False
+        _track_visit(cursor, rows[0][0], "exited")
+        _note_gate_read(cursor, gate, [vehicle_no] + ([match[0]] if match else []), "exit", rows[0][0], out_ts)
+        return True
+
+def record_gate_event(
+        vehicle_no: str,
+        image_path: str = "",
+        details: Optional[Dict[str, Any]] = None,
+        toggle: bool = True,
+        gate: Optional[str] = None
+    ) -> Dict[str, Any]:
+    """
+    Records one plate read at the gate inside a single write transaction.
+    If the vehicle is inside, its open visit is closed (or reported, when toggle=False).
+    Otherwise a new visit is opened as 'worker' or 'visitor' with the given
+    visitor_name/phone/purpose, worker details filling any blanks.
+    A never-seen plate that differs only by look-alike characters (within FUZZY_MAX_COST) from
+    exactly one plate that is inside counts as that vehicle (OCR misread); "match" then holds
+    {"vehicle_no", "cost"} of the plate used.
+    With a gate, a repeat read within DEBOUNCE_S returns the first read's action and visit
+    (as it is now) with "duplicate": True, and changes nothing.
+    Returns {"action": "entry" | "exit" | "already_inside", "visit": {...}, "worker": {...} | None,
+             "match": {...} | None, "duplicate": bool}.
+    """
+    details = details or {}
+    now, now_ts = _now()
+
+    # IMMEDIATE takes the write lock before the open-visit check, so two devices
+    # reading the same plate can't both decide to open a visit
+    with db_transaction(immediate=True) as cursor:
+        recent = _recent_gate_read(cursor, gate, vehicle_no, now_ts)
+        # For new-entry calls (toggle=False) only a repeated entry is a duplicate
+        if recent and (toggle or recent[0] == "entry"):
+            cursor.execute('SELECT * FROM visits WHERE id = ?', (recent[1],))
+            row = cursor.fetchone()
+            if row:
+                print(f"[DEBOUNCE] {vehicle_no} read again at gate {gate}, same {recent[0]}")
+                visit = dict(row)
+                worker = get_regular_user(visit["vehicle_no"]) if visit["visitor_type"] == "worker" else None
+                return {"action": recent[0], "visit": visit, "worker": worker, "match": None, "duplicate": True}
+
+        cursor.execute(f'SELECT * FROM visits WHERE id = ({OPEN_VISIT_ID_SQL})', (vehicle_no,))
+        open_row = cursor.fetchone()
+
+        # A misread of a plate that is inside: use that visit instead of opening a phantom one
+        # (A plate already logged as a vehicle of its own is taken at face value.)
+        match = None
+        if open_row is None:
+            cursor.execute('SELECT 1 FROM vehicles WHERE vehicle_no = ?', (vehicle_no,))
+            if cursor.fetchone() is None:
+                # Another worker may have just let the misread vehicle in
+                sync_occupancy(fresh=True)
+                match = match_open_plate(vehicle_no)
+            if match:
+                cursor.execute(f'SELECT * FROM visits WHERE id = ({OPEN_VISIT_ID_SQL})', (match[0],))
+                open_row = cursor.fetchone()
+                if open_row:
+                    print(f"[FUZZY] Read {vehicle_no} matched inside vehicle {match[0]} (cost {match[1]})")
+                    match = {"vehicle_no": match[0], "cost": match[1]}
+                else:
+                    match = None
+
+        if open_row:
+            visit = dict(open_row)
+            if not toggle:
+                return {"action": "already_inside", "visit": visit, "worker": None, "match": match,
+                        "duplicate": False}
+
+            cursor.execute('''
+                UPDATE visits SET out_time = ?, out_ts = ?, status = 'exited' WHERE id = ?
+            ''', (now, now_ts, visit["id"]))
+            visit.update(out_time=now, out_ts=now_ts, status="exited")
+            _track_visit(cursor, visit["id"], "exited")
+            _note_gate_read(cursor, gate, [vehicle_no, visit["vehicle_no"]], "exit", visit["id"], now_ts)
+            return {"action": "exit", "visit": visit, "worker": None, "match": match, "duplicate": False}
+
+        # fresh: we hold the write lock anyway, so classify against the current whitelist
+        worker = get_regular_user(vehicle_no, fresh=True)
+
+        name = details.get("visitor_name") or ""
+        phone = details.get("phone") or ""
+        purpose = details.get("purpose") or ""
+        if worker:
+            visitor_type = "worker"
+            name = name or worker.get("user_name", "")
+            phone = phone or worker.get("phone", "")
+            purpose = purpose or "Worker Entry"
+        else:
+            visitor_type = "visitor"
+
+        cursor.execute('''
+            INSERT INTO visits (vehicle_no, vehicle_image_path, in_time, in_ts, visitor_type, status,
+                                visitor_name, phone, purpose)
+            VALUES (?, ?, ?, ?, ?, 'inside', ?, ?, ?)
+        ''', (vehicle_no, image_path, now, now_ts, visitor_type, name, phone, purpose))
+
+        visit = {
+            "id": cursor.lastrowid,
+            "vehicle_no": vehicle_no,
+            "vehicle_image_path": image_path,
+            "in_time": now,
+            "in_ts": now_ts,
+            "visitor_type": visitor_type,
+            "status": "inside",
+            "visitor_name": name,
+            "phone": phone,
+            "purpose": purpose,
+        }
+        _track_visit(cursor, visit["id"], "created")
+        _note_gate_read(cursor, gate, [vehicle_no], "entry", visit["id"], now_ts)
+        return {"action": "entry", "visit": visit, "worker": worker, "match": None, "duplicate": False}
 
 def update_visit_details(visit_id: int, name: str, phone: str, purpose: str, id_card_path: str = "") -> bool:
     """Updates visitor details for a specific visit."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        UPDATE visits
-        SET visitor_name = ?, phone = ?, purpose = ?, id_card_image_path = ?
-        WHERE id = ?
-    ''', (name, phone, purpose, id_card_path, visit_id))
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+    with db_transaction() as cursor:
+        cursor.execute('''
+            UPDATE visits
+            SET visitor_name = ?, phone = ?, purpose = ?, id_card_image_path = ?
+            WHERE id = ?
+        ''', (name, phone, purpose, id_card_path, visit_id))
+        if cursor.rowcount == 0:
+            return False
+        _track_visit(cursor, visit_id, "updated")
+        return True
 
 def update_latest_visit_details_by_vehicle(vehicle_no: str, name: str, phone: str, purpose: str) -> bool:
     """Compatibility function: Updates details for the latest open visit of a vehicle."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Subquery to find the ID of the latest 'inside' visit for this vehicle
-    cursor.execute('''
-        UPDATE visits
-        SET visitor_name = ?, phone = ?, purpose = ?
-        WHERE id = (
-            SELECT id FROM visits 
-            WHERE vehicle_no = ? AND status = 'inside' 
-            ORDER BY in_time DESC LIMIT 1
-        )
-    ''', (name, phone, purpose, vehicle_no))
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+    with db_transaction() as cursor:
+        # Subquery to find the ID of the latest 'inside' visit for this vehicle
+        cursor.execute(f'''
+            UPDATE visits
+            SET visitor_name = ?, phone = ?, purpose = ?
+            WHERE id = ({OPEN_VISIT_ID_SQL})
+            RETURNING id
+        ''', (name, phone, purpose, vehicle_no))
+        rows = cursor.fetchall()
+        if not rows:
+            return False
+        _track_visit(cursor, rows[0][0], "updated")
+        return True
+
+# --- Change Versions ---
+
+# Every insert/update of a visit stamps it with the next value of db_meta.visits_version,
+# and deletes leave a tombstone, so clients can ask "what changed since version N?".
+CHANGE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS db_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+    "INSERT OR IGNORE INTO db_meta (key, value) VALUES ('visits_version', 0)",
+    '''
+    CREATE TABLE IF NOT EXISTS visit_deletions (
+        visit_id INTEGER PRIMARY KEY,
+        row_version INTEGER NOT NULL
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_visit_deletions_version ON visit_deletions(row_version)',
+    'CREATE INDEX IF NOT EXISTS idx_visits_row_version ON visits(row_version)',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_version_insert AFTER INSERT ON visits
+    BEGIN
+        UPDATE db_meta SET value = value + 1 WHERE key = 'visits_version';
+        UPDATE visits SET row_version = (SELECT value FROM db_meta WHERE key = 'visits_version')
+            WHERE id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_version_update AFTER UPDATE ON visits
+    WHEN NEW.row_version IS OLD.row_version
+    BEGIN
+        UPDATE db_meta SET value = value + 1 WHERE key = 'visits_version';
+        UPDATE visits SET row_version = (SELECT value FROM db_meta WHERE key = 'visits_version')
+            WHERE id = NEW.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_version_delete AFTER DELETE ON visits
+    BEGIN
+        UPDATE db_meta SET value = value + 1 WHERE key = 'visits_version';
+        INSERT OR REPLACE INTO visit_deletions (visit_id, row_version)
+            VALUES (OLD.id, (SELECT value FROM db_meta WHERE key = 'visits_version'));
+    END
+    ''',
+]
+
+def create_change_schema(cursor: sqlite3.Cursor) -> None:
+    """Creates the version counter, tombstone table and stamping triggers."""
+    for statement in CHANGE_SCHEMA:
+        cursor.execute(statement)
+
+def get_visits_version() -> int:
+    """Returns the current visits change version (increases on every visit write)."""
+    with db_cursor() as cursor:
+        cursor.execute("SELECT value FROM db_meta WHERE key = 'visits_version'")
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+# --- Occupancy Index ---
+# In-memory map of the visits currently inside (status = 'inside'), so "is this plate
+# inside?" and the open-visit list never touch disk. Loaded from the database on first
+# use (the app loads it at startup) and updated by the visit write functions through
+# after_commit(), so it only ever reflects committed rows. Writes made by other
+# processes (server workers, scripts) are caught up by sync_occupancy(): lookups run it
+# at most every CHANGE_CHECK_MS, and it reads only the visit rows and tombstones whose
+# row_version moved past the one the index was built at.
+
+# Largest plate_distance() accepted when a read doesn't match exactly (0 disables fuzzy
+# matching): two look-alike swaps such as O/0 and B/8. Only look-alike swaps ever match
+# (confusions_only): a plate one digit off is usually another car, not a misread.
+FUZZY_MAX_COST = float(os.getenv("SMART_GATE_FUZZY_MAX_COST", "1.0"))
+
+_occupancy_lock = threading.Lock()
+_open_visits: Dict[int, Dict[str, Any]] = {}         # visit id -> open visit row
+_open_by_plate: Dict[str, Set[int]] = {}             # vehicle_no -> open visit ids
+_open_plates = PlateIndex()                          # same plates, for fuzzy matching
+_open_by_type: Dict[str, int] = {}                   # visitor_type -> open visit count
+_occupancy_loaded = False
+_occupancy_version = 0                               # visits_version the index reflects
+_occupancy_synced_at = 0.0
+_sync_lock = threading.Lock()                        # one catch-up read at a time
+_local_versions: Set[int] = set()                    # row versions written by this process
+# A catch-up larger than this reloads the index instead of replaying every change
+SYNC_MAX_CHANGES = 1000
+
+def _occupancy_drop(visit_id: int) -> None:
+    row = _open_visits.pop(visit_id, None)
+    if row is None:
+        return
+    ids = _open_by_plate.get(row["vehicle_no"])
+    if ids is not None:
+        ids.discard(visit_id)
+        if not ids:
+            del _open_by_plate[row["vehicle_no"]]
+            _open_plates.discard(row["vehicle_no"])
+    visitor_type = row.get("visitor_type") or "unknown"
+    _open_by_type[visitor_type] -= 1
+    if not _open_by_type[visitor_type]:
+        del _open_by_type[visitor_type]
+
+def _occupancy_put(row: Dict[str, Any]) -> None:
+    _occupancy_drop(row["id"])
+    _open_visits[row["id"]] = row
+    _open_by_plate.setdefault(row["vehicle_no"], set()).add(row["id"])
+    _open_plates.add(row["vehicle_no"])
+    visitor_type = row.get("visitor_type") or "unknown"
+    _open_by_type[visitor_type] = _open_by_type.get(visitor_type, 0) + 1
+
+def load_occupancy() -> int:
+    """(Re)loads the occupancy index from the 'inside' rows. Returns the number of open visits."""
+    global _occupancy_loaded, _open_plates, _occupancy_version, _occupancy_synced_at
+    with _occupancy_lock:
+        with db_cursor() as cursor:
+            # Version first: a write landing in between is replayed (harmlessly) by the next sync
+            cursor.execute("SELECT value FROM db_meta WHERE key = 'visits_version'")
+            version = cursor.fetchone()[0]
+            cursor.execute("SELECT * FROM visits WHERE status = 'inside'")
+            rows = [dict(row) for row in cursor.fetchall()]
+        _open_visits.clear()
+        _open_by_plate.clear()
+        _open_plates = PlateIndex()
+        _open_by_type.clear()
+        for row in rows:
+            _occupancy_put(row)
+        _occupancy_version, _occupancy_synced_at = version, time.monotonic()
+        _local_versions.clear()
+        _occupancy_loaded = True
+    return len(rows)
+
+def sync_occupancy(fresh: bool = False) -> int:
+    """
+    Applies visit writes committed by other processes since the last catch-up (at most
+    every CHANGE_CHECK_MS unless fresh) and tells the visit listeners about them.
+    Returns the number of changes applied.
+    """
+    global _occupancy_version, _occupancy_synced_at
+    if not _occupancy_loaded:
+        load_occupancy()
+        return 0
+    if get_thread_connection().in_transaction and (not fresh or pending_commit_hooks()):
+        return 0  # Would see this transaction's own uncommitted rows
+    if not fresh and (time.monotonic() - _occupancy_synced_at) * 1000 < CHANGE_CHECK_MS:
+        return 0
+    with _sync_lock:
+        now = time.monotonic()
+        since = _occupancy_version
+        with db_cursor() as cursor:
+            cursor.execute("SELECT value FROM db_meta WHERE key = 'visits_version'")
+            version = cursor.fetchone()[0]
+            if version == since:
+                _occupancy_synced_at = now
+                return 0
+            if version - since > SYNC_MAX_CHANGES:
+                rows = deleted = None
+            else:
+                cursor.execute('SELECT * FROM visits WHERE row_version > ? ORDER BY row_version', (since,))
+                rows = [dict(row) for row in cursor.fetchall()]
+                # Archived visits had exited (not in the index) and are still history, not deletes
+                cursor.execute('SELECT visit_id, row_version FROM visit_deletions WHERE row_version > ? AND NOT archived',
+                               (since,))
+                deleted = cursor.fetchall()
+        if rows is None:
+            print(f"[DB] {version - since} visit changes from other processes, reloading occupancy index")
+            load_occupancy()
+            changes = [("resync", 0, None)]
+        else:
+            changes = []
+            with _occupancy_lock:
+                for row in rows:
+                    if row["row_version"] in _local_versions:
+                        continue  # Already applied by _track_visit
+                    was_inside = row["id"] in _open_visits
+                    if row["status"] == "inside":
+                        _occupancy_put(row)
+                        action = "updated" if was_inside else "created"
+                    else:
+                        _occupancy_drop(row["id"])
+                        action = "exited" if was_inside else "updated"
+                    changes.append((action, row["id"], row))
+                for visit_id, row_version in deleted:
+                    if row_version not in _local_versions:
+                        _occupancy_drop(visit_id)
+                        changes.append(("deleted", visit_id, None))
+                _local_versions.difference_update([v for v in _local_versions if v <= version])
+                _occupancy_version = max(_occupancy_version, version)
+                _occupancy_synced_at = now
+    for action, visit_id, row in changes:
+        for listener in _visit_listeners:
+            listener(action, visit_id, _with_display_times(dict(row)) if row else None)
+    return len(changes)
+
+def _ensure_occupancy() -> None:
+    if _occupancy_loaded:
+        sync_occupancy()
+    else:
+        load_occupancy()
+
+# Told about every committed visit write (this process's at once, others' on the next sync)
+_visit_listeners: List[Callable[[str, int, Optional[Dict[str, Any]]], None]] = []
+
+def add_visit_listener(callback: Callable[[str, int, Optional[Dict[str, Any]]], None]) -> None:
+    """
+    Registers callback(action, visit_id, row) to run after each committed visit write:
+    action is 'created', 'updated', 'exited' or 'deleted'; row (with display times) is None for deletes.
+    Writes of other processes arrive through sync_occupancy(), or as one 'resync' (visit_id 0)
+    when there were too many to replay.
+    Runs on the writing thread, so callbacks must be quick and must not raise.
+    """
+    if callback not in _visit_listeners:
+        _visit_listeners.append(callback)
+
+def _track_visit(cursor: sqlite3.Cursor, visit_id: Optional[int], action: str) -> None:
+    """Re-reads a visit just written in this transaction; updates the index and listeners once it commits."""
+    if visit_id is None or not (_occupancy_loaded or _visit_listeners):
+        return  # Not loaded yet: the first lookup reads the committed state anyway
+    cursor.execute('SELECT * FROM visits WHERE id = ?', (visit_id,))
+    row = cursor.fetchone()
+    row = dict(row) if row else None
+    if row is None:
+        cursor.execute('SELECT row_version FROM visit_deletions WHERE visit_id = ?', (visit_id,))
+        tombstone = cursor.fetchone()
+        row_version = tombstone[0] if tombstone else None
+    else:
+        row_version = row["row_version"]
+
+    def apply() -> None:
+        if _occupancy_loaded:
+            with _occupancy_lock:
+                # So sync_occupancy() doesn't replay it as another process's change
+                if row_version is not None and row_version > _occupancy_version:
+                    _local_versions.add(row_version)
+                if row is not None and row["status"] == "inside":
+                    _occupancy_put(row)
+                else:
+                    _occupancy_drop(visit_id)
+        for listener in _visit_listeners:
+            listener(action, visit_id, _with_display_times(dict(row)) if row else None)
+    # Read by match_open_plate() while the transaction is still open
+    apply.visit = (visit_id, row)
+    after_commit(apply)
+
+def _pending_visits() -> Dict[int, Optional[Dict[str, Any]]]:
+    """Visits written by this thread's open transaction (not in the index until it commits): id -> row or None."""
+    return {hook.visit[0]: hook.visit[1] for hook in pending_commit_hooks() if hasattr(hook, "visit")}
+
+def get_occupancy() -> Dict[str, Any]:
+    """Counts of vehicles currently inside, in total and per visitor_type."""
+    _ensure_occupancy()
+    with _occupancy_lock:
+        return {"inside": len(_open_visits), "by_type": dict(_open_by_type)}
 
 # --- Query Operations for Visits ---
 
+_visit_columns: Optional[List[str]] = None
+
+def get_visit_columns() -> List[str]:
+    """Column names of the visits table (cached; used to validate field projections)."""
+    global _visit_columns
+    if _visit_columns is None:
+        with db_cursor() as cursor:
+            cursor.execute('PRAGMA table_info(visits)')
+            _visit_columns = [row["name"] for row in cursor.fetchall()]
+    return _visit_columns
+
+def list_visits(
+        limit: int = 100,
+        before_id: Optional[int] = None,
+        since_version: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+        as_rows: bool = False
+    ) -> Dict[str, Any]:
+    """
+    Paged / incremental visit listing.
+    - Default: newest first by id; pass next_before_id back as before_id for the next page.
+    - since_version: only rows inserted or modified after that version (oldest change first),
+      plus the ids deleted since then (deleted_ids) and those moved to the archive (archived_ids,
+      still history: see db_archive).
+    - fields: column projection ('id' and 'row_version' are always included).
+    - as_rows: 'columns' plus plain row tuples in 'rows' instead of dicts in 'visits'
+      (display times computed by SQLite, nothing built per row in Python).
+    Raises ValueError for unknown fields.
+    """
+    columns = get_visit_columns()
+    if fields:
+        unknown = [f for f in fields if f not in columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        selected = ["id", "row_version"] + [f for f in fields if f not in ("id", "row_version")]
+    else:
+        selected = columns
+    if as_rows:
+        select_clause, names = _display_select(selected)
+        # Tuples are indexed by position, dicts by name
+        key = names.index
+    else:
+        select_clause = ", ".join(selected)
+        key = lambda name: name
+
+    result: Dict[str, Any] = {}
+    with db_cursor() as cursor:
+        if as_rows:
+            # A cursor-level row factory overrides the connection's sqlite3.Row
+            cursor.row_factory = None
+        # Read the version first: anything committed later will be picked up next poll
+        cursor.execute("SELECT value FROM db_meta WHERE key = 'visits_version'")
+        result["version"] = cursor.fetchone()[0]
+
+        if since_version is not None:
+            cursor.execute(f'''
+                SELECT {select_clause} FROM visits
+                WHERE row_version > ? ORDER BY row_version LIMIT ?
+            ''', (since_version, limit))
+            rows = cursor.fetchall() if as_rows else [_with_display_times(dict(row)) for row in cursor.fetchall()]
+            cursor.execute('SELECT visit_id, archived FROM visit_deletions WHERE row_version > ?', (since_version,))
+            tombstones = cursor.fetchall()
+            result["deleted_ids"] = [row[0] for row in tombstones if not row[1]]
+            result["archived_ids"] = [row[0] for row in tombstones if row[1]]
+            # A full page means there is more: continue from the last version we returned
+            if len(rows) == limit:
+                result["version"] = rows[-1][key("row_version")]
+            result["has_more"] = len(rows) == limit
+        else:
+            if before_id is not None:
+                cursor.execute(f'''
+                    SELECT {select_clause} FROM visits
+                    WHERE id < ? ORDER BY id DESC LIMIT ?
+                ''', (before_id, limit))
+            else:
+                cursor.execute(f'SELECT {select_clause} FROM visits ORDER BY id DESC LIMIT ?', (limit,))
+            rows = cursor.fetchall() if as_rows else [_with_display_times(dict(row)) for row in cursor.fetchall()]
+            result["next_before_id"] = rows[-1][key("id")] if len(rows) == limit else None
+
+    if as_rows:
+        result["columns"], result["rows"] = names, rows
+    else:
+        result["visits"] = rows
+    return result
+
+
 def get_all_visits(limit: int = 100) -> List[Dict[str, Any]]:
     """Retrieves all visits, ordered by entry time descending."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM visits 
-        ORDER BY in_time DESC LIMIT ?
-    ''', (limit,))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT * FROM visits 
+            ORDER BY in_time DESC LIMIT ?
+        ''', (limit,))
+        return [dict(row) for row in cursor.fetchall()]
 
 def get_open_visits() -> List[Dict[str, Any]]:
-    """Retrieves all currently 'inside' visits."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''SELECT * FROM visits WHERE status = 'inside' ORDER BY in_time DESC''')
-    
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    """Retrieves all currently 'inside' visits (from the occupancy index)."""
+    _ensure_occupancy()
+    with _occupancy_lock:
+        rows = [dict(row) for row in _open_visits.values()]
+    return sorted(rows, key=lambda row: (row["in_time"], row["id"]), reverse=True)
 
 def find_open_visit_by_vehicle(vehicle_no: str) -> Optional[Dict[str, Any]]:
-    """Finds an open ('inside') visit for a specific vehicle."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT * FROM visits 
-        WHERE vehicle_no = ? AND status = 'inside' 
-        ORDER BY in_time DESC LIMIT 1
-    ''', (vehicle_no,))
-    
-    row = cursor.fetchone()
-    conn.close()
-    
-    return dict(row) if row else None
+    """Finds the latest open ('inside') visit for a specific vehicle (from the occupancy index)."""
+    _ensure_occupancy()
+    with _occupancy_lock:
+        ids = _open_by_plate.get(vehicle_no)
+        if not ids:
+            return None
+        # Same pick as OPEN_VISIT_ID_SQL: latest in_time, ties go to the newest row
+        return dict(max((_open_visits[visit_id] for visit_id in ids), key=lambda row: (row["in_time"], row["id"])))
+
+def match_open_plate(vehicle_no: str, max_cost: Optional[float] = None) -> Optional[Tuple[str, float]]:
+    """
+    Plate of a vehicle inside that an inexact read most likely meant, as (vehicle_no, cost).
+    Only plates differing from the read by look-alike characters count. None if nothing is
+    close enough or two plates are equally close.
+    """
+    _ensure_occupancy()
+    max_cost = FUZZY_MAX_COST if max_cost is None else max_cost
+    pending = _pending_visits()
+    with _occupancy_lock:
+        if not pending:
+            return _open_plates.best_match(vehicle_no, max_cost, confusions_only=True)
+        # Earlier calls of a write batch (db_writer) opened or closed visits that only reach
+        # the index on commit: re-judge their plates against this transaction's rows
+        found = dict(_open_plates.matches(vehicle_no, max_cost, confusions_only=True))
+        plates = {row["vehicle_no"] for row in pending.values() if row} | \
+                 {_open_visits[visit_id]["vehicle_no"] for visit_id in pending if visit_id in _open_visits}
+        for plate in plates:
+            found.pop(plate, None)
+            still_open = any(visit_id not in pending for visit_id in _open_by_plate.get(plate, ()))
+            opened = any(row and row["vehicle_no"] == plate and row["status"] == "inside" for row in pending.values())
+            if (still_open or opened) and canonical_key(plate) == canonical_key(vehicle_no):
+                cost = plate_distance(vehicle_no, plate)
+                if cost <= max_cost:
+                    found[plate] = cost
+    matches = sorted(found.items(), key=lambda match: (match[1], match[0]))
+    # Same rule as PlateIndex.best_match: no guess between equally close plates
+    if not matches or (len(matches) > 1 and matches[1][1] == matches[0][1]):
+        return None
+    return matches[0]
+
+def get_visits_by_vehicle(vehicle_no: str) -> List[Dict[str, Any]]:
+    """Retrieves the full visit history of a vehicle, newest first."""
+    with db_cursor() as cursor:
+        cursor.execute('SELECT * FROM visits WHERE vehicle_no = ? ORDER BY in_time DESC', (vehicle_no,))
+        return [_with_display_times(dict(row)) for row in cursor.fetchall()]
+
+def get_visits_between(
+        start: Union[datetime, int],
+        end: Union[datetime, int],
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+    """
+    Visits that entered in [start, end), oldest first. Accepts datetimes or epoch ms.
+    An index range scan on in_ts; display times and duration are derived from the timestamps.
+    """
+    sql = 'SELECT * FROM visits WHERE in_ts >= ? AND in_ts < ? ORDER BY in_ts'
+    params: List[Any] = [_to_ms(start), _to_ms(end)]
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+
+    with db_cursor() as cursor:
+        cursor.execute(sql, params)
+        return [_with_display_times(dict(row)) for row in cursor.fetchall()]
+
+# --- Visit Search ---
+
+SEARCH_COLUMNS = ("vehicle_no", "visitor_name", "phone", "company", "person_to_meet")
+
+# Trigram FTS5 index over the searchable visit columns: any substring of 3+ characters
+# (partial plate, part of a name or phone) is an index lookup. External content, kept
+# in sync by triggers that only fire when one of the indexed columns changes.
+VISIT_SEARCH_SCHEMA = [
+    f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS visits_fts USING fts5(
+        {", ".join(SEARCH_COLUMNS)},
+        content='visits', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_fts_insert AFTER INSERT ON visits
+    BEGIN
+        INSERT INTO visits_fts (rowid, {", ".join(SEARCH_COLUMNS)})
+            VALUES (NEW.id, {", ".join("NEW." + c for c in SEARCH_COLUMNS)});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_fts_delete AFTER DELETE ON visits
+    BEGIN
+        INSERT INTO visits_fts (visits_fts, rowid, {", ".join(SEARCH_COLUMNS)})
+            VALUES ('delete', OLD.id, {", ".join("OLD." + c for c in SEARCH_COLUMNS)});
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_fts_update AFTER UPDATE OF {", ".join(SEARCH_COLUMNS)} ON visits
+    BEGIN
+        INSERT INTO visits_fts (visits_fts, rowid, {", ".join(SEARCH_COLUMNS)})
+            VALUES ('delete', OLD.id, {", ".join("OLD." + c for c in SEARCH_COLUMNS)});
+        INSERT INTO visits_fts (rowid, {", ".join(SEARCH_COLUMNS)})
+            VALUES (NEW.id, {", ".join("NEW." + c for c in SEARCH_COLUMNS)});
+    END
+    ''',
+]
+
+def create_visit_search_schema(cursor: sqlite3.Cursor) -> None:
+    """Creates the visits_fts index and its sync triggers."""
+    for statement in VISIT_SEARCH_SCHEMA:
+        cursor.execute(statement)
+
+@contextmanager
+def bulk_visit_load() -> Iterator[sqlite3.Cursor]:
+    """
+    Transaction for inserting many visits at once (CSV imports, benchmark seeding).
+    Row-by-row index maintenance inside one huge transaction is superlinear in FTS5,
+    so the search index is rebuilt once at the end instead.
+    """
+    with db_transaction(immediate=True) as cursor:
+        cursor.execute('DROP TRIGGER IF EXISTS trg_visits_fts_insert')
+        yield cursor
+        cursor.execute("INSERT INTO visits_fts (visits_fts) VALUES ('rebuild')")
+        create_visit_search_schema(cursor)
+
+def search_match(query: str) -> str:
+    """
+    FTS5 MATCH expression for a search: every whitespace-separated term must appear.
+    Raises ValueError for terms shorter than 3 characters.
+    """
+    terms = (query or "").split()
+    if not terms or any(len(term) < 3 for term in terms):
+        raise ValueError("Search terms must be at least 3 characters long")
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+def search_visit_rows(
+        cursor: sqlite3.Cursor,
+        schema: str,
+        match: str,
+        start: Optional[Union[datetime, int]] = None,
+        end: Optional[Union[datetime, int]] = None,
+        status: Optional[str] = None,
+        limit: int = 50,
+        before_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+    """
+    One page of search_visits() against the visits/visits_fts pair of a schema ('main',
+    or an attached archive partition), newest first, raw rows.
+    """
+    sql = f'''
+        SELECT v.* FROM {schema}.visits_fts
+        JOIN {schema}.visits v ON v.id = visits_fts.rowid
+        WHERE visits_fts MATCH ?
+    '''
+    params: List[Any] = [match]
+    time_filter = ''
+    time_params: List[Any] = []
+    if start is not None:
+        time_filter += ' AND in_ts >= ?'
+        time_params.append(_to_ms(start))
+    if end is not None:
+        time_filter += ' AND in_ts < ?'
+        time_params.append(_to_ms(end))
+
+    if time_params:
+        # Narrow the full-text scan to the id span of the time window (a covering
+        # range scan on the in_ts index), so common terms don't walk all history
+        cursor.execute(f'SELECT MIN(id), MAX(id) FROM {schema}.visits WHERE 1 = 1{time_filter}', time_params)
+        low, high = cursor.fetchone()
+        if low is None:
+            return []
+        sql += f' AND visits_fts.rowid BETWEEN ? AND ?{time_filter.replace("in_ts", "v.in_ts")}'
+        params += [low, high, *time_params]
+    if before_id is not None:
+        sql += ' AND visits_fts.rowid < ?'
+        params.append(before_id)
+    if status:
+        sql += ' AND v.status = ?'
+        params.append(status)
+    sql += ' ORDER BY visits_fts.rowid DESC LIMIT ?'
+    params.append(limit)
+
+    cursor.execute(sql, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+def search_visits(
+        query: str,
+        start: Optional[Union[datetime, int]] = None,
+        end: Optional[Union[datetime, int]] = None,
+        status: Optional[str] = None,
+        limit: int = 50,
+        before_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+    """
+    Free-text search of the live visits table over plate, name, phone, company and person
+    to meet, newest first (db_archive.search_history adds the archive partitions).
+    Every whitespace-separated term must appear (as a substring of 3+ characters) in
+    some searchable column. Optional in_ts range [start, end) and status filters;
+    page with before_id = next_before_id of the previous page.
+    Raises ValueError for terms shorter than 3 characters.
+    """
+    match = search_match(query)
+    with db_cursor() as cursor:
+        rows = search_visit_rows(cursor, "main", match, start, end, status, limit, before_id)
+    rows = [_with_display_times(row) for row in rows]
+
+    return {
+        "visits": rows,
+        # A full page means there may be older matches
+        "next_before_id": rows[-1]["id"] if len(rows) == limit else None,
+    }
 
 # --- Regular Users (Whitelist) Operations ---
 
+# Lookups go through a read-through cache keyed on the normalized plate (misses are
+# cached too, most plates at the gate are not on the whitelist). Triggers bump
+# db_meta.whitelist_version on every change to regular_users, from any process. The
+# cache compares it with the version it was filled under at most every
+# WHITELIST_CHECK_MS (so another worker's edit shows up within that window); writes
+# made by this process invalidate it as soon as they commit.
+
+# SQL twin of normalize_plate(), indexed by idx_regular_users_plate_key
+PLATE_KEY_SQL = "upper(replace(replace(vehicle_no, ' ', ''), '-', ''))"
+
+WHITELIST_SCHEMA = [
+    "INSERT OR IGNORE INTO db_meta (key, value) VALUES ('whitelist_version', 0)",
+    f'CREATE INDEX IF NOT EXISTS idx_regular_users_plate_key ON regular_users({PLATE_KEY_SQL})',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_regular_users_version_insert AFTER INSERT ON regular_users
+    BEGIN
+        UPDATE db_meta SET value = value + 1 WHERE key = 'whitelist_version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_regular_users_version_update AFTER UPDATE ON regular_users
+    BEGIN
+        UPDATE db_meta SET value = value + 1 WHERE key = 'whitelist_version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_regular_users_version_delete AFTER DELETE ON regular_users
+    BEGIN
+        UPDATE db_meta SET value = value + 1 WHERE key = 'whitelist_version';
+    END
+    ''',
+]
+
+WHITELIST_CACHE_SIZE = int(os.getenv("SMART_GATE_WHITELIST_CACHE", "4096"))
+WHITELIST_CHECK_MS = float(os.getenv("SMART_GATE_WHITELIST_CHECK_MS", "250"))
+
+_whitelist_lock = threading.Lock()
+_whitelist_cache: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+_whitelist_cache_version: Optional[int] = None
+_whitelist_checked_at = 0.0
+_whitelist_plates: Optional[PlateIndex] = None    # fuzzy index of all whitelisted plates
+_whitelist_plates_version: Optional[int] = None
+_whitelist_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+def get_whitelist_version() -> int:
+    """Returns the whitelist change version (increases on every regular_users write)."""
+    with db_cursor() as cursor:
+        cursor.execute("SELECT value FROM db_meta WHERE key = 'whitelist_version'")
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+def get_whitelist_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/invalidation counters and current size of the whitelist cache."""
+    with _whitelist_lock:
+        lookups = _whitelist_stats["hits"] + _whitelist_stats["misses"]
+        return {**_whitelist_stats, "size": len(_whitelist_cache), "version": _whitelist_cache_version,
+                "hit_rate": round(_whitelist_stats["hits"] / lookups, 4) if lookups else 0.0}
+
 def is_regular_user(vehicle_no: str) -> bool:
     """Checks if a vehicle is in the regular users whitelist."""
     return get_regular_user(vehicle_no) is not None
 
-def get_regular_user(vehicle_no: str) -> Optional[Dict[str, Any]]:
-    """Retrieves regular user details if they exist in the whitelist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM regular_users WHERE vehicle_no = ?', (vehicle_no,))
-    row = cursor.fetchone()
-    conn.close()
-    
+def _invalidate_whitelist_cache() -> None:
+    global _whitelist_cache_version
+    with _whitelist_lock:
+        _whitelist_cache.clear()
+        _whitelist_cache_version = None
+        _whitelist_stats["invalidations"] += 1
+
+def _check_whitelist_version(fresh: bool) -> Optional[int]:
+    """Drops the cache if the whitelist changed since it was filled. Returns the cache version."""
+    global _whitelist_cache_version, _whitelist_checked_at
+    now = time.monotonic()
+    with _whitelist_lock:
+        due = (fresh or _whitelist_cache_version is None
+               or (now - _whitelist_checked_at) * 1000 >= WHITELIST_CHECK_MS)
+        if not due:
+            return _whitelist_cache_version
+    version = get_whitelist_version()
+    with _whitelist_lock:
+        if version != _whitelist_cache_version:
+            if _whitelist_cache_version is not None:
+                _whitelist_stats["invalidations"] += 1
+            _whitelist_cache.clear()
+            _whitelist_cache_version = version
+        _whitelist_checked_at = now
+        return version
+
+def _match_regular_user(vehicle_no: str, version: Optional[int]) -> Optional[Dict[str, Any]]:
+    """Whitelisted plate that differs from the read only by look-alike characters (O/0, B/8...)."""
+    global _whitelist_plates, _whitelist_plates_version
+    with _whitelist_lock:
+        plates = _whitelist_plates if version is not None and version == _whitelist_plates_version else None
+    if plates is None:
+        with db_cursor() as cursor:
+            cursor.execute('SELECT vehicle_no FROM regular_users')
+            plates = PlateIndex(row[0] for row in cursor.fetchall())
+        with _whitelist_lock:
+            if version is not None and version == _whitelist_cache_version:
+                _whitelist_plates, _whitelist_plates_version = plates, version
+
+    # Only look-alike swaps: a worker match skips visitor registration, so no guessing beyond OCR confusions
+    match = plates.best_match(vehicle_no, FUZZY_MAX_COST, confusions_only=True)
+    if match is None:
+        return None
+    with db_cursor() as cursor:
+        cursor.execute('SELECT * FROM regular_users WHERE vehicle_no = ?', (match[0],))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    print(f"[FUZZY] Read {vehicle_no} matched whitelisted vehicle {match[0]} (cost {match[1]})")
+    return dict(row)
+
+def get_regular_user(vehicle_no: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Retrieves regular user details if they exist in the whitelist (cached, see above).
+    A read with no exact match falls back to a plate differing only by look-alike characters.
+    fresh=True checks the whitelist version in the database first, whatever its age.
+    """
+    key = normalize_plate(vehicle_no)
+    version = _check_whitelist_version(fresh)
+
+    with _whitelist_lock:
+        if key in _whitelist_cache:
+            _whitelist_stats["hits"] += 1
+            _whitelist_cache.move_to_end(key)
+            row = _whitelist_cache[key]
+            return dict(row) if row else None
+        _whitelist_stats["misses"] += 1
+
+    with db_cursor() as cursor:
+        cursor.execute(f'''
+            SELECT * FROM regular_users WHERE {PLATE_KEY_SQL} = ? ORDER BY id DESC LIMIT 1
+        ''', (key,))
+        row = cursor.fetchone()
+    row = dict(row) if row else _match_regular_user(vehicle_no, version)
+
+    with _whitelist_lock:
+        # Skip if the cache was invalidated while we were reading: the row may predate the change
+        if version is not None and version == _whitelist_cache_version:
+            _whitelist_cache[key] = row
+            if len(_whitelist_cache) > WHITELIST_CACHE_SIZE:
+                _whitelist_cache.popitem(last=False)
     return dict(row) if row else None
 
 def mark_regular_user(
@@ -310,99 +1579,188 @@ def mark_regular_user(
         address_state: str = ""
     ) -> bool:
     """Adds or updates a vehicle in the regular users whitelist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # Use REPLACE to update if vehicle_no already exists (since it's UNIQUE)
-    cursor.execute('''
-        INSERT OR REPLACE INTO regular_users (
-            vehicle_no, user_name, phone, flat_no, 
+    with db_transaction() as cursor:
+        # Use REPLACE to update if vehicle_no already exists (since it's UNIQUE)
+        cursor.execute('''
+            INSERT OR REPLACE INTO regular_users (
+                vehicle_no, user_name, phone, flat_no, 
+                id_type, id_number, id_card_front_path, id_card_back_path, 
+                dob, address_street, address_city, address_state, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            vehicle_no, name, phone, flat_no, 
             id_type, id_number, id_card_front_path, id_card_back_path, 
             dob, address_street, address_city, address_state, created_at
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        vehicle_no, name, phone, flat_no, 
-        id_type, id_number, id_card_front_path, id_card_back_path, 
-        dob, address_street, address_city, address_state, created_at
-    ))
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+        ))
+        after_commit(_invalidate_whitelist_cache)
+        return cursor.rowcount > 0
 
 def get_all_regular_users() -> List[Dict[str, Any]]:
     """Retrieves all regular users."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM regular_users ORDER BY created_at DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    with db_cursor() as cursor:
+        cursor.execute('SELECT * FROM regular_users ORDER BY created_at DESC')
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_regular_user_rows() -> Tuple[List[str], List[tuple]]:
+    """All regular users as (column names, plain row tuples), in get_all_regular_users() order."""
+    with db_cursor() as cursor:
+        cursor.row_factory = None
+        cursor.execute('SELECT * FROM regular_users ORDER BY created_at DESC')
+        return [column[0] for column in cursor.description], cursor.fetchall()
 
 def delete_regular_user(vehicle_no: str) -> bool:
     """Removes a vehicle from the regular users whitelist."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('DELETE FROM regular_users WHERE vehicle_no = ?', (vehicle_no,))
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+    with db_transaction() as cursor:
+        cursor.execute('DELETE FROM regular_users WHERE vehicle_no = ?', (vehicle_no,))
+        if cursor.rowcount == 0:
+            return False
+        after_commit(_invalidate_whitelist_cache)
+        return True
 
 # --- Dashboard & Statistics ---
 
-def get_stats() -> Dict[str, Any]:
-    """Calculates summary statistics for the dashboard."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    stats = {
-        "total_entries": 0,
-        "currently_inside": 0,
-        "unique_vehicles": 0,
-        "regular_visits": 0,
-        "visitor_visits": 0
-    }
-    
-    # Total Entries
-    cursor.execute('SELECT COUNT(*) FROM visits')
-    stats["total_entries"] = cursor.fetchone()[0]
-    
-    # Currently Inside
-    cursor.execute("SELECT COUNT(*) FROM visits WHERE status = 'inside'")
-    stats["currently_inside"] = cursor.fetchone()[0]
-    
-    # Unique Vehicles
-    cursor.execute('SELECT COUNT(DISTINCT vehicle_no) FROM visits')
-    stats["unique_vehicles"] = cursor.fetchone()[0]
-    
-    # Regular vs Visitor Counts
+# Counters live in visit_stats and are kept current by triggers on visits, so every
+# writer (API, scripts, manual SQL) updates them in the same transaction.
+# Keys: 'total', 'inside', 'unique_vehicles' and 'type:<visitor_type>'.
+# The vehicles table is the per-plate dimension behind 'unique_vehicles'.
+STATS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS visit_stats (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS vehicles (
+        vehicle_no TEXT PRIMARY KEY,
+        visit_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT DEFAULT '',
+        last_seen TEXT DEFAULT ''
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_stats_insert AFTER INSERT ON visits
+    BEGIN
+        INSERT INTO vehicles (vehicle_no, visit_count, first_seen, last_seen)
+            VALUES (NEW.vehicle_no, 0, NEW.in_time, NEW.in_time)
+            ON CONFLICT(vehicle_no) DO NOTHING;
+        UPDATE visit_stats SET value = value + 1
+            WHERE key = 'unique_vehicles'
+            AND (SELECT visit_count FROM vehicles WHERE vehicle_no = NEW.vehicle_no) = 0;
+        UPDATE vehicles SET visit_count = visit_count + 1, last_seen = MAX(last_seen, NEW.in_time)
+            WHERE vehicle_no = NEW.vehicle_no;
+        UPDATE visit_stats SET value = value + 1 WHERE key = 'total';
+        UPDATE visit_stats SET value = value + 1 WHERE key = 'inside' AND NEW.status = 'inside';
+        INSERT INTO visit_stats (key, value) VALUES ('type:' || COALESCE(NEW.visitor_type, ''), 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_stats_delete AFTER DELETE ON visits
+    BEGIN
+        UPDATE vehicles SET visit_count = visit_count - 1 WHERE vehicle_no = OLD.vehicle_no;
+        UPDATE visit_stats SET value = value - 1
+            WHERE key = 'unique_vehicles'
+            AND (SELECT visit_count FROM vehicles WHERE vehicle_no = OLD.vehicle_no) = 0;
+        DELETE FROM vehicles WHERE vehicle_no = OLD.vehicle_no AND visit_count = 0;
+        UPDATE visit_stats SET value = value - 1 WHERE key = 'total';
+        UPDATE visit_stats SET value = value - 1 WHERE key = 'inside' AND OLD.status = 'inside';
+        UPDATE visit_stats SET value = value - 1 WHERE key = 'type:' || COALESCE(OLD.visitor_type, '');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_stats_status AFTER UPDATE OF status ON visits
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        UPDATE visit_stats SET value = value + (NEW.status = 'inside') - (OLD.status = 'inside')
+            WHERE key = 'inside';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_stats_type AFTER UPDATE OF visitor_type ON visits
+    WHEN OLD.visitor_type IS NOT NEW.visitor_type
+    BEGIN
+        UPDATE visit_stats SET value = value - 1 WHERE key = 'type:' || COALESCE(OLD.visitor_type, '');
+        INSERT INTO visit_stats (key, value) VALUES ('type:' || COALESCE(NEW.visitor_type, ''), 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_visits_stats_plate AFTER UPDATE OF vehicle_no ON visits
+    WHEN OLD.vehicle_no IS NOT NEW.vehicle_no
+    BEGIN
+        UPDATE vehicles SET visit_count = visit_count - 1 WHERE vehicle_no = OLD.vehicle_no;
+        UPDATE visit_stats SET value = value - 1
+            WHERE key = 'unique_vehicles'
+            AND (SELECT visit_count FROM vehicles WHERE vehicle_no = OLD.vehicle_no) = 0;
+        DELETE FROM vehicles WHERE vehicle_no = OLD.vehicle_no AND visit_count = 0;
+        INSERT INTO vehicles (vehicle_no, visit_count, first_seen, last_seen)
+            VALUES (NEW.vehicle_no, 0, NEW.in_time, NEW.in_time)
+            ON CONFLICT(vehicle_no) DO NOTHING;
+        UPDATE visit_stats SET value = value + 1
+            WHERE key = 'unique_vehicles'
+            AND (SELECT visit_count FROM vehicles WHERE vehicle_no = NEW.vehicle_no) = 0;
+        UPDATE vehicles SET visit_count = visit_count + 1, last_seen = MAX(last_seen, NEW.in_time)
+            WHERE vehicle_no = NEW.vehicle_no;
+    END
+    ''',
+]
+
+def create_stats_schema(cursor: sqlite3.Cursor) -> None:
+    """Creates the counter tables and their maintenance triggers."""
+    for statement in STATS_SCHEMA:
+        cursor.execute(statement)
+
+def _rebuild_stats(cursor: sqlite3.Cursor) -> None:
+    """Counters cover the whole history: hot rows plus the archive catalog."""
+    cursor.execute('DELETE FROM visit_stats')
+    cursor.execute('DELETE FROM vehicles')
+    cursor.execute('''
+        INSERT INTO vehicles (vehicle_no, visit_count, first_seen, last_seen)
+        SELECT vehicle_no, SUM(n), MIN(first_seen), MAX(last_seen) FROM (
+            SELECT vehicle_no, COUNT(*) AS n, MIN(in_time) AS first_seen, MAX(in_time) AS last_seen
+            FROM visits GROUP BY vehicle_no
+            UNION ALL SELECT vehicle_no, visit_count, first_seen, last_seen FROM visit_archive_index
+        ) GROUP BY vehicle_no
+    ''')
     cursor.execute('''
-        SELECT visitor_type, COUNT(*) 
-        FROM visits 
-        GROUP BY visitor_type
+        INSERT INTO visit_stats (key, value)
+        SELECT key, SUM(value) FROM (
+            SELECT 'total' AS key, COUNT(*) AS value FROM visits
+            UNION ALL SELECT 'type:' || COALESCE(visitor_type, ''), COUNT(*) FROM visits GROUP BY 1
+            UNION ALL SELECT key, value FROM visit_archive_stats
+        ) GROUP BY key
+        UNION ALL SELECT 'inside', COUNT(*) FROM visits WHERE status = 'inside'
+        UNION ALL SELECT 'unique_vehicles', COUNT(*) FROM vehicles
     ''')
-    type_counts = dict(cursor.fetchall())
-    stats["regular_visits"] = type_counts.get("regular", 0)
-    stats["visitor_visits"] = type_counts.get("visitor", 0)
+
+def rebuild_stats() -> Dict[str, Any]:
+    """Recomputes visit_stats and vehicles from visits and the archive catalog (reconciliation). Returns the new stats."""
+    with db_transaction(immediate=True) as cursor:
+        _rebuild_stats(cursor)
+    return get_stats()
+
+def get_stats() -> Dict[str, Any]:
+    """Returns summary statistics for the dashboard from the trigger-maintained counters."""
+    with db_cursor() as cursor:
+        cursor.execute('SELECT key, value FROM visit_stats')
+        counters = dict(cursor.fetchall())
     
-    conn.close()
-    return stats
+    return {
+        "total_entries": counters.get("total", 0),
+        "currently_inside": counters.get("inside", 0),
+        "unique_vehicles": counters.get("unique_vehicles", 0),
+        "regular_visits": counters.get("type:regular", 0),
+        "visitor_visits": counters.get("type:visitor", 0)
+    }
 
 # --- Phase 5: Kiosk-specific operations ---
 
 def update_kiosk_visit_details(vehicle_no: str, details: Dict[str, Any]) -> bool:
     """Updates all kiosk visitor details for the latest open visit of a vehicle."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     # Build SET clause dynamically from provided details
     allowed_fields = [
         'visitor_name', 'phone', 'purpose', 'id_type', 'id_number',
@@ -420,66 +1778,116 @@ def update_kiosk_visit_details(vehicle_no: str, details: Dict[str, Any]) -> bool
             values.append(details[field])
     
     if not set_parts:
-        conn.close()
         return False
     
     set_clause = ", ".join(set_parts)
     values.append(vehicle_no)
     
-    cursor.execute(f'''
-        UPDATE visits
-        SET {set_clause}
-        WHERE id = (
-            SELECT id FROM visits 
-            WHERE vehicle_no = ? AND status = 'inside' 
-            ORDER BY in_time DESC LIMIT 1
-        )
-    ''', values)
-    
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+    with db_transaction() as cursor:
+        cursor.execute(f'''
+            UPDATE visits
+            SET {set_clause}
+            WHERE id = ({OPEN_VISIT_ID_SQL})
+            RETURNING id
+        ''', values)
+        rows = cursor.fetchall()
+        if not rows:
+            return False
+        _track_visit(cursor, rows[0][0], "updated")
+        return True
 
 # --- Phase 7: Staff/Faculty search ---
 
-def search_staff(query: str) -> List[Dict[str, Any]]:
-    """Searches for staff members by name or department."""
-    if not query:
+# External-content FTS5 index over the staff directory, kept in sync by triggers.
+# prefix='1 2 3' stores short prefixes so keystroke-by-keystroke lookups stay index seeks.
+STAFF_SEARCH_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS staff_fts USING fts5(
+        name, department, emp_code,
+        content='staff', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_staff_fts_insert AFTER INSERT ON staff
+    BEGIN
+        INSERT INTO staff_fts (rowid, name, department, emp_code)
+            VALUES (NEW.id, NEW.name, NEW.department, NEW.emp_code);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_staff_fts_delete AFTER DELETE ON staff
+    BEGIN
+        INSERT INTO staff_fts (staff_fts, rowid, name, department, emp_code)
+            VALUES ('delete', OLD.id, OLD.name, OLD.department, OLD.emp_code);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_staff_fts_update AFTER UPDATE ON staff
+    BEGIN
+        INSERT INTO staff_fts (staff_fts, rowid, name, department, emp_code)
+            VALUES ('delete', OLD.id, OLD.name, OLD.department, OLD.emp_code);
+        INSERT INTO staff_fts (rowid, name, department, emp_code)
+            VALUES (NEW.id, NEW.name, NEW.department, NEW.emp_code);
+    END
+    ''',
+]
+
+def create_staff_search_schema(cursor: sqlite3.Cursor) -> None:
+    """Creates the staff_fts index and its sync triggers."""
+    for statement in STAFF_SEARCH_SCHEMA:
+        cursor.execute(statement)
+
+def _fts_prefix_query(query: str) -> str:
+    """'milan j' -> '"milan"* "j"*' (every word must match as a prefix). Empty if no words."""
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", query))
+
+def search_staff(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Searches staff by word prefixes of name, department or emp_code.
+    Results are ranked in tiers: name starts with the query (alphabetical), then
+    every word matches the start of a name word, then department/code matches.
+    Each tier is a LIMITed index lookup, so one-letter queries stay cheap.
+    """
+    match = _fts_prefix_query(query or "")
+    if not match:
         return []
-    
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    search_term = f"%{query}%"
-    cursor.execute('''
-        SELECT * FROM staff 
-        WHERE name LIKE ? OR department LIKE ? OR emp_code LIKE ?
-        LIMIT 10
-    ''', (search_term, search_term, search_term))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+
+    prefix = query.strip().lower()
+    results: List[Dict[str, Any]] = []
+    with db_cursor() as cursor:
+        cursor.execute('''
+            SELECT * FROM staff WHERE lower(name) >= ? AND lower(name) < ?
+            ORDER BY lower(name) LIMIT ?
+        ''', (prefix, prefix + "\uffff", limit))
+        results.extend(dict(row) for row in cursor.fetchall())
+
+        for expression in (f"name : ({match})", match):
+            if len(results) >= limit:
+                break
+            seen = [row["id"] for row in results]
+            cursor.execute(f'''
+                SELECT staff.* FROM staff_fts
+                JOIN staff ON staff.id = staff_fts.rowid
+                WHERE staff_fts MATCH ? AND staff_fts.rowid NOT IN ({",".join("?" * len(seen))})
+                LIMIT ?
+            ''', (expression, *seen, limit - len(results)))
+            results.extend(dict(row) for row in cursor.fetchall())
+    return results
 
 def get_staff_by_id(staff_id: int) -> Optional[Dict[str, Any]]:
     """Retrieves specific staff details."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM staff WHERE id = ?', (staff_id,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute('SELECT * FROM staff WHERE id = ?', (staff_id,))
+        row = cursor.fetchone()
     return dict(row) if row else None
 
 def delete_visit(visit_id: int) -> bool:
     """Deletes a visit entry by ID. Used for dashboard cleanup."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM visits WHERE id = ?", (visit_id,))
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
-
-# Initialize the DB schema when this module is imported
-init_db()
+    with db_transaction() as cursor:
+        cursor.execute("DELETE FROM visits WHERE id = ?", (visit_id,))
+        if cursor.rowcount == 0:
+            return False
+        _track_visit(cursor, visit_id, "deleted")
+        return True
+
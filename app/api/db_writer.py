@@ -0,0 +1,129 @@
+"""
+Group-Commit Write Queue
+Opt-in write-behind path for burst gate traffic (SMART_GATE_WRITE_QUEUE=1).
+A single writer thread drains queued db_sqlite write calls and runs each batch in
+one BEGIN IMMEDIATE transaction, so a rush of gate events costs one commit and one
+write-lock acquisition per batch instead of per call. Every call still gets its own
+Future, resolved with the function's return value (e.g. the new visit id) only after
+the batch has committed.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from . import db_sqlite
+
+WRITE_QUEUE_ENABLED = os.getenv("SMART_GATE_WRITE_QUEUE", "0") == "1"
+# Upper bound on calls per transaction, keeps each batch (and the write lock) short
+MAX_BATCH = int(os.getenv("SMART_GATE_WRITE_BATCH", "64"))
+# Extra time to wait for more calls once a batch has started; 0 = take whatever is queued.
+# Worth raising only when commits are expensive (e.g. synchronous=FULL on slow storage).
+LINGER_MS = float(os.getenv("SMART_GATE_WRITE_LINGER_MS", "0"))
+
+_Item = Tuple[Callable[..., Any], tuple, dict, Future]
+
+_queue: "queue.Queue[Optional[_Item]]" = queue.Queue()
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+_stats = {"calls": 0, "batches": 0, "max_batch": 0}
+
+
+def submit_write(fn: Callable[..., Any], *args, **kwargs) -> Future:
+    """Queues a db_sqlite write call; the Future resolves once its batch has committed."""
+    _ensure_writer()
+    future: Future = Future()
+    _queue.put((fn, args, kwargs, future))
+    return future
+
+
+def _ensure_writer() -> None:
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _thread.start()
+
+
+def stop_write_queue() -> None:
+    """Commits everything already queued, then stops the writer thread (application shutdown)."""
+    global _thread
+    if _thread is None:
+        return
+    _queue.put(None)
+    _thread.join()
+    _thread = None
+
+
+def get_write_queue_stats() -> dict:
+    """Calls and batches committed so far, plus the current backlog."""
+    return {**_stats, "pending": _queue.qsize(),
+            "avg_batch": round(_stats["calls"] / _stats["batches"], 2) if _stats["batches"] else 0}
+
+
+def _collect(first: _Item) -> Tuple[List[_Item], bool]:
+    """Gathers a batch behind the first call. Returns (batch, stop_requested)."""
+    batch = [first]
+    deadline = time.monotonic() + LINGER_MS / 1000
+    while len(batch) < MAX_BATCH:
+        try:
+            timeout = deadline - time.monotonic()
+            item = _queue.get(timeout=timeout) if timeout > 0 else _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            return batch, True
+        batch.append(item)
+    return batch, False
+
+
+def _run_batch(batch: List[_Item]) -> None:
+    results: List[Tuple[Future, Any, Optional[BaseException]]] = []
+    try:
+        with db_sqlite.db_transaction(immediate=True) as cursor:
+            hooks = db_sqlite.pending_commit_hooks()
+            for fn, args, kwargs, future in batch:
+                # A failing call only undoes its own writes (and commit hooks), the rest of the batch still commits
+                cursor.execute('SAVEPOINT write_call')
+                mark = len(hooks)
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_call')
+                    del hooks[mark:]
+                    results.append((future, None, e))
+                else:
+                    results.append((future, result, None))
+                cursor.execute('RELEASE write_call')
+    except Exception as e:
+        print(f"[ERROR] Write batch of {len(batch)} failed to commit: {e}")
+        for _, _, _, future in batch:
+            future.set_exception(e)
+        return
+
+    _stats["calls"] += len(batch)
+    _stats["batches"] += 1
+    _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+    for future, result, error in results:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+
+def _writer_loop() -> None:
+    try:
+        while True:
+            first = _queue.get()
+            if first is None:
+                break
+            batch, stop = _collect(first)
+            _run_batch(batch)
+            if stop:
+                break
+    finally:
+        db_sqlite.close_thread_connection()
@@ -0,0 +1,39 @@
+"""
+Fast JSON
+orjson-backed encoding for API responses, falling back to the stdlib json module when
+orjson isn't installed. orjson writes dicts, lists and tuples straight to UTF-8 bytes in C,
+so sqlite row tuples (format=rows listings) go to JSON without becoming dicts first.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    # Same text jsonable_encoder produces for the odd value that isn't plain JSON
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps() (the app's default response class)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
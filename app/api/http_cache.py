@@ -0,0 +1,163 @@
+"""
+Conditional GET
+Strong ETags for the polled read endpoints (/api/vehicles, /api/stats, /api/workers)
+derived from db_sqlite.get_change_version(). A request whose If-None-Match still
+matches is answered 304 before any query runs. Otherwise the serialized body is
+cached per (URL, version) for a short while, so dashboards polling the same URL
+between two writes share one query and one serialization.
+
+Bodies of COMPRESS_MIN_BYTES or more are sent brotli (if the brotli module is installed)
+or gzip compressed when the client accepts it. Each encoding is produced once per cached
+body, so polling clients pay the compression only after a write. Serializing and compressing
+bodies of OFFLOAD_MIN_BYTES or more runs on a worker thread rather than the event loop.
+"""
+import asyncio
+import functools
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from . import db_sqlite
+from .db_async import run_db
+from .fast_json import dumps
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_CACHE_SIZE = 256
+# Entries only go stale with the version; the TTL just bounds memory for one-off URLs
+RESPONSE_CACHE_TTL_S = 30
+
+# Smaller bodies go out as they are: compression would save less than it costs
+COMPRESS_MIN_BYTES = int(os.getenv("SMART_GATE_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("SMART_GATE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("SMART_GATE_BROTLI_QUALITY", "5"))
+# Bodies this large (judged by the URL's last body) are encoded off the event loop
+OFFLOAD_MIN_BYTES = int(os.getenv("SMART_GATE_OFFLOAD_MIN_BYTES", "32768"))
+# Preferred first
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+# url -> (version, expires, {encoding: body}); "identity" is the uncompressed body
+_cache: "OrderedDict[str, Tuple[str, float, Dict[str, bytes]]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"not_modified": 0, "hits": 0, "misses": 0, "compressed": 0, "offloaded": 0}
+
+
+def _etag(version: str, encoding: str) -> str:
+    # Each encoding is its own representation; all of them revalidate against the version
+    return f'"{version}"' if encoding == "identity" else f'"{version}-{encoding}"'
+
+
+def _matches(if_none_match: str, version: str) -> bool:
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        if tag == "*" or tag.split("-", 1)[0] == version:
+            return True
+    return False
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    """Best of ENCODINGS the Accept-Encoding header allows, else 'identity'."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+async def _encode(size_hint: int, fn: Callable[..., bytes], *args) -> bytes:
+    """fn(*args) inline for small bodies, else on the default executor (not the DB threads)."""
+    if size_hint < OFFLOAD_MIN_BYTES:
+        return fn(*args)
+    _stats["offloaded"] += 1
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+
+def _response(bodies: Dict[str, bytes], encoding: str, version: str) -> Response:
+    headers = {"ETag": _etag(version, encoding), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(bodies[encoding], media_type="application/json", headers=headers)
+
+
+async def conditional_json(request: Request, build: Callable[[], Awaitable[Dict[str, Any]]]) -> Response:
+    """
+    JSON response for build() tagged with the data version: 304 if the client already has it,
+    else the cached body for this URL, version and encoding, else build() and cache it.
+    """
+    # Read the version before the data: a write in between only makes the body newer than its tag
+    version = await run_db(db_sqlite.get_change_version)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if _matches(request.headers.get("if-none-match", ""), version):
+        _stats["not_modified"] += 1
+        return Response(status_code=304, headers={"ETag": _etag(version, encoding), "Cache-Control": "no-cache",
+                                                  "Vary": "Accept-Encoding"})
+
+    key = f"{request.url.path}?{request.url.query}"
+    now = time.monotonic()
+    bodies: Optional[Dict[str, bytes]] = None
+    # A URL seen for the first time may return anything, so it is treated as large
+    size_hint = OFFLOAD_MIN_BYTES
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            size_hint = len(entry[2]["identity"])
+        if entry is not None and entry[0] == version and entry[1] > now:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            bodies = entry[2]
+            if encoding in bodies:
+                return _response(bodies, encoding, version)
+
+    if bodies is None:
+        bodies = {"identity": await _encode(size_hint, dumps, await build())}
+        with _lock:
+            _stats["misses"] += 1
+            _cache[key] = (version, now + RESPONSE_CACHE_TTL_S, bodies)
+            _cache.move_to_end(key)
+            while len(_cache) > RESPONSE_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    if encoding != "identity":
+        if len(bodies["identity"]) < COMPRESS_MIN_BYTES:
+            encoding = "identity"
+        else:
+            compressed = await _encode(len(bodies["identity"]), compress, bodies["identity"], encoding)
+            with _lock:
+                _stats["compressed"] += 1
+                bodies[encoding] = compressed
+    return _response(bodies, encoding, version)
+
+
+async def get_response_cache_stats() -> Dict[str, Any]:
+    """304s served, body cache hits/misses, compressions and entries held."""
+    # Read on a DB thread and outside _lock, which conditional_json callers wait on
+    version = await run_db(db_sqlite.get_change_version)
+    with _lock:
+        return {**_stats, "entries": len(_cache), "version": version,
+                "encodings": list(ENCODINGS), "compress_min_bytes": COMPRESS_MIN_BYTES,
+                "offload_min_bytes": OFFLOAD_MIN_BYTES}
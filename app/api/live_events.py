@@ -0,0 +1,252 @@
+"""
+Live Events
+Server-Sent Events channel (GET /api/events) that pushes visit changes to open
+dashboards instead of having every browser re-poll /api/vehicles and /api/stats.
+
+Committed visit writes reach this module through db_sqlite.add_visit_listener (any
+thread), are handed to the event loop and fanned out to each subscriber's queue.
+Counter updates are coalesced: one get_stats() read per burst of changes, shared
+by all subscribers, so an idle gate costs nothing however many dashboards are open.
+Visits written by other server processes (gunicorn workers) are picked up by a watcher
+that runs db_sqlite.sync_occupancy() every CHANGE_CHECK_MS while anyone is subscribed.
+
+Kiosk locks can also change in another server process or simply expire, so kiosk
+screens follow the stored state instead (state_stream / wait_for_change): a local event
+re-reads it at once, otherwise it is re-read every second or so.
+
+Open streams never finish on their own, and uvicorn waits for every response to finish
+before it shuts down (or reloads); a shutdown signal therefore ends them first.
+"""
+import asyncio
+import signal
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from . import db_sqlite
+from .db_async import run_db
+from .fast_json import dumps
+
+# Events buffered per subscriber; a client that falls further behind is told to resync
+QUEUE_SIZE = 256
+# Comment line sent on idle streams so proxies keep them open and dead clients are noticed
+KEEPALIVE_S = 15
+# Visit changes within this window share one stats push
+STATS_DELAY_S = 0.25
+
+_Event = Tuple[str, Dict[str, Any]]
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_subscribers: Dict["asyncio.Queue[_Event]", Optional[Set[str]]] = {}
+_listening = False
+_listen_lock = threading.Lock()
+_stats_pending = False
+_watcher: Optional["asyncio.Future[None]"] = None
+# How often the watcher looks for visit writes of other processes
+SYNC_S = db_sqlite.CHANGE_CHECK_MS / 1000
+
+
+def subscribe(topics: Optional[Iterable[str]] = None) -> "asyncio.Queue[_Event]":
+    """Registers a subscriber (call on the event loop). topics limits the event names it receives."""
+    global _loop
+    _loop = asyncio.get_running_loop()
+    _ensure_listener()
+    queue: "asyncio.Queue[_Event]" = asyncio.Queue(maxsize=QUEUE_SIZE)
+    _subscribers[queue] = set(topics) if topics else None
+    _ensure_watcher()
+    return queue
+
+
+def unsubscribe(queue: "asyncio.Queue[_Event]") -> None:
+    _subscribers.pop(queue, None)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+def publish(event: str, data: Dict[str, Any]) -> None:
+    """Sends an event to every subscriber. Safe to call from any thread; a no-op while nobody listens."""
+    loop = _loop
+    if not _subscribers or loop is None or loop.is_closed():
+        return
+    loop.call_soon_threadsafe(_fan_out, event, data)
+
+
+def _fan_out(event: str, data: Dict[str, Any]) -> None:
+    for queue, topics in list(_subscribers.items()):
+        if topics is not None and event not in topics and event != "close":
+            # A 'resync' stands for visit events too many to send one by one
+            if not (event == "resync" and "visit" in topics):
+                continue
+        try:
+            queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # Too slow to keep up: drop its backlog, it refetches what it missed
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait((event, data) if event == "close" else ("resync", {}))
+    if event in ("visit", "resync"):
+        _schedule_stats()
+
+
+def _schedule_stats() -> None:
+    global _stats_pending
+    if _stats_pending:
+        return
+    _stats_pending = True
+    asyncio.get_running_loop().call_later(STATS_DELAY_S, lambda: asyncio.ensure_future(_push_stats()))
+
+
+async def _push_stats() -> None:
+    global _stats_pending
+    _stats_pending = False
+    try:
+        stats = await run_db(db_sqlite.get_stats)
+    except Exception as e:
+        print(f"[ERROR] Live stats push failed: {e}")
+        return
+    _fan_out("stats", stats)
+
+
+def _on_visit_change(action: str, visit_id: int, row: Optional[Dict[str, Any]]) -> None:
+    if not _subscribers:
+        return
+    if action == "resync":
+        publish("resync", {})
+    else:
+        publish("visit", {"action": action, "id": visit_id, "visit": row})
+
+
+def _ensure_listener() -> None:
+    global _listening
+    with _listen_lock:
+        if not _listening:
+            db_sqlite.add_visit_listener(_on_visit_change)
+            _watch_shutdown()
+            _listening = True
+
+
+def _ensure_watcher() -> None:
+    global _watcher
+    if _watcher is None or _watcher.done() or _watcher.get_loop() is not asyncio.get_running_loop():
+        _watcher = asyncio.ensure_future(_watch_other_processes())
+
+
+async def _watch_other_processes() -> None:
+    # Stops with the last subscriber; the next subscribe() starts it again
+    while _subscribers:
+        await asyncio.sleep(SYNC_S)
+        try:
+            await run_db(db_sqlite.sync_occupancy)
+        except Exception as e:
+            print(f"[ERROR] Visit sync failed: {e}")
+
+
+def close_streams() -> None:
+    """Ends every open event stream (clients reconnect to the next server)."""
+    loop = _loop
+    if loop is not None and not loop.is_closed():
+        loop.call_soon_threadsafe(_fan_out, "close", {})
+
+
+def _watch_shutdown() -> None:
+    # Chain onto the server's own SIGINT/SIGTERM handlers (only possible on the main thread)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            close_streams()
+            previous(signum, frame)
+        signal.signal(sig, handler)
+
+
+async def wait_for_change(read_state: Callable[[], Awaitable[Dict[str, Any]]], topic: str, since: int,
+                          timeout: float, check_s: float) -> Dict[str, Any]:
+    """
+    Long-poll on a versioned piece of shared state: read_state() as soon as its 'version'
+    differs from since, else after timeout seconds (or on shutdown) the unchanged state.
+    A topic event from this process triggers an immediate re-read; without one it is
+    re-read every check_s, which picks up changes made by other processes.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    # Subscribe before the first read, so a change in between is not missed
+    queue = subscribe((topic,))
+    try:
+        state = await read_state()
+        while state["version"] == since:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                event, _ = await asyncio.wait_for(queue.get(), min(remaining, check_s))
+            except asyncio.TimeoutError:
+                pass
+            else:
+                if event == "close":
+                    break
+            state = await read_state()
+        return state
+    finally:
+        unsubscribe(queue)
+
+
+def format_event(event: str, data: Dict[str, Any]) -> str:
+    """One SSE message: 'event: <name>' plus the JSON payload."""
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+async def event_stream(topics: Optional[Iterable[str]] = None,
+                       hello: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """
+    SSE body for one client: a 'hello' event first (clients catch up on anything they
+    missed when they see it), then the subscribed events as they happen.
+    """
+    queue = subscribe(topics)
+    try:
+        yield format_event("hello", hello or {})
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event == "close":
+                break
+            yield format_event(event, data)
+    finally:
+        unsubscribe(queue)
+
+
+async def state_stream(read_state: Callable[[], Awaitable[Dict[str, Any]]], topic: str,
+                       check_s: float) -> AsyncIterator[str]:
+    """
+    SSE body following a versioned piece of shared state (see wait_for_change): 'hello'
+    with the current state, then a topic event with the new state whenever its version moves.
+    """
+    queue = subscribe((topic,))
+    try:
+        state = await read_state()
+        yield format_event("hello", state)
+        quiet = 0.0
+        while True:
+            try:
+                event, _ = await asyncio.wait_for(queue.get(), check_s)
+            except asyncio.TimeoutError:
+                quiet += check_s
+            else:
+                if event == "close":
+                    break
+            latest = await read_state()
+            if latest["version"] != state["version"]:
+                state, quiet = latest, 0.0
+                yield format_event(topic, state)
+            elif quiet >= KEEPALIVE_S:
+                quiet = 0.0
+                yield ": keepalive\n\n"
+    finally:
+        unsubscribe(queue)
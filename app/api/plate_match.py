@@ -0,0 +1,163 @@
+"""
+Fuzzy Plate Matching
+Finds the stored plate an OCR read most likely meant, so one misread character does
+not open a phantom visit or turn a whitelisted worker into a visitor.
+
+Plates are compared on confusion-normalized keys: characters OCR mixes up (O/0, I/1,
+B/8, S/5...) collapse to one symbol, so those misreads match exactly. Anything else
+within one edit of a key is found through a deletion index (every key minus one
+character), which keeps lookups to a few dict probes regardless of how many plates
+are indexed. Candidates are ranked by a weighted edit cost on the plates themselves.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+# Same confusions the device corrects for (NUM_TO_LETTER / LETTER_TO_NUM in
+# app/device/anpr_local.py), grouped into classes of look-alike characters
+CONFUSION_CLASSES = ["O0DQ", "I1", "Z2", "S5", "B8", "G6"]
+# Cost of substituting one look-alike for another; any other edit costs 1
+CONFUSION_COST = 0.5
+
+_CANONICAL = {ch: group[0] for group in CONFUSION_CLASSES for ch in group}
+_CANONICAL_TABLE = str.maketrans(_CANONICAL)
+
+Bucket = Union[str, Set[str]]
+
+
+def normalize_plate(vehicle_no: str) -> str:
+    """'gj01 ab-1234' -> 'GJ01AB1234' (whitelist cache and lookup key)."""
+    return vehicle_no.replace(" ", "").replace("-", "").upper()
+
+
+def canonical_key(vehicle_no: str) -> str:
+    """Normalized plate with look-alike characters collapsed: 'GJ01AB1234' and 'GJO1A81Z34' -> 'GJOIABIZ34'."""
+    return normalize_plate(vehicle_no).translate(_CANONICAL_TABLE)
+
+
+def _deletions(key: str) -> Set[str]:
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+# Buckets hold a plain str until a second member arrives: nearly all keys have one plate,
+# and a set per entry would multiply the index size
+
+def _bucket_add(buckets: Dict[str, Bucket], key: str, value: str) -> None:
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = value
+    elif isinstance(bucket, str):
+        if bucket != value:
+            buckets[key] = {bucket, value}
+    else:
+        bucket.add(value)
+
+
+def _bucket_discard(buckets: Dict[str, Bucket], key: str, value: str) -> None:
+    bucket = buckets.get(key)
+    if bucket is None:
+        return
+    if isinstance(bucket, str):
+        if bucket == value:
+            del buckets[key]
+        return
+    bucket.discard(value)
+    if len(bucket) == 1:
+        buckets[key] = next(iter(bucket))
+
+
+def _bucket_members(buckets: Dict[str, Bucket], key: str) -> Iterable[str]:
+    bucket = buckets.get(key)
+    if bucket is None:
+        return ()
+    return (bucket,) if isinstance(bucket, str) else bucket
+
+
+def plate_distance(a: str, b: str) -> float:
+    """Weighted edit distance between two plates: look-alike substitutions cost CONFUSION_COST."""
+    a, b = normalize_plate(a), normalize_plate(b)
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [float(i)]
+        for j, cb in enumerate(b, 1):
+            if ca == cb:
+                substitution = 0.0
+            elif _CANONICAL.get(ca, ca) == _CANONICAL.get(cb, cb):
+                substitution = CONFUSION_COST
+            else:
+                substitution = 1.0
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + substitution))
+        previous = current
+    return previous[-1]
+
+
+class PlateIndex:
+    """
+    Set of plates searchable by OCR-tolerant similarity.
+    Not thread-safe on its own; callers guard it with the lock of the data it mirrors.
+    """
+
+    def __init__(self, plates: Iterable[str] = ()):
+        self._by_key: Dict[str, Bucket] = {}       # canonical key -> plates
+        self._by_deletion: Dict[str, Bucket] = {}  # key minus one character -> canonical keys
+        self._size = 0
+        for plate in plates:
+            self.add(plate)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, plate: str) -> bool:
+        return plate in _bucket_members(self._by_key, canonical_key(plate))
+
+    def add(self, plate: str) -> None:
+        key = canonical_key(plate)
+        if plate in _bucket_members(self._by_key, key):
+            return
+        if key not in self._by_key:
+            for variant in _deletions(key):
+                _bucket_add(self._by_deletion, variant, key)
+        _bucket_add(self._by_key, key, plate)
+        self._size += 1
+
+    def discard(self, plate: str) -> None:
+        key = canonical_key(plate)
+        if plate not in _bucket_members(self._by_key, key):
+            return
+        _bucket_discard(self._by_key, key, plate)
+        self._size -= 1
+        if key not in self._by_key:
+            for variant in _deletions(key):
+                _bucket_discard(self._by_deletion, variant, key)
+
+    def _candidate_keys(self, key: str, confusions_only: bool) -> Set[str]:
+        keys = {key} if key in self._by_key else set()
+        if confusions_only:
+            return keys
+        keys.update(_bucket_members(self._by_deletion, key))          # stored plate has one extra character
+        for variant in _deletions(key):
+            if variant in self._by_key:                                # read has one extra character
+                keys.add(variant)
+            keys.update(_bucket_members(self._by_deletion, variant))  # one character substituted
+        return keys
+
+    def best_match(self, plate: str, max_cost: float = 1.0,
+                   confusions_only: bool = False) -> Optional[Tuple[str, float]]:
+        """
+        Closest indexed plate as (plate, cost), or None if nothing is within max_cost or
+        two plates are equally close (guessing between them would be worse than no match).
+        confusions_only=True only accepts plates that differ by look-alike characters.
+        """
+        matches = self.matches(plate, max_cost, confusions_only)
+        if not matches or (len(matches) > 1 and matches[1][1] == matches[0][1]):
+            return None
+        return matches[0]
+
+    def matches(self, plate: str, max_cost: float = 1.0,
+                confusions_only: bool = False) -> List[Tuple[str, float]]:
+        """All indexed plates within max_cost, cheapest first (ties by plate)."""
+        found = []
+        for key in self._candidate_keys(canonical_key(plate), confusions_only):
+            for candidate in _bucket_members(self._by_key, key):
+                cost = plate_distance(plate, candidate)
+                if cost <= max_cost:
+                    found.append((candidate, cost))
+        return sorted(found, key=lambda match: (match[1], match[0]))
@@ -2,40 +2,60 @@
 API Routes
 All FastAPI endpoints for vehicle logging system
 """
-from fastapi import APIRouter, HTTPException, Request, Form, UploadFile, File, BackgroundTasks
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi import APIRouter, HTTPException, Request, Form, UploadFile, File, BackgroundTasks, Query, Header
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Awaitable, Callable
 from datetime import datetime
+import hashlib
 import os
 import uuid
 import shutil
 
-from .db_sqlite import (
+from .db_async import (
     create_visit,
+    record_gate_event,
     close_visit,
     update_latest_visit_details_by_vehicle,
-    find_open_visit_by_vehicle,
-    get_all_visits,
+    list_visits,
+    get_vehicle_history,
+    get_visit_report,
+    search_visits,
     get_stats,
+    get_occupancy,
+    find_open_visit_by_vehicle,
     is_regular_user,
-    get_regular_user,
     mark_regular_user,
     get_all_regular_users,
+    get_regular_user_rows,
     delete_regular_user,
+    get_whitelist_cache_stats,
+    get_maintenance_status,
+    run_maintenance_task,
     update_kiosk_visit_details,
-    delete_visit
+    delete_visit,
+    search_staff,
+    get_kiosk_state,
+    get_kiosk_states,
+    acquire_kiosk,
+    release_kiosk,
+    begin_idempotent_request,
+    finish_idempotent_request,
+    abandon_idempotent_request
 )
+from .db_idempotency import MAX_KEY_LENGTH
+from .db_kiosk import DEFAULT_KIOSK, KIOSK_CHECK_S
+from .db_maintenance import TaskBusy
+from .db_sqlite import DEFAULT_GATE
+from .fast_json import dumps
+from .http_cache import conditional_json, get_response_cache_stats
+from .live_events import event_stream, publish, state_stream, wait_for_change
 from .id_ocr import extract_id_details
-from .db_sqlite import search_staff
 from .email_utils import send_visitor_notification
 
 router = APIRouter()
 
-# Global state: tracks if a visitor is currently filling the kiosk form
-KIOSK_LOCKED_VEHICLE = None
-
 # Setup templates
 templates_path = os.path.join(os.path.dirname(__file__), "..", "web", "templates")
 templates = Jinja2Templates(directory=templates_path)
@@ -48,10 +68,24 @@ class NewEntryRequest(BaseModel):
     name: Optional[str] = ""
     phone: Optional[str] = ""
     purpose: Optional[str] = ""
+    kiosk: Optional[str] = None
+    # Gate that read the plate (default SMART_GATE_GATE); repeat reads there are debounced
+    gate: Optional[str] = None
+
+class GateEventRequest(BaseModel):
+    vehicle_no: str
+    image_path: str = ""
+    name: Optional[str] = ""
+    phone: Optional[str] = ""
+    purpose: Optional[str] = ""
+    # Kiosk the visitor is sent to (default SMART_GATE_KIOSK)
+    kiosk: Optional[str] = None
+    gate: Optional[str] = None
 
 class UpdateExitRequest(BaseModel):
     vehicle_no: str
     out_time: Optional[str] = None
+    gate: Optional[str] = None
 
 class UpdateDetailsRequest(BaseModel):
     vehicle_no: str
@@ -71,93 +105,194 @@ class VehicleEntry(BaseModel):
 
 # API Endpoints
 
+async def _idempotent(key: Optional[str], scope: str, request: BaseModel,
+                      run: Callable[[Optional[tuple]], Awaitable[dict]]):
+    """
+    Runs a write endpoint at most once per Idempotency-Key (see db_idempotency): a retry
+    with the same key gets the stored response, marked with an Idempotent-Replayed header.
+    run(once) passes once on to its database write, which stores its outcome with the write.
+    """
+    if not key:
+        return await run(None)
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {MAX_KEY_LENGTH} characters")
+    request_hash = hashlib.sha256(dumps(request.model_dump())).hexdigest()
+    earlier = await begin_idempotent_request(key, scope, request_hash)
+    if earlier is not None:
+        if earlier.get("conflict"):
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if earlier.get("pending"):
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        return JSONResponse(earlier["body"], status_code=earlier["status_code"],
+                            headers={"Idempotent-Replayed": "true"})
+    try:
+        response = await run((key, scope, request_hash))
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await abandon_idempotent_request(key)
+        else:
+            # Client errors (e.g. no open entry) are final, a retry gets the same answer
+            await finish_idempotent_request(key, e.status_code, {"detail": e.detail})
+        raise
+    except BaseException:
+        await abandon_idempotent_request(key)
+        raise
+    await finish_idempotent_request(key, 200, response)
+    return response
+
+
 @router.post("/new-entry")
-async def create_new_entry(entry: NewEntryRequest):
+async def create_new_entry(entry: NewEntryRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Create a new vehicle entry (IN time)
     Called by device when a new vehicle arrives
+    Retries may send the same Idempotency-Key header; a repeat read of the plate at the
+    same gate within the debounce window returns the original entry ("duplicate": true)
     """
-    global KIOSK_LOCKED_VEHICLE
+    return await _idempotent(idempotency_key, "new-entry", entry, lambda once: _create_new_entry(entry, once))
+
+
+async def _create_new_entry(entry: NewEntryRequest, once: Optional[tuple] = None) -> dict:
     try:
         in_time = entry.in_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # Check if vehicle already has an open entry
-        existing_row = find_open_visit_by_vehicle(entry.vehicle_no)
+        # Open-visit check, whitelist lookup and insert happen in one transaction
+        result = await record_gate_event(
+            entry.vehicle_no,
+            entry.image_path,
+            {"visitor_name": entry.name, "phone": entry.phone, "purpose": entry.purpose},
+            toggle=False,
+            gate=entry.gate or DEFAULT_GATE,
+            once=once
+        )
+        visit = result["visit"]
         
-        if existing_row:
+        if result["action"] == "already_inside":
             return {
                 "status": "warning",
-                "message": f"Vehicle {entry.vehicle_no} already has an open entry",
+                "message": f"Vehicle {visit['vehicle_no']} already has an open entry",
+                "fuzzy_match": result["match"],
                 "existing_entry": {
-                    "in_time": existing_row.get("in_time"),
-                    "name": existing_row.get("visitor_name"),
-                    "phone": existing_row.get("phone"),
-                    "purpose": existing_row.get("purpose")
+                    "in_time": visit.get("in_time"),
+                    "name": visit.get("visitor_name"),
+                    "phone": visit.get("phone"),
+                    "purpose": visit.get("purpose")
                 }
             }
         
-        # Check if regular user (worker) to set visitor type
-        worker_info = get_regular_user(entry.vehicle_no)
-        
-        if worker_info:
-            visitor_type = "worker"
-            # Auto-fill name and phone
-            entry.name = entry.name or worker_info.get("user_name", "")
-            entry.phone = entry.phone or worker_info.get("phone", "")
-            entry.purpose = entry.purpose or "Worker Entry"
-            response_status = "worker_entry"
-        else:
-            visitor_type = "visitor"
-            response_status = "new"
-            # LOCK kiosk for this visitor
-            KIOSK_LOCKED_VEHICLE = entry.vehicle_no
-            print(f"[LOCK] Kiosk locked for: {KIOSK_LOCKED_VEHICLE}")
-        
-        # Create new entry
-        create_visit(
-            vehicle_no=entry.vehicle_no,
-            image_path=entry.image_path,
-            visitor_type=visitor_type
+        if result["duplicate"]:
+            in_time = visit["in_time"]
+        return await _entry_response(entry.vehicle_no, visit, in_time, entry.kiosk, result["duplicate"])
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error creating entry: {str(e)}")
+
+
+@router.post("/gate-event")
+async def record_gate_event_endpoint(event: GateEventRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Toggle-style gate event: opens a visit if the vehicle is outside, closes it if inside
+    Called once by the device per plate read (replaces new-entry followed by update-exit)
+    A repeat read of the plate at the same gate within the debounce window doesn't toggle
+    again: it returns the original entry or exit with "duplicate": true
+    """
+    return await _idempotent(idempotency_key, "gate-event", event, lambda once: _record_gate_event(event, once))
+
+
+async def _record_gate_event(event: GateEventRequest, once: Optional[tuple] = None) -> dict:
+    try:
+        result = await record_gate_event(
+            event.vehicle_no,
+            event.image_path,
+            {"visitor_name": event.name, "phone": event.phone, "purpose": event.purpose},
+            gate=event.gate or DEFAULT_GATE,
+            once=once
         )
+        visit = result["visit"]
         
-        # We update the details immediately 
-        if entry.name or entry.phone or entry.purpose:
-            update_latest_visit_details_by_vehicle(
-                entry.vehicle_no,
-                entry.name,
-                entry.phone,
-                entry.purpose
-            )
+        if result["action"] == "exit":
+            # A visitor leaving before filling the form gives up the kiosk
+            await _unlock_kiosk(vehicle_no=visit["vehicle_no"])
+            return {
+                "status": "exit",
+                "message": f"Exit recorded for vehicle {visit['vehicle_no']}",
+                "vehicle_no": visit["vehicle_no"],
+                "in_time": visit.get("in_time"),
+                "out_time": visit.get("out_time"),
+                "visitor_type": visit.get("visitor_type"),
+                # Set when the read was an OCR misread of a plate that was inside
+                "fuzzy_match": result["match"],
+                "duplicate": result["duplicate"]
+            }
         
-        return {
-            "status": response_status,
-            "message": f"New entry created for vehicle {entry.vehicle_no}. Type: {visitor_type}",
-            "vehicle_no": entry.vehicle_no,
-            "in_time": in_time,
-            "visitor_type": visitor_type,
-            "name": entry.name
-        }
+        return await _entry_response(event.vehicle_no, visit, visit["in_time"], event.kiosk, result["duplicate"])
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error creating entry: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error recording gate event: {str(e)}")
+
+
+async def _entry_response(vehicle_no: str, visit: dict, in_time: str, kiosk: Optional[str] = None,
+                          duplicate: bool = False) -> dict:
+    """Builds the new-entry response and queues visitors for the kiosk (a repeat keeps its place)."""
+    visitor_type = visit["visitor_type"]
+    response = {
+        "message": f"New entry created for vehicle {vehicle_no}. Type: {visitor_type}",
+        "vehicle_no": vehicle_no,
+        "in_time": in_time,
+        "visitor_type": visitor_type,
+        "name": visit.get("visitor_name", ""),
+        # True when this read repeated one moments ago; nothing new was recorded
+        "duplicate": duplicate
+    }
+    
+    if visitor_type == "worker":
+        response["status"] = "worker_entry"
+    else:
+        response["status"] = "new"
+        lock = await _lock_kiosk(vehicle_no, kiosk or DEFAULT_KIOSK, visit.get("id"))
+        # 0: the visitor has the kiosk now, otherwise how many are ahead
+        response["kiosk"] = lock["kiosk"]
+        response["kiosk_position"] = lock["position"]
+    
+    return response
+
+
+async def _lock_kiosk(vehicle_no: str, kiosk: str, visit_id: Optional[int] = None) -> dict:
+    """Queues the visitor for the kiosk (locks it if free) and wakes the standby screens."""
+    state = await acquire_kiosk(vehicle_no, kiosk, visit_id)
+    publish("kiosk", state)
+    return state
+
+
+async def _unlock_kiosk(**visitor) -> None:
+    """Releases the visitor's kiosk (see db_kiosk.release_kiosk); the next one waiting takes over."""
+    for kiosk in await release_kiosk(**visitor):
+        publish("kiosk", await get_kiosk_state(kiosk))
 
 
 @router.post("/update-exit")
-async def update_exit_time(exit_data: UpdateExitRequest):
+async def update_exit_time(exit_data: UpdateExitRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Update vehicle exit time (OUT time)
     Called by device when a vehicle exits
+    Retries may send the same Idempotency-Key header; a repeat exit read at the same gate
+    within the debounce window succeeds without changing anything
     """
+    return await _idempotent(idempotency_key, "update-exit", exit_data, lambda once: _update_exit_time(exit_data, once))
+
+
+async def _update_exit_time(exit_data: UpdateExitRequest, once: Optional[tuple] = None) -> dict:
     try:
         out_time = exit_data.out_time or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        success = close_visit(exit_data.vehicle_no)
+        success = await close_visit(exit_data.vehicle_no, exit_data.gate or DEFAULT_GATE, once)
         
         if not success:
             raise HTTPException(
                 status_code=404,
                 detail=f"No open entry found for vehicle {exit_data.vehicle_no}"
             )
+        await _unlock_kiosk(vehicle_no=exit_data.vehicle_no)
         
         return {
             "status": "success",
@@ -179,7 +314,7 @@ async def update_visitor_details(details: UpdateDetailsRequest):
     Called from the visitor form submission
     """
     try:
-        success = update_latest_visit_details_by_vehicle(
+        success = await update_latest_visit_details_by_vehicle(
             details.vehicle_no,
             details.name,
             details.phone,
@@ -205,20 +340,43 @@ async def update_visitor_details(details: UpdateDetailsRequest):
 
 
 @router.get("/vehicles")
-async def get_all_vehicles():
-    """
-    Get all vehicle entries from the system
-    Returns list of all logged vehicles
+async def get_all_vehicles(
+    request: Request,
+    limit: int = Query(500, ge=1, le=1000),
+    before_id: Optional[int] = None,
+    since_version: Optional[int] = None,
+    fields: Optional[str] = None,
+    format: str = Query("objects", pattern="^(objects|rows)$")
+):
     """
-    try:
-        vehicles = get_all_visits(limit=500)
+    Get logged vehicle entries, newest first
+    - before_id: keyset pagination (pass back next_before_id for the next page)
+    - since_version: only entries added/changed after that version, plus deleted_ids and
+      archived_ids (moved to the archive: still history, keep them)
+    - fields: comma-separated column projection, e.g. fields=vehicle_no,status,in_time
+    - format=rows: "columns" once plus one array per entry in "rows" instead of "vehicles"
+      (smaller and encoded straight from the database rows)
+    Sends an ETag; If-None-Match with the current one gets 304
+    """
+    async def build():
+        field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        page = await list_visits(limit, before_id, since_version, field_list, format == "rows")
+        if format == "rows":
+            return {"status": "success", "count": len(page["rows"]), **page}
+        vehicles = page.pop("visits")
         
         return {
             "status": "success",
             "count": len(vehicles),
-            "vehicles": vehicles
+            "vehicles": vehicles,
+            **page
         }
+
+    try:
+        return await conditional_json(request, build)
     
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"[ERROR] /api/vehicles failed: {str(e)}")
         import traceback
@@ -226,19 +384,84 @@ async def get_all_vehicles():
         raise HTTPException(status_code=500, detail=f"Error fetching vehicles: {str(e)}")
 
 
-@router.get("/stats")
-async def get_statistics():
+@router.get("/visits/range")
+async def get_visits_in_range(
+    start: datetime,
+    end: datetime,
+    limit: Optional[int] = Query(None, ge=1, le=100000)
+):
     """
-    Get system statistics
-    Returns counts and analytics about vehicle entries
+    Get entries that came in between start (inclusive) and end (exclusive), oldest first
+    Includes archived months
+    - start/end: ISO date or datetime, e.g. start=2026-01-01&end=2026-02-01
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        visits = await get_visit_report(start, end, limit)
+        
+        return {
+            "status": "success",
+            "start": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": end.strftime("%Y-%m-%d %H:%M:%S"),
+            "count": len(visits),
+            "vehicles": visits
+        }
+    
+    except Exception as e:
+        print(f"[ERROR] /api/visits/range failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching visits: {str(e)}")
+
+
+@router.get("/visits/search")
+async def search_visit_history(
+    q: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = Query(None, pattern="^(inside|exited)$"),
+    limit: int = Query(50, ge=1, le=500),
+    before_id: Optional[int] = None
+):
+    """
+    Search all logged entries, archived months included, by partial plate, visitor name, phone, company or person to meet
+    - q: one or more terms of 3+ characters, all must match
+    - start/end: optional entry time window (ISO date or datetime)
+    - status: optional inside/exited filter
+    - before_id: pagination (pass back next_before_id for the next page)
     """
     try:
-        stats = get_stats()
+        page = await search_visits(q, start, end, status, limit, before_id)
+        vehicles = page.pop("visits")
         
         return {
             "status": "success",
-            "statistics": stats
+            "query": q,
+            "count": len(vehicles),
+            "vehicles": vehicles,
+            **page
+        }
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"[ERROR] /api/visits/search failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching visits: {str(e)}")
+
+
+@router.get("/stats")
+async def get_statistics(request: Request):
+    """
+    Get system statistics
+    Returns counts and analytics about vehicle entries (ETag / 304 like /vehicles)
+    """
+    async def build():
+        return {
+            "status": "success",
+            "statistics": await get_stats()
         }
+
+    try:
+        return await conditional_json(request, build)
     
     except Exception as e:
         print(f"[ERROR] /api/stats failed: {str(e)}")
@@ -247,21 +470,72 @@ async def get_statistics():
         raise HTTPException(status_code=500, detail=f"Error fetching stats: {str(e)}")
 
 
+@router.get("/events")
+async def live_events():
+    """
+    Server-Sent Events stream for the dashboard, replaces polling /vehicles and /stats
+    Events: hello (on connect), visit {action, id, visit}, stats (counters after changes),
+    resync (client fell behind, refetch with since_version)
+    """
+    return StreamingResponse(
+        event_stream(("visit", "stats")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/occupancy")
+async def get_current_occupancy():
+    """
+    Vehicles currently inside, in total and per visitor type
+    Served from the in-memory occupancy index
+    """
+    return {"status": "success", **(await get_occupancy())}
+
+
+@router.get("/cache-stats")
+async def get_cache_statistics():
+    """
+    Hit/miss counters of the in-process caches (for monitoring)
+    Counters are per API process (pid), each worker keeps its own
+    """
+    return {"status": "success", "pid": os.getpid(), "whitelist": await get_whitelist_cache_stats(),
+            "responses": await get_response_cache_stats()}
+
+
+@router.get("/maintenance")
+async def maintenance_status():
+    """
+    Database maintenance status: file sizes plus last run, duration and result
+    of each scheduled task (backup, optimize, vacuum, archive, retention)
+    """
+    return {"status": "success", **(await get_maintenance_status())}
+
+
+@router.post("/maintenance/{task}")
+async def run_maintenance(task: str):
+    """
+    Runs one maintenance task now (e.g. a backup before an upgrade)
+    Waits for it to finish and returns its status; 409 while another task is running
+    """
+    if task not in ("backup", "optimize", "vacuum", "archive", "retention"):
+        raise HTTPException(status_code=404, detail=f"Unknown maintenance task: {task}")
+    try:
+        result = await run_maintenance_task(task)
+    except TaskBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not result.get("ok"):
+        raise HTTPException(status_code=500, detail=f"Maintenance task {task} failed: {result.get('error')}")
+    return {"status": "success", "task": task, **result}
+
+
 @router.get("/vehicle/{vehicle_no}")
 async def get_vehicle_by_number(vehicle_no: str):
     """
     Get all entries for a specific vehicle number
     """
     try:
-        from .db_sqlite import get_db_connection
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM visits WHERE vehicle_no = ? ORDER BY in_time DESC', (vehicle_no,))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        vehicle_entries = [dict(row) for row in rows]
+        vehicle_entries = await get_vehicle_history(vehicle_no)
         
         if not vehicle_entries:
             raise HTTPException(
@@ -289,9 +563,10 @@ async def check_vehicle_type(vehicle_no: str):
     Checks if a vehicle is a regular user or visitor
     """
     try:
-        if is_regular_user(vehicle_no):
-            return {"status": "success", "type": "regular"}
-        return {"status": "success", "type": "visitor"}
+        inside = await find_open_visit_by_vehicle(vehicle_no) is not None
+        if await is_regular_user(vehicle_no):
+            return {"status": "success", "type": "regular", "inside": inside}
+        return {"status": "success", "type": "visitor", "inside": inside}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error checking vehicle type: {str(e)}")
 
@@ -306,7 +581,7 @@ async def mark_vehicle_as_regular(info: MarkRegularRequest):
     Whitelists a regular vehicle in the database
     """
     try:
-        success = mark_regular_user(info.vehicle_no, info.name, info.phone, "")
+        success = await mark_regular_user(info.vehicle_no, info.name, info.phone, "")
         if success:
             return {"status": "success", "message": f"{info.vehicle_no} marked as Regular User"}
         raise HTTPException(status_code=500, detail="Failed to mark as regular")
@@ -314,17 +589,23 @@ async def mark_vehicle_as_regular(info: MarkRegularRequest):
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
 @router.get("/workers")
-async def get_workers():
+async def get_workers(request: Request, format: str = Query("objects", pattern="^(objects|rows)$")):
     """
-    Get all regular users (workers)
+    Get all regular users (workers) (ETag / 304 and format=rows like /vehicles)
     """
-    try:
-        workers = get_all_regular_users()
+    async def build():
+        if format == "rows":
+            columns, rows = await get_regular_user_rows()
+            return {"status": "success", "count": len(rows), "columns": columns, "rows": rows}
+        workers = await get_all_regular_users()
         return {
             "status": "success",
             "count": len(workers),
             "workers": workers
         }
+
+    try:
+        return await conditional_json(request, build)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching workers: {str(e)}")
 
@@ -348,7 +629,7 @@ async def add_worker(worker: AddWorkerRequest):
     Add a new worker to the database
     """
     try:
-        success = mark_regular_user(
+        success = await mark_regular_user(
             vehicle_no=worker.vehicle_no, 
             name=worker.name, 
             phone=worker.phone, 
@@ -374,7 +655,7 @@ async def delete_worker(vehicle_no: str):
     Remove a worker from the database
     """
     try:
-        success = delete_regular_user(vehicle_no)
+        success = await delete_regular_user(vehicle_no)
         if success:
             return {"status": "success", "message": f"Worker {vehicle_no} deleted successfully"}
         raise HTTPException(status_code=404, detail=f"Worker with plate {vehicle_no} not found")
@@ -410,7 +691,7 @@ async def submit_visitor_form(
     Handle visitor form submission
     """
     try:
-        success = update_latest_visit_details_by_vehicle(vehicle, name, phone, purpose)
+        success = await update_latest_visit_details_by_vehicle(vehicle, name, phone, purpose)
         
         success_message = "Visitor logged successfully!" if success else "Error updating details"
         
@@ -449,14 +730,14 @@ async def dashboard_page(request: Request):
 # Phase 5: Kiosk Form Routes
 
 @router.get("/kiosk", response_class=HTMLResponse)
-async def kiosk_form_page(request: Request, plate: str = ""):
+async def kiosk_form_page(request: Request, plate: str = "", kiosk: str = ""):
     """
-    Serve the kiosk visitor entry form
+    Serve the kiosk visitor entry form (kiosk: which kiosk this screen is, default SMART_GATE_KIOSK)
     """
     return templates.TemplateResponse(
         request,
         "kiosk.html",
-        {"plate": plate}
+        {"plate": plate, "kiosk": kiosk}
     )
 
 @router.post("/kiosk")
@@ -465,7 +746,6 @@ async def submit_kiosk_form(request: Request):
     Handle visitor form submission from kiosk
     Receives JSON payload with all required fields
     """
-    global KIOSK_LOCKED_VEHICLE
     try:
         data = await request.json()
         vehicle_no = data.get('vehicle_no')
@@ -473,12 +753,10 @@ async def submit_kiosk_form(request: Request):
         if not vehicle_no:
             raise HTTPException(status_code=400, detail="Vehicle number is required")
             
-        success = update_kiosk_visit_details(vehicle_no, data)
+        success = await update_kiosk_visit_details(vehicle_no, data)
         
         if success:
-            # UNLOCK kiosk — camera can resume
-            print(f"[UNLOCK] Kiosk released for: {KIOSK_LOCKED_VEHICLE}")
-            KIOSK_LOCKED_VEHICLE = None
+            await _unlock_kiosk(vehicle_no=vehicle_no)
             
             # --- Phase 7: Email Notification ---
             faculty_email = data.get('person_to_meet_email')
@@ -568,7 +846,7 @@ async def id_card_ocr(request: IDOCRRequest):
 async def staff_search(q: str = ""):
     """Search for faculty/staff members for autocomplete."""
     try:
-        results = search_staff(q)
+        results = await search_staff(q)
         return {"status": "success", "data": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
@@ -582,7 +860,7 @@ async def manual_entry():
         test_plate = f"TEST_{int(time.time()) % 10000}"
         
         # Create the 'inside' record in DB
-        create_visit(
+        await create_visit(
             vehicle_no=test_plate,
             image_path="", # No image for manual
             visitor_type="visitor"
@@ -596,18 +874,42 @@ async def manual_entry():
 # --- Kiosk Status & Cleanup ---
 
 @router.get("/kiosk-status")
-async def get_kiosk_status():
-    """Camera runner polls this to know if form is still being filled."""
-    global KIOSK_LOCKED_VEHICLE
-    if KIOSK_LOCKED_VEHICLE:
-        return {"status": "busy", "vehicle_no": KIOSK_LOCKED_VEHICLE}
-    return {"status": "ready"}
+async def get_kiosk_status(
+    kiosk: str = DEFAULT_KIOSK,
+    wait: float = Query(0, ge=0, le=60),
+    since: Optional[int] = None
+):
+    """
+    Camera runner polls this to know if form is still being filled
+    Returns {kiosk, status: ready|busy, vehicle_no, age_s, expires_in_s, queue, version}
+    - since + wait: long-poll, answers as soon as the version moves past since
+      (lock, unlock, expiry, next visitor), or after wait seconds with the unchanged state
+    """
+    if wait and since is not None:
+        return await wait_for_change(lambda: get_kiosk_state(kiosk), "kiosk", since, wait, KIOSK_CHECK_S)
+    return await get_kiosk_state(kiosk)
+
+@router.get("/kiosks")
+async def list_kiosks():
+    """Lock and waiting visitors of every kiosk"""
+    return {"status": "success", "kiosks": await get_kiosk_states()}
+
+@router.get("/kiosk-events")
+async def kiosk_events(kiosk: str = DEFAULT_KIOSK):
+    """
+    Server-Sent Events stream for the kiosk standby screen
+    hello carries the current lock, kiosk {status, vehicle_no, age_s, ...} follows every change
+    """
+    return StreamingResponse(
+        state_stream(lambda: get_kiosk_state(kiosk), "kiosk", KIOSK_CHECK_S),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.delete("/delete-visit/{visit_id}")
 async def delete_visit_endpoint(visit_id: int):
     """Delete a visit entry (for cleanup from dashboard)."""
-    global KIOSK_LOCKED_VEHICLE
-    if delete_visit(visit_id):
-        KIOSK_LOCKED_VEHICLE = None  # Also clear any lock
+    if await delete_visit(visit_id):
+        await _unlock_kiosk(visit_id=visit_id)  # Also clear its lock / queue place
         return {"status": "success", "message": "Entry deleted"}
     raise HTTPException(status_code=404, detail="Visit not found")
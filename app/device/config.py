@@ -30,6 +30,7 @@ AZURE_CV_KEY = os.getenv("AZURE_CV_KEY", "")
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 API_NEW_ENTRY = f"{API_BASE_URL}/api/new-entry"
 API_UPDATE_EXIT = f"{API_BASE_URL}/api/update-exit"
+API_GATE_EVENT = f"{API_BASE_URL}/api/gate-event"  # Single call: entry or exit
 API_UPDATE_DETAILS = f"{API_BASE_URL}/api/update-details"
 API_GET_VEHICLES = f"{API_BASE_URL}/api/vehicles"
 API_FORM_URL = f"{API_BASE_URL}/api/form"
@@ -1,8 +1,10 @@
 import cv2
 import os
+import threading
 import time
 import requests
 import platform
+import uuid
 from datetime import datetime
 
 try:
@@ -14,14 +16,75 @@ except (ImportError, ValueError):
 
 IS_WINDOWS = platform.system() == "Windows"
 
+# Longest a single kiosk-status long-poll waits on the backend
+KIOSK_WAIT_S = 30
+# Kiosk this gate sends its visitors to (the backend's default when unset)
+KIOSK_ID = os.getenv("SMART_GATE_KIOSK", "")
+# This gate's name; the backend ignores repeat reads of a plate at one gate for a few seconds
+GATE_ID = os.getenv("SMART_GATE_GATE", "")
+# Attempts per plate read; every attempt carries the same Idempotency-Key, so a retry
+# after a timeout can't record the read twice
+API_ATTEMPTS = 3
+
+# Latest kiosk state, kept current by the watcher thread for the capture loop
+_kiosk = {"ready": True, "version": None}
+_kiosk_watcher = None
+
+def poll_kiosk_status(since=None, wait=0):
+    """
+    One /api/kiosk-status call. With since (a version) and wait, the backend holds the
+    request until the kiosk state changes. Returns the state ({} on an error response).
+    """
+    params = {"since": since, "wait": wait} if since is not None and wait else {}
+    if KIOSK_ID:
+        params["kiosk"] = KIOSK_ID
+    r = requests.get(f"{API_BASE_URL}/api/kiosk-status", params=params, timeout=wait + 5)
+    return r.json() if r.status_code == 200 else {}
+
+def _at_kiosk(state, plate):
+    """True while the plate is using or waiting for the kiosk."""
+    return plate in [state.get("vehicle_no")] + state.get("queue", [])
+
+def _watch_kiosk():
+    while True:
+        try:
+            state = poll_kiosk_status(_kiosk["version"], KIOSK_WAIT_S)
+            ready, version = state.get("status") == "ready", state.get("version")
+        except Exception:
+            # Backend unreachable: treat as busy, like a failed poll always did
+            ready, version = False, None
+        _kiosk.update(ready=ready, version=version)
+        if version is None:
+            time.sleep(2)  # No long-poll possible (backend down or too old): poll like before
+
+def start_kiosk_watcher():
+    """Starts the background thread that long-polls the kiosk state."""
+    global _kiosk_watcher
+    if _kiosk_watcher is None:
+        _kiosk_watcher = threading.Thread(target=_watch_kiosk, name="kiosk-watch", daemon=True)
+        _kiosk_watcher.start()
+
 def check_kiosk_status():
-    """Returns True if system is ready for next vehicle."""
-    try:
-        # Use very short timeout for local polling to avoid stuttering
-        r = requests.get(f"{API_BASE_URL}/api/kiosk-status", timeout=0.5)
-        return r.status_code == 200 and r.json().get("status") == "ready"
-    except:
-        return False
+    """Returns True if system is ready for next vehicle (no network call, see start_kiosk_watcher)."""
+    return _kiosk["ready"]
+
+def wait_for_kiosk_ready(plate):
+    """
+    Blocks until the visitor's form is submitted (or their turn expired); returns the
+    moment the backend releases the plate from the kiosk, even if others are still queued.
+    """
+    version = None
+    while True:
+        try:
+            state = poll_kiosk_status(version, KIOSK_WAIT_S)
+            version = state.get("version")
+            if version is not None and not _at_kiosk(state, plate):
+                _kiosk.update(ready=state.get("status") == "ready", version=version)
+                return
+        except Exception:
+            version = None
+        if version is None:
+            time.sleep(2)
 
 def process_vehicle(plate_number, image_path):
     """Sends detection to backend."""
@@ -31,27 +94,40 @@ def process_vehicle(plate_number, image_path):
 
     print(f"[API] Sending {plate_number} to {API_BASE_URL}...", flush=True)
     payload = {"vehicle_no": plate_number, "image_path": image_path}
+    if KIOSK_ID:
+        payload["kiosk"] = KIOSK_ID
+    if GATE_ID:
+        payload["gate"] = GATE_ID
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
     
     try:
-        resp = requests.post(f"{API_BASE_URL}/api/new-entry", json=payload, timeout=10)
+        # One call: the backend opens or closes the visit atomically
+        for attempt in range(1, API_ATTEMPTS + 1):
+            try:
+                resp = requests.post(f"{API_BASE_URL}/api/gate-event", json=payload, headers=headers, timeout=10)
+                # 409: the first attempt is still being processed, its result comes with the retry
+                if resp.status_code != 409:
+                    break
+            except requests.RequestException as e:
+                if attempt == API_ATTEMPTS:
+                    raise
+                print(f"[RETRY] Backend did not answer ({e}), retrying...", flush=True)
+            time.sleep(attempt)
         data = resp.json()
         
+        if data.get("duplicate"):
+            print(f"[DUPLICATE] {plate_number} was just read, keeping the earlier result", flush=True)
         status = data.get("status")
         if status in ("success", "new", "worker_entry"):
             print(f"[SUCCESS] {data.get('message')}", flush=True)
+            if data.get("kiosk_position"):
+                print(f"[QUEUED] Kiosk busy, {data['kiosk_position']} visitor(s) ahead", flush=True)
             return "handover"
-        elif status == "warning":
-            # Vehicle is already inside, this is likely an EXIT
-            print(f"[UPDATE] {data.get('message')}. Registering EXIT...", flush=True)
-            exit_resp = requests.post(f"{API_BASE_URL}/api/update-exit", json={"vehicle_no": plate_number}, timeout=10)
-            if exit_resp.ok:
-                print(f"[EXIT] Vehicle {plate_number} has exited successfully.", flush=True)
-                return "exit"
-            else:
-                print(f"[ERROR] Failed to update exit: {exit_resp.text}", flush=True)
-                return "fail"
+        elif status == "exit":
+            print(f"[EXIT] Vehicle {plate_number} has exited successfully.", flush=True)
+            return "exit"
         else:
-            print(f"[BACKEND ERROR] {data.get('message')}", flush=True)
+            print(f"[BACKEND ERROR] {data.get('message') or data.get('detail')}", flush=True)
             return "fail"
     except Exception as e:
         print(f"[CONNECTION ERROR] Could not reach backend: {e}", flush=True)
@@ -79,6 +155,7 @@ def run_device_workflow():
     print("="*60)
     print(f"[INFO] Camera Index: {DEFAULT_CAMERA_INDEX}")
     print(f"[INFO] Press '{CAPTURE_KEY}' to capture, '{QUIT_KEY}' to quit.\n", flush=True)
+    start_kiosk_watcher()
 
     while True:
         cap = open_camera(DEFAULT_CAMERA_INDEX)
@@ -91,21 +168,12 @@ def run_device_workflow():
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
         print("[READY] Camera feed active. Waiting for captures...\n", flush=True)
         
-        last_kiosk_check = 0
-        kiosk_ready = True
-
         while True:
             ret, frame = cap.read()
             if not ret:
                 print("[ERROR] Lost camera feed.", flush=True)
                 break
 
-            # Update kiosk status every 2 seconds without blocking too much
-            # (Note: requests is still sync, but doing it here keeps the 'c' press instant)
-            if time.time() - last_kiosk_check > 2:
-                kiosk_ready = check_kiosk_status()
-                last_kiosk_check = time.time()
-
             cv2.imshow("Smart Gate - Camera Feed", frame)
             key = cv2.waitKey(1) & 0xFF
             
@@ -115,10 +183,9 @@ def run_device_workflow():
                 return
                 
             if key == ord(CAPTURE_KEY):
-                # Use cached status
-                if not kiosk_ready:
-                    print("\n[BUSY] Complete the current visitor form first!", flush=True)
-                    continue
+                # Status kept current by the long-poll watcher thread; a busy kiosk queues the visitor
+                if not check_kiosk_status():
+                    print("\n[BUSY] Kiosk in use, the next visitor will be queued for it", flush=True)
 
                 print("\n[CAPTURE] Starting 3 second countdown...", flush=True)
                 countdown_start = time.time()
@@ -174,10 +241,7 @@ def run_device_workflow():
                             cv2.destroyAllWindows()
                             
                             print("[WAITING] Camera paused until form is submitted...", flush=True)
-                            while True:
-                                if check_kiosk_status():
-                                    break
-                                time.sleep(2)
+                            wait_for_kiosk_ready(plate_number)
                             
                             print("[READY] Form done! Re-acquiring camera...\n", flush=True)
                             time.sleep(1)
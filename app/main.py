@@ -2,19 +2,47 @@
 FastAPI Main Entry Point
 Initializes the FastAPI application and includes all API routes
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from app.api.routes import router as api_router
+from app.api.db_async import shutdown_db_executor
+from app.api.db_sqlite import init_db, load_occupancy
+from app.api.db_writer import stop_write_queue
+from app.api.db_maintenance import start_maintenance, stop_maintenance
+from app.api.fast_json import FastJSONResponse
+from app.api.http_cache import COMPRESS_MIN_BYTES, GZIP_LEVEL
 import os
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup / shutdown hooks"""
+    # Pending schema migrations (a no-op when the server master already applied them)
+    init_db()
+    print(f"[DB] Occupancy index loaded: {load_occupancy()} vehicles inside")
+    # Backups, ANALYZE and incremental vacuum in the background
+    start_maintenance()
+    yield
+    stop_maintenance()
+    # Commit any queued writes, then stop the database worker threads
+    stop_write_queue()
+    shutdown_db_executor()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Hybrid Logging System API",
     description="Vehicle logging system with ANPR and visitor management",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# gzip for the remaining large responses (searches, reports); the polled list endpoints
+# arrive already compressed from http_cache, and event streams are never compressed
+app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_BYTES, compresslevel=GZIP_LEVEL)
+
 # Mount static files
 static_path = os.path.join(os.path.dirname(__file__), "web", "static")
 app.mount("/static", StaticFiles(directory=static_path), name="static")
@@ -42,4 +70,9 @@ async def root():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # SMART_GATE_WORKERS > 1: several processes (production; gunicorn.conf.py is the
+    # supervised equivalent), otherwise one process that reloads on code changes
+    workers = int(os.getenv("SMART_GATE_WORKERS", "1"))
+    # Migrate once here, so the workers start on an up-to-date schema
+    init_db()
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=workers == 1, workers=workers)
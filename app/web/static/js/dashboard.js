@@ -3,13 +3,18 @@
  * Includes: Vehicle monitoring, stats, worker management, and detail modals.
  */
 const API_BASE = '/api';
+const VISIT_LIMIT = 500;
 let allVehicles = [];
 let allWorkers = []; // For the workers tab
+let visitsVersion = null; // Change version of allVehicles; null = full reload needed
+let shownVehicles = []; // Rows currently in the table (all, filtered or search results)
+let activeSearch = '';
+let searchTimer = null;
+let pollTimer = null; // Only runs while the live event stream is down
 
 document.addEventListener('DOMContentLoaded', () => {
     initializeTheme();
-    loadDashboard();
-    setInterval(loadDashboard, 5000); // Auto refresh every 5s
+    connectLiveUpdates();
 });
 
 function initializeTheme() {
@@ -25,22 +30,25 @@ function toggleTheme() {
 
 async function loadDashboard() {
     try {
-        const vResp = await fetch(`${API_BASE}/vehicles?t=${new Date().getTime()}`);
+        // First load fetches the newest page, later polls only what changed since
+        const url = visitsVersion === null
+            ? `${API_BASE}/vehicles?limit=${VISIT_LIMIT}&format=rows`
+            : `${API_BASE}/vehicles?limit=${VISIT_LIMIT}&format=rows&since_version=${visitsVersion}`;
+        // no-cache: revalidate with the ETag, an unchanged page comes back as a bodiless 304
+        const vResp = await fetch(url, { cache: 'no-cache' });
         if (!vResp.ok) throw new Error(`HTTP Error: ${vResp.status}`);
         const vData = await vResp.json();
         
         if (vData.status === 'success') {
-            allVehicles = vData.vehicles;
-            updateVehiclesTable(allVehicles);
-            
-            // Check for new visitor
-            if (allVehicles.length > 0) {
-                const latest = allVehicles[0];
-                const isNew = !latest.visitor_name || latest.visitor_name === "" || latest.visitor_name.toLowerCase() === "pending";
-                // Only show alert for pending visitors currently 'inside'
-                if (isNew && latest.status === 'inside') showVisitorAlert(latest.vehicle_no);
-                else hideVisitorAlert();
-            }
+            vData.vehicles = fromRows(vData.columns, vData.rows);
+            const isDelta = visitsVersion !== null;
+            const changed = !isDelta || vData.count > 0 || (vData.deleted_ids || []).length > 0;
+            allVehicles = isDelta ? mergeVisits(allVehicles, vData) : vData.vehicles;
+            // Too many changes for one delta: start over with a full page next time
+            visitsVersion = vData.has_more ? null : vData.version;
+            // Leave search results alone while the user is searching
+            if (changed && !activeSearch) updateVehiclesTable(allVehicles);
+            updateVisitorAlert();
         }
 
         const sResp = await fetch(`${API_BASE}/stats`);
@@ -59,6 +67,71 @@ async function loadDashboard() {
     }
 }
 
+// format=rows responses send the column names once and one array per row
+function fromRows(columns, rows) {
+    return rows.map(row => {
+        const obj = {};
+        columns.forEach((col, i) => { obj[col] = row[i]; });
+        return obj;
+    });
+}
+
+// --- Live Updates ---
+// The server pushes visit changes and counters over SSE; the 5s poll is only a fallback
+function connectLiveUpdates() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    const source = new EventSource(`${API_BASE}/events`);
+    source.addEventListener('hello', () => {
+        stopPolling();
+        loadDashboard(); // Catch up on whatever changed before (or while not) connected
+    });
+    source.addEventListener('visit', e => applyVisitEvent(JSON.parse(e.data)));
+    source.addEventListener('stats', e => updateStatistics(JSON.parse(e.data)));
+    source.addEventListener('resync', () => loadDashboard());
+    // EventSource reconnects by itself; poll until its next 'hello'
+    source.onerror = () => startPolling();
+}
+
+function startPolling() {
+    if (pollTimer) return;
+    loadDashboard();
+    pollTimer = setInterval(loadDashboard, 5000);
+}
+
+function stopPolling() {
+    clearInterval(pollTimer);
+    pollTimer = null;
+}
+
+function applyVisitEvent(event) {
+    allVehicles = mergeVisits(allVehicles, {
+        vehicles: event.visit ? [event.visit] : [],
+        deleted_ids: event.action === 'deleted' ? [event.id] : []
+    });
+    if (!activeSearch) updateVehiclesTable(allVehicles);
+    updateVisitorAlert();
+    document.getElementById('last-updated').textContent = new Date().toLocaleTimeString('en-IN');
+}
+
+function updateVisitorAlert() {
+    if (allVehicles.length === 0) return;
+    const latest = allVehicles[0];
+    const isNew = !latest.visitor_name || latest.visitor_name === "" || latest.visitor_name.toLowerCase() === "pending";
+    // Only show alert for pending visitors currently 'inside'
+    if (isNew && latest.status === 'inside') showVisitorAlert(latest.vehicle_no);
+    else hideVisitorAlert();
+}
+
+function mergeVisits(current, delta) {
+    const byId = new Map(current.map(v => [v.id, v]));
+    (delta.deleted_ids || []).forEach(id => byId.delete(id));
+    delta.vehicles.forEach(v => byId.set(v.id, v));
+    return Array.from(byId.values()).sort((a, b) => b.id - a.id).slice(0, VISIT_LIMIT);
+}
+
 function updateStatistics(stats) {
     if (!document.getElementById('total-entries')) return;
     document.getElementById('total-entries').textContent = stats.total_entries || 0;
@@ -79,6 +152,7 @@ function updateVehiclesTable(vehicles) {
         return;
     }
 
+    shownVehicles = vehicles;
     tbody.innerHTML = vehicles.map((v, i) => `
         <tr onclick="openVisitorDetail(${i})" class="clickable-row">
             <td><strong>${v.vehicle_no}</strong></td>
@@ -105,7 +179,7 @@ async function deleteVisit(visitId, event) {
         const resp = await fetch(`${API_BASE}/delete-visit/${visitId}`, { method: 'DELETE' });
         const data = await resp.json();
         if (data.status === 'success') {
-            loadDashboard(); // Force refresh
+            if (pollTimer) loadDashboard(); // Otherwise the delete arrives as a live event
         } else {
             alert('Failed to delete: ' + (data.detail || data.message));
         }
@@ -129,7 +203,7 @@ function switchTab(tabId) {
 
 // --- Visitor Detail Modal ---
 function openVisitorDetail(index) {
-    const v = allVehicles[index];
+    const v = shownVehicles[index];
     if (!v) return;
 
     // Vehicle Info
@@ -199,10 +273,10 @@ function updateDetailImage(elId, path) {
 // --- Worker Management ---
 async function loadWorkers() {
     try {
-        const resp = await fetch(`${API_BASE}/workers`);
+        const resp = await fetch(`${API_BASE}/workers?format=rows`);
         const data = await resp.json();
         if (data.status === 'success') {
-            allWorkers = data.workers;
+            allWorkers = fromRows(data.columns, data.rows);
             const tbody = document.getElementById('workers-tbody');
             if (!tbody) return;
             
@@ -260,12 +334,35 @@ async function deleteWorker(vehicleNo) {
 
 // --- Search / Filter ---
 function filterTable() {
-    const query = document.querySelector('.search-input').value.toLowerCase();
-    const filtered = allVehicles.filter(v => 
-        v.vehicle_no.toLowerCase().includes(query) || 
-        (v.visitor_name && v.visitor_name.toLowerCase().includes(query))
-    );
-    updateVehiclesTable(filtered);
+    const query = document.getElementById('search-input').value.trim();
+    activeSearch = query;
+    clearTimeout(searchTimer);
+
+    if (query.length < 3) {
+        // Short queries just filter the rows already loaded
+        const q = query.toLowerCase();
+        const filtered = allVehicles.filter(v => 
+            v.vehicle_no.toLowerCase().includes(q) || 
+            (v.visitor_name && v.visitor_name.toLowerCase().includes(q)) ||
+            (v.phone && v.phone.includes(q))
+        );
+        updateVehiclesTable(filtered);
+        return;
+    }
+    // Longer queries search the whole history on the server (debounced)
+    searchTimer = setTimeout(() => searchVisits(query), 250);
+}
+
+async function searchVisits(query) {
+    try {
+        const resp = await fetch(`${API_BASE}/visits/search?q=${encodeURIComponent(query)}&limit=200`);
+        if (!resp.ok) throw new Error(`HTTP Error: ${resp.status}`);
+        const data = await resp.json();
+        // Ignore responses for a query the user has already changed
+        if (data.status === 'success' && query === activeSearch) updateVehiclesTable(data.vehicles);
+    } catch (e) {
+        console.error("Search failed:", e);
+    }
 }
 
 // --- Export ---
@@ -19,33 +19,62 @@ function updateStandbyTime() {
     }
 }
 
-// --- Polling for Standby Mode ---
-let pollingInterval;
+// --- Standby Mode ---
+// The server pushes a 'kiosk' event the moment a visitor locks the kiosk;
+// polling only runs while that stream is down
+const TRIGGER_WINDOW_S = 60; // Locks older than this are left alone (e.g. after the inactivity reset)
+// Which kiosk this screen is (?kiosk=<id>); empty = the server's default kiosk
+const KIOSK_ID = new URLSearchParams(window.location.search).get('kiosk') || '';
+const KIOSK_QUERY = KIOSK_ID ? `?kiosk=${encodeURIComponent(KIOSK_ID)}` : '';
+let pollingInterval = null;
+let standbySource = null;
+
+function standbyUrl() {
+    return `/api/kiosk${KIOSK_QUERY}`;
+}
+
 function startStandbyPolling() {
     const urlParams = new URLSearchParams(window.location.search);
-    if (urlParams.has('plate')) return;
+    if (urlParams.has('plate') || standbySource || pollingInterval) return;
+
+    if (!window.EventSource) {
+        startFallbackPolling();
+        return;
+    }
+    standbySource = new EventSource(`/api/kiosk-events${KIOSK_QUERY}`);
+    standbySource.addEventListener('hello', e => {
+        stopFallbackPolling();
+        onLock(JSON.parse(e.data)); // A visitor may have arrived while we were connecting
+    });
+    standbySource.addEventListener('kiosk', e => onLock(JSON.parse(e.data)));
+    // EventSource reconnects by itself; poll until its next 'hello'
+    standbySource.onerror = () => startFallbackPolling();
+}
+
+// The visitor at the front of this kiosk's queue gets the form
+function onLock(lock) {
+    if (lock.status === 'busy' && lock.age_s < TRIGGER_WINDOW_S) openKioskForm(lock.vehicle_no);
+}
 
+function openKioskForm(plate) {
+    console.log(`[TRIGGER] New detection: ${plate}`);
+    if (standbySource) standbySource.close();
+    stopFallbackPolling();
+    const kiosk = KIOSK_ID ? `&kiosk=${encodeURIComponent(KIOSK_ID)}` : '';
+    window.location.replace(`/api/kiosk?plate=${encodeURIComponent(plate)}${kiosk}`);
+}
+
+function stopFallbackPolling() {
+    clearInterval(pollingInterval);
+    pollingInterval = null;
+}
+
+function startFallbackPolling() {
+    if (pollingInterval) return;
     pollingInterval = setInterval(async () => {
         try {
-            const response = await fetch('/api/vehicles?t=' + new Date().getTime());
-            const data = await response.json();
-            if (data.status === 'success' && data.vehicles && data.vehicles.length > 0) {
-                const latest = data.vehicles[0];
-                
-                // 1. Check if it's pending
-                const isPending = !latest.visitor_name || latest.visitor_name.trim() === "" || latest.visitor_name.toLowerCase() === "pending";
-                
-                // 2. Check if it's RECENT (within last 60 seconds)
-                const entryTime = new Date(latest.in_time).getTime();
-                const now = new Date().getTime();
-                const isRecent = (now - entryTime) < 60000; // 60 seconds
-
-                if (isPending && isRecent) {
-                    console.log(`[TRIGGER] New detection: ${latest.vehicle_no}`);
-                    clearInterval(pollingInterval);
-                    window.location.replace(`/api/kiosk?plate=${latest.vehicle_no}`);
-                }
-            }
+            const response = await fetch(`/api/kiosk-status${KIOSK_QUERY}`, { cache: 'no-cache' });
+            if (response.ok) onLock(await response.json());
         } catch (err) { console.error("Poll Error:", err); }
     }, 3000);
 }
@@ -205,7 +234,7 @@ function initIDTypeLogic() {
 
 function startInactivityTimer() {
     let t;
-    const r = () => { clearTimeout(t); t = setTimeout(() => { if (window.location.search.includes('plate')) window.location.href='/api/kiosk'; }, 180000); };
+    const r = () => { clearTimeout(t); t = setTimeout(() => { if (window.location.search.includes('plate')) window.location.href = standbyUrl(); }, 180000); };
     ['mousedown', 'mousemove', 'keypress'].forEach(e => document.addEventListener(e, r));
     r();
 }
@@ -223,7 +252,7 @@ document.getElementById('kiosk-form').addEventListener('submit', async function(
         if (resp.ok) {
             document.getElementById('loading-spinner').classList.add('hidden');
             document.getElementById('success-message').classList.remove('hidden');
-            setTimeout(() => { window.location.href = '/api/kiosk'; }, 2000);
+            setTimeout(() => { window.location.href = standbyUrl(); }, 2000);
         } else { overlay.classList.add('hidden'); alert("Save failed"); }
     } catch (err) { overlay.classList.add('hidden'); }
 });
@@ -0,0 +1,46 @@
+"""
+Gunicorn Configuration
+Production server: several uvicorn worker processes behind one gunicorn master.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Every worker shares the SQLite database; state that used to live in one process
+(kiosk locks, occupancy, caches) is either stored there or re-checked against its
+version counters, so any worker can serve any request. Schema migrations run once,
+in the master, before the workers are forked.
+
+Settings (environment):
+    SMART_GATE_WORKERS   worker processes (default: 2 per CPU, at most 8)
+    SMART_GATE_BIND      listen address (default 0.0.0.0:8000)
+"""
+import multiprocessing
+import os
+import sys
+
+# So the master can import the app package for the migration hook
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    # Maintained home of the worker class (uvicorn.workers is deprecated)
+    import uvicorn_worker  # noqa: F401
+    worker_class = "uvicorn_worker.UvicornWorker"
+except ImportError:
+    worker_class = "uvicorn.workers.UvicornWorker"
+
+bind = os.getenv("SMART_GATE_BIND", "0.0.0.0:8000")
+# SQLite takes one writer at a time, so more workers mostly help reads and request parsing
+workers = int(os.getenv("SMART_GATE_WORKERS", min(2 * multiprocessing.cpu_count(), 8)))
+# Open event streams are ended on SIGTERM, so a graceful stop is quick
+graceful_timeout = 10
+# Long-polls (kiosk-status?wait=) hold a request up to 30 s; the master only kills stuck workers
+timeout = 60
+keepalive = 5
+accesslog = None
+errorlog = "-"
+
+
+def on_starting(server):
+    """Migrates the schema once, before any worker starts."""
+    from app.api.db_sqlite import init_db
+    version = init_db()
+    server.log.info(f"[DB] Schema at v{version}, starting {server.cfg.workers} {worker_class} workers")
@@ -10,10 +10,11 @@ import os
 # Add the project root to the python path so we can import the app modules
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
-from app.api.db_sqlite import mark_regular_user, get_all_regular_users
+from app.api.db_sqlite import init_db, mark_regular_user, get_all_regular_users
 
 def add_test_data():
     print("--- Adding Test Workers to Whitelist ---")
+    init_db()
     
     # List of dummy workers (you can change these to match test images you have)
     test_workers = [
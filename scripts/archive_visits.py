@@ -0,0 +1,34 @@
+"""
+Visit Archiver
+Moves exited visits older than the hot window from data/smart_gate.db into monthly
+archive files (data/archive/visits_YYYY_MM.db). Safe to run repeatedly, e.g. nightly:
+    python scripts/archive_visits.py [--days 90]
+"""
+import argparse
+import os
+import sys
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api.db_archive import HOT_WINDOW_DAYS, archive_old_visits, get_archive_partitions
+from app.api.db_sqlite import init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old exited visits into monthly partitions")
+    parser.add_argument("--days", type=int, default=HOT_WINDOW_DAYS,
+                        help=f"keep visits from the last N days in the live table (default {HOT_WINDOW_DAYS})")
+    args = parser.parse_args()
+
+    init_db()
+    print(f"--- Archiving exited visits older than {args.days} days ---")
+    result = archive_old_visits(args.days)
+    print(f"Archived {result['archived']} visits into {len(result['partitions'])} partition(s)\n")
+
+    for partition in get_archive_partitions():
+        print(f"{partition['partition']}  {partition['row_count']:>8} visits  (last run {partition['archived_at']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Database Backup
+Takes a consistent online copy of data/smart_gate.db through the sqlite3 backup API
+(safe while the server is writing, unlike copying the file) and keeps the newest few.
+    python scripts/backup_db.py [--dir data/backups]
+"""
+import argparse
+import os
+import sys
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api.db_maintenance import BACKUP_DIR, BACKUP_KEEP, backup_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backup of the Smart Gate database")
+    parser.add_argument("--dir", default=BACKUP_DIR, help=f"backup directory (default {BACKUP_DIR})")
+    args = parser.parse_args()
+
+    result = backup_database(args.dir)
+    print(f"[OK] Backup written: {result['path']} ({result['bytes'] / 1024:.0f} KB)")
+    print(f"     Keeping the newest {BACKUP_KEEP} backups in {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Connection Benchmark
+Compares the old "open a connection per call, rollback journal" access pattern
+with the pooled WAL connections used by app/api/db_sqlite.py.
+
+Runs against a throwaway database, never data/smart_gate.db:
+    python scripts/bench_db_connections.py [--ops 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = tempfile.mkdtemp(prefix="smart_gate_bench_")
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(BENCH_DIR, "after.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api import db_sqlite
+
+
+def legacy_connect(path):
+    """The pre-pool get_db_connection(): fresh connection, default journal mode."""
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def legacy_gate_cycle(path, plate):
+    """new-entry + update-details + exit, one connection and commit per call (old behaviour)."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = legacy_connect(path)
+    conn.execute("SELECT * FROM visits WHERE vehicle_no = ? AND status = 'inside' ORDER BY in_time DESC LIMIT 1", (plate,)).fetchone()
+    conn.close()
+
+    conn = legacy_connect(path)
+    conn.execute('SELECT * FROM regular_users WHERE vehicle_no = ?', (plate,)).fetchone()
+    conn.close()
+
+    conn = legacy_connect(path)
+    conn.execute("INSERT INTO visits (vehicle_no, vehicle_image_path, in_time, visitor_type, status) VALUES (?, '', ?, 'visitor', 'inside')", (plate, now))
+    conn.commit()
+    conn.close()
+
+    conn = legacy_connect(path)
+    conn.execute('''UPDATE visits SET visitor_name = ?, phone = ?, purpose = ? WHERE id = (
+        SELECT id FROM visits WHERE vehicle_no = ? AND status = 'inside' ORDER BY in_time DESC LIMIT 1)''',
+        ("Bench", "0000000000", "Benchmark", plate))
+    conn.commit()
+    conn.close()
+
+    conn = legacy_connect(path)
+    conn.execute('''UPDATE visits SET out_time = ?, status = 'exited' WHERE id = (
+        SELECT id FROM visits WHERE vehicle_no = ? AND status = 'inside' ORDER BY in_time DESC LIMIT 1)''',
+        (now, plate))
+    conn.commit()
+    conn.close()
+
+
+def pooled_gate_cycle(plate):
+    """Same sequence through the pooled db_sqlite functions."""
+    db_sqlite.find_open_visit_by_vehicle(plate)
+    db_sqlite.get_regular_user(plate)
+    db_sqlite.create_visit(plate, "", "visitor")
+    db_sqlite.update_latest_visit_details_by_vehicle(plate, "Bench", "0000000000", "Benchmark")
+    db_sqlite.close_visit(plate)
+
+
+def run(label, cycles, fn):
+    start = time.perf_counter()
+    for i in range(cycles):
+        fn(f"BENCH{i:06d}")
+    elapsed = time.perf_counter() - start
+    ops = cycles * 5
+    print(f"{label:<32} {ops:>7} ops  {elapsed:8.3f}s  {ops / elapsed:10.1f} ops/sec")
+    return ops / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite access patterns")
+    parser.add_argument("--ops", type=int, default=2000, help="gate cycles to run (5 DB calls each)")
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+
+    # Build the legacy database from the same schema, but leave it in rollback-journal mode
+    legacy_path = os.path.join(BENCH_DIR, "before.db")
+    schema = [row[0] for row in db_sqlite.get_thread_connection().execute(
+        "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'")]
+    conn = sqlite3.connect(legacy_path)
+    for statement in schema:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+    print(f"--- SQLite connection benchmark ({args.ops} gate cycles) ---")
+    before = run("before: connect-per-call, DELETE", args.ops, lambda plate: legacy_gate_cycle(legacy_path, plate))
+    after = run("after: pooled, WAL + pragmas", args.ops, pooled_gate_cycle)
+    print(f"Speedup: {after / before:.1f}x")
+    print(f"(scratch databases in {BENCH_DIR})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Group-Commit Benchmark
+Sustained gate events/sec with several gates writing at once: the current path (every
+record_gate_event commits on its own, gates contending for the write lock) versus the
+group-commit queue (one writer thread, one commit per batch).
+
+Runs on a throwaway database:
+    python scripts/bench_group_commit.py [--gates 16] [--seconds 5] [--synchronous NORMAL|FULL]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_bench_"), "bench.db")
+# Synthetic plates are one character apart; keep fuzzy matching from pairing them up
+os.environ["SMART_GATE_FUZZY_MAX_COST"] = "0"
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api import db_sqlite, db_writer
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(label, gates, seconds, synchronous, queued):
+    """Each gate thread records events back to back (entry, then exit, per plate) until time is up."""
+    latencies = [[] for _ in range(gates)]
+    stop = threading.Event()
+
+    def gate(index):
+        db_sqlite.get_thread_connection().execute(f"PRAGMA synchronous = {synchronous}")
+        n = 0
+        while not stop.is_set():
+            plate = f"{label[:1].upper()}G{index:02d}{n // 2:06d}"
+            start = time.perf_counter()
+            if queued:
+                db_writer.submit_write(db_sqlite.record_gate_event, plate).result()
+            else:
+                db_sqlite.record_gate_event(plate)
+            latencies[index].append((time.perf_counter() - start) * 1000)
+            n += 1
+        # Plain close: PRAGMA optimize in close_thread_connection would contend with the other gates
+        db_sqlite.get_thread_connection().close()
+
+    if queued:
+        # The writer thread opens its own connection; match the durability setting
+        db_writer.submit_write(db_sqlite.get_thread_connection().execute,
+                               f"PRAGMA synchronous = {synchronous}").result()
+
+    threads = [threading.Thread(target=gate, args=(i,)) for i in range(gates)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [ms for per_gate in latencies for ms in per_gate]
+    print(f"{label:<26} {len(samples) / elapsed:9.0f} events/s   p50 {percentile(samples, 50):6.2f} ms"
+          f"   p99 {percentile(samples, 99):7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-call commit vs group commit")
+    parser.add_argument("--gates", type=int, default=16, help="concurrent writers (gates / devices)")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--synchronous", choices=["NORMAL", "FULL"], default="NORMAL",
+                        help="NORMAL is the app default; FULL fsyncs every commit")
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+    print(f"--- record_gate_event, {args.gates} gates, {args.seconds:g}s each, synchronous={args.synchronous} ---")
+    run("before: commit per call", args.gates, args.seconds, args.synchronous, queued=False)
+    run("after: group commit", args.gates, args.seconds, args.synchronous, queued=True)
+
+    stats = db_writer.get_write_queue_stats()
+    print(f"\nGroup commit: {stats['calls']} calls in {stats['batches']} batches "
+          f"(avg {stats['avg_batch']}, max {stats['max_batch']})")
+    db_writer.stop_write_queue()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+JSON Response Benchmark
+Serialization time and bytes on the wire for /api/vehicles and /api/workers:
+
+- encode: the old path (dict per row, jsonable_encoder, stdlib json) versus orjson over
+  the same dicts versus orjson over plain row tuples (format=rows), database read included
+- wire:   response size through the app per format and Accept-Encoding (identity, gzip,
+  and br when the brotli module is installed)
+
+Runs the app in-process on a throwaway database (needs httpx):
+    python scripts/bench_json_responses.py [--rows 500] [--workers 200] [--repeat 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_bench_"), "bench.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    import httpx
+except ImportError:
+    print("[ERROR] httpx is required for this benchmark: pip install httpx")
+    sys.exit(1)
+
+from fastapi.encoders import jsonable_encoder
+
+from app.api import db_sqlite, fast_json, http_cache
+from app.main import app
+
+
+def seed(rows, workers):
+    """Wide, kiosk-completed visit rows and a whitelist of workers."""
+    with db_sqlite.bulk_visit_load() as cursor:
+        cursor.executemany('''
+            INSERT INTO visits (vehicle_no, visitor_name, phone, purpose, in_time, out_time,
+                                visitor_type, status, company, remarks, address)
+            VALUES (?, 'Bench Visitor', '9876543210', 'Meeting', ?, ?, 'visitor', 'exited',
+                    'Example Pvt Ltd', 'Seeded by benchmark', '12 Long Street, Some City')
+        ''', [(f"GJ01BN{i:05d}", f"2026-01-01 {i % 24:02d}:{i % 60:02d}:00",
+               f"2026-01-01 {i % 24:02d}:{i % 60:02d}:30") for i in range(rows)])
+    with db_sqlite.db_transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO regular_users (vehicle_no, user_name, flat_no, phone, id_type, id_number,
+                                       address_street, address_city, address_state, created_at)
+            VALUES (?, ?, 'B-204', '9876543210', 'Aadhaar', '1234 5678 9012',
+                    '12 Long Street', 'Some City', 'Gujarat', '2026-01-01 09:00:00')
+        ''', [(f"GJ05WK{i:04d}", f"Worker {i}") for i in range(workers)])
+
+
+def stdlib_body(payload):
+    # What JSONResponse did before: jsonable_encoder, then json.dumps
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def vehicles_payload(rows_format, limit):
+    page = db_sqlite.list_visits(limit, as_rows=rows_format)
+    if rows_format:
+        return {"status": "success", "count": len(page["rows"]), **page}
+    vehicles = page.pop("visits")
+    return {"status": "success", "count": len(vehicles), "vehicles": vehicles, **page}
+
+
+def workers_payload(rows_format):
+    if rows_format:
+        columns, rows = db_sqlite.get_regular_user_rows()
+        return {"status": "success", "count": len(rows), "columns": columns, "rows": rows}
+    workers = db_sqlite.get_all_regular_users()
+    return {"status": "success", "count": len(workers), "workers": workers}
+
+
+def timed(fn, repeat):
+    """Mean and best ms per call."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sum(samples) / len(samples), min(samples)
+
+
+def bench_encode(name, payload_fn, repeat):
+    print(f"\n--- {name}: read + encode, ms per response ({repeat} runs) ---")
+    variants = [
+        ("before: dicts, stdlib json", lambda: stdlib_body(payload_fn(False))),
+        ("orjson, dicts", lambda: fast_json.dumps(payload_fn(False))),
+        ("orjson, row tuples", lambda: fast_json.dumps(payload_fn(True))),
+    ]
+    for label, fn in variants:
+        mean, best = timed(fn, repeat)
+        print(f"{label:<28} mean {mean:7.2f}   best {best:7.2f}   {len(fn()):8d} bytes")
+    body = fast_json.dumps(payload_fn(True))
+    for encoding in http_cache.ENCODINGS:
+        mean, _ = timed(lambda: http_cache.compress(body, encoding), repeat)
+        print(f"{'  + ' + encoding + ' (rows body)':<28} mean {mean:7.2f}")
+
+
+async def bench_wire(paths):
+    encodings = ["identity", *http_cache.ENCODINGS]
+    print(f"\n--- bytes on the wire ({', '.join(encodings)}) ---")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in paths:
+            sizes = []
+            for encoding in encodings:
+                async with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+                    raw = b"".join([chunk async for chunk in response.aiter_raw()])
+                    assert response.headers.get("content-encoding", "identity") == encoding, path
+                sizes.append(f"{encoding} {len(raw):8d}")
+            print(f"{path:<40} " + "   ".join(sizes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding and compression of list responses")
+    parser.add_argument("--rows", type=int, default=500, help="visits seeded (the dashboard reads 500)")
+    parser.add_argument("--workers", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+    seed(args.rows, args.workers)
+    limit = min(args.rows, 1000)
+    print(f"orjson: {'yes' if fast_json.orjson else 'no (stdlib fallback)'}   "
+          f"encodings: {', '.join(http_cache.ENCODINGS)}   compress above {http_cache.COMPRESS_MIN_BYTES} bytes")
+
+    bench_encode(f"/api/vehicles?limit={limit}", lambda rows: vehicles_payload(rows, limit), args.repeat)
+    bench_encode("/api/workers", workers_payload, args.repeat)
+    asyncio.run(bench_wire([f"/api/vehicles?limit={limit}", f"/api/vehicles?limit={limit}&format=rows",
+                            "/api/workers", "/api/workers?format=rows"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Fuzzy Plate Match Benchmark
+Builds a PlateIndex over many Indian-format plates and measures best_match() latency
+and recall for typical OCR misreads (look-alike swaps, one wrong / missing / extra
+character) and for plates that are not indexed at all.
+
+Pure in-memory, no database needed:
+    python scripts/bench_plate_match.py [--plates 100000] [--queries 2000]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api.plate_match import CONFUSION_CLASSES, PlateIndex
+
+STATES = ["GJ", "MH", "KA", "DL", "RJ", "UP", "TN", "MP", "HR", "PB"]
+
+
+def random_plate(rng):
+    return (f"{rng.choice(STATES)}{rng.randint(1, 40):02d}"
+            f"{''.join(rng.choices(string.ascii_uppercase, k=rng.choice((1, 2))))}{rng.randint(1, 9999):04d}")
+
+
+def confusion_misread(rng, plate):
+    positions = [i for i, ch in enumerate(plate) if any(ch in group for group in CONFUSION_CLASSES)]
+    if not positions:
+        return None
+    i = rng.choice(positions)
+    group = next(group for group in CONFUSION_CLASSES if plate[i] in group)
+    return plate[:i] + rng.choice([ch for ch in group if ch != plate[i]]) + plate[i + 1:]
+
+
+def substitution(rng, plate):
+    i = rng.randrange(len(plate))
+    return plate[:i] + rng.choice([ch for ch in string.ascii_uppercase + string.digits if ch != plate[i]]) + plate[i + 1:]
+
+
+def deletion(rng, plate):
+    i = rng.randrange(len(plate))
+    return plate[:i] + plate[i + 1:]
+
+
+def insertion(rng, plate):
+    i = rng.randrange(len(plate) + 1)
+    return plate[:i] + rng.choice(string.ascii_uppercase + string.digits) + plate[i:]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy plate matching")
+    parser.add_argument("--plates", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    plates = list({random_plate(rng) for _ in range(args.plates)})
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = PlateIndex(plates)
+    build_s = time.perf_counter() - start
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    tracemalloc.stop()
+    print(f"--- PlateIndex over {len(index)} plates: built in {build_s:.2f}s, ~{memory_mb:.0f} MB ---")
+
+    for label, misread in (("look-alike swap", confusion_misread), ("one wrong char", substitution),
+                           ("missing char", deletion), ("extra char", insertion), ("not indexed", None)):
+        latencies, correct, answered = [], 0, 0
+        for _ in range(args.queries):
+            if misread is None:
+                truth, query = None, random_plate(rng)
+                if query in index:
+                    continue
+            else:
+                truth = rng.choice(plates)
+                query = misread(rng, truth)
+                if query is None:
+                    continue
+            begin = time.perf_counter()
+            match = index.best_match(query)
+            latencies.append((time.perf_counter() - begin) * 1000)
+            answered += match is not None
+            correct += match is not None and match[0] == truth
+        outcome = (f"matched {answered / len(latencies):6.1%}" if misread is None
+                   else f"correct {correct / len(latencies):6.1%}")
+        print(f"{label:<16} p50 {percentile(latencies, 50):6.3f} ms   p99 {percentile(latencies, 99):6.3f} ms   {outcome}")
+
+
+if __name__ == "__main__":
+    main()
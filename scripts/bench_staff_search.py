@@ -0,0 +1,123 @@
+"""
+Staff Search Benchmark
+Measures /api/staff-search latency for kiosk-style keystroke sequences against a
+large staff directory, comparing the old LIKE '%q%' scan with the FTS5 index.
+
+Runs the app in-process on a throwaway database (needs httpx):
+    python scripts/bench_staff_search.py [--staff 50000] [--rounds 20]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_bench_"), "bench.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+try:
+    import httpx
+except ImportError:
+    print("[ERROR] httpx is required for this benchmark: pip install httpx")
+    sys.exit(1)
+
+from app.api import db_async, db_sqlite
+from app.main import app
+
+FIRST_NAMES = ["Milan", "Rajesh", "Sneha", "Amit", "Priya", "Karan", "Neha", "Vikram", "Anjali", "Rohit",
+               "Pooja", "Suresh", "Kavita", "Arjun", "Meera", "Nikhil", "Divya", "Harsh", "Isha", "Manoj"]
+LAST_NAMES = ["Jani", "Kumar", "Patel", "Shah", "Sharma", "Mehta", "Desai", "Joshi", "Iyer", "Nair",
+              "Reddy", "Gupta", "Singh", "Trivedi", "Bhatt", "Rao", "Verma", "Chopra", "Pandya", "Dave"]
+DEPARTMENTS = ["ICT Department", "Administration", "Human Resources", "Security", "Mechanical Engineering",
+               "Civil Engineering", "Library", "Accounts", "Physics", "Chemistry", "Mathematics", "Hostel Office"]
+
+# What the kiosk sends while someone types (after debounce)
+KEYSTROKES = ["m", "mi", "mil", "mila", "milan", "milan j", "milan ja",
+              "p", "pa", "pat", "pate", "patel",
+              "ic", "ict", "lib", "44", "442",
+              "x", "xa", "xav"]  # no match: the worst case for a scan
+
+
+def legacy_search_staff(query):
+    """The pre-FTS search_staff(): substring LIKE on three columns."""
+    if not query:
+        return []
+    search_term = f"%{query}%"
+    with db_sqlite.db_cursor() as cursor:
+        cursor.execute('''
+            SELECT * FROM staff
+            WHERE name LIKE ? OR department LIKE ? OR emp_code LIKE ?
+            LIMIT 10
+        ''', (search_term, search_term, search_term))
+        return [dict(row) for row in cursor.fetchall()]
+
+
+def seed_staff(count):
+    rng = random.Random(42)
+    with db_sqlite.db_transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO staff (name, emp_code, department, phone, email, room_no, created_at)
+            VALUES (?, ?, ?, '9000000000', '', '', '2026-01-01 00:00:00')
+        ''', [(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", f"E{i:06d}", rng.choice(DEPARTMENTS))
+              for i in range(count)])
+        cursor.execute('ANALYZE')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure_direct(fn, rounds):
+    """Per-call latency of the search function alone, in ms."""
+    latencies = []
+    for _ in range(rounds):
+        for query in KEYSTROKES:
+            start = time.perf_counter()
+            fn(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def measure(client, rounds):
+    latencies = []
+    for _ in range(rounds):
+        for query in KEYSTROKES:
+            start = time.perf_counter()
+            response = await client.get("/api/staff-search", params={"q": query})
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+    return latencies
+
+
+async def main(args):
+    db_sqlite.init_db()
+    seed_staff(args.staff)
+    fts_search_staff = db_sqlite.search_staff
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"--- /api/staff-search latency, {args.staff} staff, {len(KEYSTROKES)} queries x {args.rounds} ---")
+        for label, fn in (("before: LIKE '%q%' scan", legacy_search_staff), ("after: FTS5 prefix index", fts_search_staff)):
+            db_sqlite.search_staff = fn
+            for where, latencies in (("http", await measure(client, args.rounds)),
+                                     ("query", measure_direct(fn, args.rounds))):
+                print(f"{label:<26} {where:<6} p50 {percentile(latencies, 50):7.2f} ms"
+                      f"   p99 {percentile(latencies, 99):7.2f} ms   max {max(latencies):7.2f} ms")
+
+        # Ranking sanity check: name prefix hits come before department hits
+        db_sqlite.search_staff = fts_search_staff
+        top = (await client.get("/api/staff-search", params={"q": "mil"})).json()["data"]
+        print("\nTop results for 'mil':", ", ".join(f"{s['name']} ({s['department']})" for s in top[:5]))
+    db_async.shutdown_db_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /api/staff-search")
+    parser.add_argument("--staff", type=int, default=50000)
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
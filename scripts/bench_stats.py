@@ -0,0 +1,73 @@
+"""
+Statistics Benchmark
+Compares the old full-scan /api/stats queries with the counter-table read on a
+throwaway database of 1M visits:
+    python scripts/bench_stats.py [--rows 1000000] [--reads 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_bench_"), "stats.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api import db_sqlite
+
+
+def legacy_stats(cursor):
+    """The pre-counter get_stats(): four aggregates over the whole visits table."""
+    cursor.execute('SELECT COUNT(*) FROM visits')
+    total = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM visits WHERE status = 'inside'")
+    inside = cursor.fetchone()[0]
+    cursor.execute('SELECT COUNT(DISTINCT vehicle_no) FROM visits')
+    unique = cursor.fetchone()[0]
+    cursor.execute('SELECT visitor_type, COUNT(*) FROM visits GROUP BY visitor_type')
+    types = dict(cursor.fetchall())
+    return {"total_entries": total, "currently_inside": inside, "unique_vehicles": unique,
+            "regular_visits": types.get("regular", 0), "visitor_visits": types.get("visitor", 0)}
+
+
+def timed(label, reads, fn):
+    start = time.perf_counter()
+    for _ in range(reads):
+        result = fn()
+    per_call = (time.perf_counter() - start) / reads * 1000
+    print(f"{label:<34} {per_call:10.3f} ms/call")
+    return result, per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /api/stats computation")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--reads", type=int, default=200)
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+    print(f"Seeding {args.rows} visits (triggers keep the counters current)...")
+    start = time.perf_counter()
+    with db_sqlite.bulk_visit_load() as cursor:
+        cursor.executemany('''
+            INSERT INTO visits (vehicle_no, in_time, out_time, visitor_type, status)
+            VALUES (?, ?, ?, ?, ?)
+        ''', ((f"GJ01AA{i % 20000:05d}", f"2026-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00",
+               "" if i % 200 == 0 else "2026-12-31 23:59:59",
+               ("visitor", "worker", "regular")[i % 3],
+               "inside" if i % 200 == 0 else "exited") for i in range(args.rows)))
+    print(f"Seeded in {time.perf_counter() - start:.1f}s\n")
+
+    legacy_reads = max(1, args.reads // 20)
+    with db_sqlite.db_cursor() as cursor:
+        old, old_ms = timed(f"before: full scans ({legacy_reads} calls)", legacy_reads, lambda: legacy_stats(cursor))
+    new, new_ms = timed(f"after: counter table ({args.reads} calls)", args.reads, db_sqlite.get_stats)
+    _, rebuild_ms = timed("rebuild_stats (reconciliation)", 1, db_sqlite.rebuild_stats)
+
+    print(f"\nSpeedup: {old_ms / new_ms:,.0f}x   results match: {old == new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Worker Scaling Benchmark
+Requests/sec and latency of the production server (gunicorn + uvicorn workers, see
+gunicorn.conf.py) at several worker counts, under a dashboard/device request mix:
+
+- GET  /api/vehicles?limit=50, /api/stats, /api/occupancy, /api/kiosk-status (polled reads)
+- POST /api/gate-event (plate reads toggling a pool of vehicles in and out)
+
+Each worker count gets a fresh server on the same seeded throwaway database; load comes
+from separate client processes so the client side doesn't cap the result. Throughput can
+only scale up to the number of CPUs (shared with the clients), so run it on the target host:
+    python scripts/bench_workers.py [--workers 1,2,4] [--seconds 10] [--clients 64] [--loaders 2]
+
+Falls back to `uvicorn --workers` when gunicorn isn't installed (needs httpx).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_bench_"), "bench.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(ROOT)
+
+try:
+    import httpx
+except ImportError:
+    print("[ERROR] httpx is required for this benchmark: pip install httpx")
+    sys.exit(1)
+
+from app.api import db_sqlite
+
+# (weight, method, path); gate events pick a random plate from PLATES
+MIX = [
+    (4, "GET", "/api/vehicles?limit=50"),
+    (2, "GET", "/api/stats"),
+    (2, "GET", "/api/occupancy"),
+    (2, "GET", "/api/kiosk-status"),
+    (1, "POST", "/api/gate-event"),
+]
+PLATES = [f"GJ05LD{i:04d}" for i in range(300)]
+
+
+def seed_visits(rows):
+    """Fills the scratch database with wide, kiosk-completed visit rows."""
+    with db_sqlite.bulk_visit_load() as cursor:
+        cursor.executemany('''
+            INSERT INTO visits (vehicle_no, visitor_name, phone, purpose, in_time, out_time,
+                                visitor_type, status, company, remarks, address)
+            VALUES (?, 'Bench Visitor', '9876543210', 'Meeting', ?, ?, 'visitor', 'exited',
+                    'Example Pvt Ltd', 'Seeded by benchmark', '12 Long Street, Some City')
+        ''', [(f"GJ01BN{i:05d}", f"2026-01-01 {i % 24:02d}:{i % 60:02d}:00",
+               f"2026-01-01 {i % 24:02d}:{i % 60:02d}:30") for i in range(rows)])
+
+
+def start_server(workers, port, log_path):
+    env = dict(os.environ, SMART_GATE_WORKERS=str(workers), SMART_GATE_BIND=f"127.0.0.1:{port}",
+               SMART_GATE_MAINTENANCE="0",
+               # The bench plates are one character apart; don't let them match each other,
+               # and a plate drawn again within seconds should toggle, not count as a repeat read
+               SMART_GATE_FUZZY_MAX_COST="0", SMART_GATE_DEBOUNCE_S="0")
+    try:
+        import gunicorn  # noqa: F401
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "app.main:app"]
+    except ImportError:
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    log = open(log_path, "ab")
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT), command[2]
+
+
+def wait_ready(base_url, workers, timeout=60):
+    """Waits until every worker has answered (each reports its pid in /api/cache-stats)."""
+    pids = set()
+    deadline = time.time() + timeout
+    # A new connection per probe, or keep-alive would pin every probe to one worker
+    with httpx.Client(base_url=base_url, timeout=5, headers={"Connection": "close"}) as client:
+        while time.time() < deadline:
+            try:
+                pids.add(client.get("/api/cache-stats").json()["pid"])
+            except (httpx.HTTPError, ValueError, KeyError):
+                time.sleep(0.2)
+                continue
+            if len(pids) >= workers:
+                return pids
+    return pids
+
+
+async def _client_loop(client, deadline, latencies, errors, rng):
+    weights = [weight for weight, _, _ in MIX]
+    while time.perf_counter() < deadline:
+        _, method, path = rng.choices(MIX, weights)[0]
+        start = time.perf_counter()
+        try:
+            if method == "POST":
+                response = await client.post(path, json={"vehicle_no": rng.choice(PLATES)})
+            else:
+                response = await client.get(path)
+            if response.status_code >= 400:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def _load(base_url, clients, seconds, seed):
+    latencies, errors = [], []
+    rng = random.Random(seed)
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*[_client_loop(client, deadline, latencies, errors, rng) for _ in range(clients)])
+    return latencies, errors
+
+
+def load_process(args):
+    """One client process: (latencies in ms, errors)."""
+    base_url, clients, seconds, seed = args
+    return asyncio.run(_load(base_url, clients, seconds, seed))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def run(workers, args, log_path):
+    base_url = f"http://127.0.0.1:{args.port}"
+    server, runner = start_server(workers, args.port, log_path)
+    try:
+        pids = wait_ready(base_url, workers)
+        if len(pids) < workers:
+            print(f"[ERROR] Only {len(pids)} of {workers} workers answered, see {log_path}")
+            if not pids:
+                return None
+        # Warm-up: connections, caches and the occupancy index of every worker
+        load_process((base_url, args.clients, 1.0, 0))
+        per_loader = max(1, args.clients // args.loaders)
+        with multiprocessing.Pool(args.loaders) as pool:
+            results = pool.map(load_process, [(base_url, per_loader, args.seconds, seed + 1)
+                                              for seed in range(args.loaders)])
+    finally:
+        server.terminate()
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    latencies = [ms for result in results for ms in result[0]]
+    errors = [error for result in results for error in result[1]]
+    return {"runner": runner, "pids": len(pids), "requests": len(latencies), "errors": len(errors),
+            "rps": len(latencies) / args.seconds, "p50": percentile(latencies, 50), "p99": percentile(latencies, 99)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request throughput against the number of server workers")
+    parser.add_argument("--workers", default="1,2,4", help="comma separated worker counts")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=64, help="concurrent connections in total")
+    parser.add_argument("--loaders", type=int, default=max(1, min(4, os.cpu_count() // 2)),
+                        help="client processes sharing those connections")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8790)
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+    seed_visits(args.rows)
+    db_sqlite.close_thread_connection()
+    log_path = os.path.join(os.path.dirname(db_sqlite.DB_PATH), "server.log")
+    print(f"CPUs: {os.cpu_count()}   clients: {args.clients} over {args.loaders} processes   "
+          f"{args.seconds:.0f} s per run   server log: {log_path}")
+
+    baseline = None
+    print(f"\n{'workers':>7} {'req/s':>9} {'scaling':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}  server")
+    for workers in [int(count) for count in args.workers.split(",")]:
+        result = run(workers, args, log_path)
+        if result is None:
+            continue
+        # Scaling is relative to the first (smallest) worker count
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>9.0f} {result['rps'] / baseline:>7.2f}x {result['p50']:>8.1f} "
+              f"{result['p99']:>8.1f} {result['errors']:>7}  {result['runner']} ({result['pids']} pids answered)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Plate Matching Check
+Asserts that fuzzy matching of gate reads against the vehicles inside only pairs OCR
+look-alikes: a car whose plate is one digit off a car that is inside (GJ01AB0041 next
+to GJ01AB0042) must get its own entry, never close the other car's visit. A look-alike
+misread (GJ01AB0008 read as GJ01AB000B) must still close the right visit, one read at a
+time and inside one write-queue batch (db_writer) alike.
+
+Runs against a throwaway database and exits non-zero on failure, so CI can run it:
+    python scripts/check_plate_matching.py [--plates 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from concurrent.futures import Future
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_plates_"), "plates.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api import db_sqlite, db_writer
+
+
+def read(plate):
+    return db_sqlite.record_gate_event(plate)
+
+
+def read_batch(plates):
+    """Gate reads committed together, like a write-queue batch."""
+    batch = [(db_sqlite.record_gate_event, (plate,), {}, Future()) for plate in plates]
+    db_writer._run_batch(batch)
+    return [future.result() for _, _, _, future in batch]
+
+
+def check(label, failures, ok):
+    print(f"[{'OK' if ok else 'FAIL'}] {label}")
+    return failures + (not ok)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that neighbouring plates never pair up")
+    parser.add_argument("--plates", type=int, default=200)
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+    db_sqlite.load_occupancy()
+    failures = 0
+
+    # Every other plate inside, then its sequential neighbours arrive
+    inside = [f"GJ01AB{i:04d}" for i in range(0, 2 * args.plates, 2)]
+    for plate in inside:
+        read(plate)
+    neighbours = [f"GJ01AB{i:04d}" for i in range(1, 2 * args.plates, 2)]
+    results = [read(plate) for plate in neighbours]
+    paired = [(plate, r["match"]["vehicle_no"]) for plate, r in zip(neighbours, results) if r["match"]]
+    failures = check(f"{len(results)} neighbouring plates each got their own entry",
+                     failures, not paired and all(r["action"] == "entry" for r in results))
+    for read_plate, matched in paired[:5]:
+        print(f"       -> {read_plate} closed the visit of {matched}")
+    failures = check("occupancy counts both cars of every pair",
+                     failures, db_sqlite.get_occupancy()["inside"] == len(inside) + len(results))
+
+    # Same, inside one batch
+    results = read_batch(["MH12CD0100", "MH12CD0101", "MH12CD0102"])
+    failures = check("neighbours within one write batch each got their own entry",
+                     failures, [r["action"] for r in results] == ["entry"] * 3)
+
+    # Look-alike misreads still close the right visit
+    read("KA05MN0008")
+    result = read("KA05MN000B")
+    failures = check("look-alike misread (8 read as B) closes the visit inside",
+                     failures, result["action"] == "exit" and result["visit"]["vehicle_no"] == "KA05MN0008")
+    results = read_batch(["DL03XY5550", "DL03XY555O"])
+    failures = check("look-alike misread within one write batch closes the visit opened before it",
+                     failures, [r["action"] for r in results] == ["entry", "exit"])
+
+    print(f"\n{'All checks passed' if not failures else f'{failures} check(s) failed'} "
+          f"(fuzzy max cost {db_sqlite.FUZZY_MAX_COST})")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
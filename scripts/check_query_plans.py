@@ -0,0 +1,109 @@
+"""
+Query Plan Check
+Asserts via EXPLAIN QUERY PLAN that the hot visit lookups are served by the
+intended indexes (open-visit lookup = covering seek on idx_visits_open, vehicle
+history = ordered seek on idx_visits_vehicle_in_time, date ranges = range scan
+on idx_visits_in_ts, free-text search driven by visits_fts, no temp sorts).
+
+A full table scan of any of them fails the check too, whatever its expectations say.
+
+Runs against a throwaway database seeded with realistic skew and exits 1 if any plan
+regressed (or 2 if a query no longer prepares), so CI can run it as a gate:
+    python scripts/check_query_plans.py [--rows 200000]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+os.environ["SMART_GATE_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="smart_gate_plans_"), "plans.db")
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api import db_sqlite
+
+# (label, sql, params, substrings that must appear, substrings that must not)
+HOT_QUERIES = [
+    ("open visit lookup (close_visit / detail updates)",
+     db_sqlite.OPEN_VISIT_ID_SQL, ("GJ01AA00042",),
+     ["COVERING INDEX idx_visits_open (vehicle_no=? AND status=?)"], ["SCAN", "TEMP B-TREE"]),
+    ("record_gate_event open-visit fetch",
+     f"SELECT * FROM visits WHERE id = ({db_sqlite.OPEN_VISIT_ID_SQL})", ("GJ01AA00042",),
+     ["INTEGER PRIMARY KEY (rowid=?)", "COVERING INDEX idx_visits_open (vehicle_no=? AND status=?)"], ["SCAN", "TEMP B-TREE"]),
+    ("vehicle history (/api/vehicle/{vehicle_no})",
+     "SELECT * FROM visits WHERE vehicle_no = ? ORDER BY in_time DESC", ("GJ01AA00042",),
+     ["INDEX idx_visits_vehicle_in_time (vehicle_no=?)"], ["SCAN", "TEMP B-TREE"]),
+    ("currently inside count (get_stats)",
+     "SELECT COUNT(*) FROM visits WHERE status = 'inside'", (),
+     ["COVERING INDEX idx_visits_open"], ["TEMP B-TREE"]),
+    ("dashboard listing (get_all_visits)",
+     "SELECT * FROM visits ORDER BY in_time DESC LIMIT ?", (500,),
+     ["INDEX idx_visits_in_time"], ["TEMP B-TREE"]),
+    ("date range report (get_visits_between)",
+     "SELECT * FROM visits WHERE in_ts >= ? AND in_ts < ? ORDER BY in_ts", (1767225600000, 1769904000000),
+     ["INDEX idx_visits_in_ts (in_ts>? AND in_ts<?)"], ["SCAN", "TEMP B-TREE"]),
+    ("visit search (search_visits)",
+     "SELECT v.* FROM main.visits_fts JOIN main.visits v ON v.id = visits_fts.rowid "
+     "WHERE visits_fts MATCH ? ORDER BY visits_fts.rowid DESC LIMIT ?", ('"AA0004"', 50),
+     ["VIRTUAL TABLE INDEX", "SEARCH v USING INTEGER PRIMARY KEY (rowid=?)"], ["TEMP B-TREE"]),
+    ("whitelist lookup by plate key (get_regular_user cache miss)",
+     f"SELECT * FROM regular_users WHERE {db_sqlite.PLATE_KEY_SQL} = ? ORDER BY id DESC LIMIT 1", ("GJ01AA00042",),
+     ["INDEX idx_regular_users_plate_key"], ["SCAN regular_users"]),
+]
+
+
+# "SCAN visits" without USING ... INDEX (or an FTS5 VIRTUAL TABLE INDEX) reads every row
+FULL_SCAN = re.compile(r"\bSCAN ([\w.]+)(?![\w.]| USING| VIRTUAL TABLE)")
+
+
+def seed(rows):
+    """~5000 distinct plates, ~1% of visits still open."""
+    with db_sqlite.bulk_visit_load() as cursor:
+        cursor.executemany('''
+            INSERT INTO visits (vehicle_no, in_time, out_time, in_ts, visitor_type, status)
+            VALUES (?, ?, ?, ?, 'visitor', ?)
+        ''', [(f"GJ01AA{i % 5000:05d}",
+               f"2026-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00",
+               "" if i % 100 == 0 else "2026-12-31 23:59:59",
+               1767225600000 + (i % 365) * 86400000 + (i % 86400) * 1000,
+               "inside" if i % 100 == 0 else "exited") for i in range(rows)])
+        cursor.execute('ANALYZE')
+
+
+def plan_of(sql, params):
+    with db_sqlite.db_cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return " | ".join(row["detail"] for row in cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check query plans of hot visit queries")
+    parser.add_argument("--rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    db_sqlite.init_db()
+    seed(args.rows)
+    failures = 0
+    for label, sql, params, required, forbidden in HOT_QUERIES:
+        try:
+            plan = plan_of(sql, params)
+        except sqlite3.Error as e:
+            print(f"[ERROR] {label}: {e}")
+            sys.exit(2)
+        problems = [f"missing {r!r}" for r in required if r not in plan]
+        problems += [f"has {f!r}" for f in forbidden if f in plan]
+        problems += [f"full table scan of {table}" for table in FULL_SCAN.findall(plan)]
+        failures += bool(problems)
+        print(f"[{'FAIL' if problems else 'OK'}] {label}\n       {plan}")
+        for problem in problems:
+            print(f"       -> {problem}")
+
+    print(f"\n{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} plans as expected ({args.rows} visits)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Enable Incremental Auto-Vacuum
+Switches an existing data/smart_gate.db to auto_vacuum=INCREMENTAL, so the maintenance
+scheduler's vacuum task can hand pages freed by deletes back to the filesystem.
+New databases start that way; older files need this one-off full VACUUM, which rewrites
+the whole file and makes writers (gate events) wait until it finishes. Run it in a quiet
+period, ideally with the server stopped, and with free disk space of about the file size:
+    python scripts/enable_incremental_vacuum.py
+"""
+import sys
+import os
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api.db_sqlite import enable_incremental_vacuum, init_db
+
+if __name__ == "__main__":
+    init_db()
+    if not enable_incremental_vacuum():
+        print("[OK] Incremental auto-vacuum was already enabled.")
@@ -8,7 +8,7 @@ import sys
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(BASE_DIR)
 
-from app.api.db_sqlite import get_db_connection, init_db
+from app.api.db_sqlite import bulk_visit_load, init_db, parse_time
 
 CSV_PATH = os.path.join(BASE_DIR, 'data', 'visitors.csv')
 
@@ -23,13 +23,11 @@ def run_migration():
     # Ensure DB and tables exist
     init_db()
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     migrated_count = 0
     error_count = 0
 
-    with open(CSV_PATH, mode='r', newline='', encoding='utf-8') as file:
+    # Import all rows in a single transaction
+    with bulk_visit_load() as cursor, open(CSV_PATH, mode='r', newline='', encoding='utf-8') as file:
         reader = csv.DictReader(file)
         
         for row in reader:
@@ -61,12 +59,13 @@ def run_migration():
                 cursor.execute('''
                     INSERT INTO visits (
                         vehicle_no, visitor_name, phone, purpose, 
-                        in_time, out_time, vehicle_image_path, visitor_type, status
+                        in_time, out_time, in_ts, out_ts, vehicle_image_path, visitor_type, status
                     )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 ''', (
                     vehicle_no, visitor_name, phone, purpose, 
-                    in_time, out_time, image_path, visitor_type, status
+                    in_time, out_time, parse_time(in_time), parse_time(out_time),
+                    image_path, visitor_type, status
                 ))
                 
                 migrated_count += 1
@@ -75,9 +74,6 @@ def run_migration():
                 print(f"Error migrating row {row}: {e}")
                 error_count += 1
 
-    conn.commit()
-    conn.close()
-
     print("\n--- Migration Complete ---")
     print(f"Successfully migrated records: {migrated_count}")
     print(f"Skipped/Errors: {error_count}")
@@ -0,0 +1,42 @@
+"""
+Visit Retention Purge
+Deletes (or anonymizes) exited visits older than the retention period, in the live
+table and the archive partitions, and removes the vehicle / ID card images they
+referenced plus stale unreferenced captures. Safe to run repeatedly, e.g. nightly:
+    python scripts/purge_old_visits.py --days 365 [--anonymize] [--keep-media]
+"""
+import argparse
+import os
+import sys
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api.db_retention import RETENTION_DAYS, RETENTION_MODE, purge_expired_visits
+from app.api.db_sqlite import init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the visit retention period")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS,
+                        help=f"keep visits from the last N days (default {RETENTION_DAYS}, 0 = keep everything)")
+    parser.add_argument("--anonymize", action="store_true", default=RETENTION_MODE == "anonymize",
+                        help="clear personal fields and images instead of deleting the visits")
+    parser.add_argument("--keep-media", action="store_true",
+                        help="don't sweep unreferenced old files from data/captures, photos and id_cards")
+    args = parser.parse_args()
+
+    if args.days <= 0:
+        print("Retention is off (--days 0); nothing to do.")
+        return
+
+    init_db()
+    mode = "anonymize" if args.anonymize else "delete"
+    print(f"--- Retention: {mode} exited visits older than {args.days} days ---")
+    result = purge_expired_visits(args.days, mode, sweep_media=not args.keep_media)
+    print(f"Visits: {result['visits']} live, {result['archived_visits']} archived")
+    print(f"Files removed: {result['files_removed']}, reclaimed {result['reclaimed_bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Rebuild Dashboard Statistics
+Recomputes the trigger-maintained counters (visit_stats, vehicles) from the visits
+table and reports any drift. Safe to run while the server is up.
+    python scripts/rebuild_stats.py
+"""
+import sys
+import os
+
+# Add the project root to the python path so we can import the app modules
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from app.api.db_sqlite import get_stats, init_db, rebuild_stats
+
+def reconcile():
+    print("--- Reconciling dashboard counters ---")
+    init_db()
+    before = get_stats()
+    after = rebuild_stats()
+
+    drift = {key: (before[key], after[key]) for key in after if before.get(key) != after[key]}
+    for key, value in after.items():
+        print(f"{key:<18} {value}")
+
+    if drift:
+        print("\n[FIXED] Counters had drifted:")
+        for key, (old, new) in drift.items():
+            print(f"  {key}: {old} -> {new}")
+    else:
+        print("\n[OK] Counters were already consistent.")
+
+if __name__ == "__main__":
+    reconcile()